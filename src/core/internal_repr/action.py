@@ -1,5 +1,8 @@
 from IPython import embed as shell
 
+def pred_test_range(pred, t0, t1, negated=False):
+    return pred.test_range(t0, t1, negated=negated)
+
 class Action(object):
     """
     An instantiated action stores the following.
@@ -27,18 +30,34 @@ class Action(object):
     def __repr__(self):
         return "%d: %s %s %s"%(self.step_num, self.name, self.active_timesteps, " ".join([p.name for p in self.params]))
 
-    def get_failed_preds(self, active_ts=None):
+    def get_pred_tests(self, active_ts=None):
+        """
+        Returns the (negated, pred, t0, t1) tests of the predicates of the
+        action, restricted to active_ts.
+        """
         if active_ts is None:
             active_ts = self.active_timesteps
-        failed = []
+        tests = []
         for pred_d in self.preds:
             if pred_d['hl_info'] == 'hl_state': continue
-            pred = pred_d['pred']
-            negated = pred_d['negated']
             start, end = pred_d['active_timesteps']
-            for t in range(max(start, active_ts[0]),
-                           min(end, active_ts[1])+1):
-                if not pred.test(t, negated=negated):
+            t0, t1 = max(start, active_ts[0]), min(end, active_ts[1])
+            if t0 > t1: continue
+            tests.append((pred_d['negated'], pred_d['pred'], t0, t1))
+        return tests
+
+    def get_failed_preds(self, active_ts=None, cache=None):
+        """
+        cache is an optional SatisfactionCache used to reuse the results of
+        predicates whose parameters did not change.
+        """
+        test_range = pred_test_range if cache is None else cache.test_range
+        failed = []
+        for negated, pred, t0, t1 in self.get_pred_tests(active_ts):
+            ## all active timesteps of a predicate are tested at once
+            res = test_range(pred, t0, t1, negated=negated)
+            for t, passed in zip(range(t0, t1+1), res):
+                if not passed:
                     failed.append((negated, pred, t))
         return failed
 
@@ -50,13 +69,13 @@ class Action(object):
             if start <= t and end >= t: res.append(pred_d['pred'])
         return res
 
-    def satisfied(self, active_ts=None):
+    def satisfied(self, active_ts=None, cache=None):
         if active_ts is None:
             active_ts = self.active_timesteps
         if self.active_timesteps[0] > active_ts[1] \
             or self.active_timesteps[1] < active_ts[0]:
             return True
-        return len(self.get_failed_preds(active_ts)) == 0
+        return len(self.get_failed_preds(active_ts, cache=cache)) == 0
 
     def first_failed_ts(self):
         start, end = self.active_timesteps
@@ -2,6 +2,7 @@ from IPython import embed as shell
 from errors_exceptions import DomainConfigException
 from core.util_classes.matrix import Vector
 from core.util_classes.openrave_body import OpenRAVEBody
+from core.internal_repr.plan_state import PackedPlanState
 
 import h5py
 import numpy as np
@@ -48,8 +49,25 @@ class Parameter(object):
             return dict
         elif attr_name == '_saved_free_attrs':
             return dict
+        elif attr_name == '_packed_state':
+            return PackedPlanState
         return self._attr_types[attr_name]
 
+    def __setattr__(self, name, value):
+        ## attributes packed into a plan state are written into its buffer
+        state = self.__dict__.get('_packed_state')
+        if state is not None and state.set_attr(self, name, value):
+            return
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        ## a pickled parameter owns its arrays
+        state = self.__dict__.copy()
+        state.pop('_packed_state', None)
+        if '_free_attrs' in state:
+            state['_free_attrs'] = dict(state['_free_attrs'])
+        return state
+
     def get_type(self):
         return self._type
 
@@ -101,6 +119,7 @@ class Object(Parameter):
     def copy(self, new_horizon):
         new = Object()
         for attr_name, v in self.__dict__.items():
+            if attr_name == '_packed_state': continue
             attr_type = self.get_attr_type(attr_name)
             if issubclass(attr_type, Vector):
                 new_value = np.empty((attr_type.dim, new_horizon))
@@ -146,6 +165,7 @@ class Symbol(Parameter):
     def copy(self, new_horizon):
         new = Symbol()
         for k, v in self.__dict__.items():
+            if k == '_packed_state': continue
             if v == 'undefined':
                 attr_type = self.get_attr_type(k)
                 assert issubclass(attr_type, Vector)
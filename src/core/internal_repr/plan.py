@@ -1,5 +1,8 @@
 from IPython import embed as shell
 from action import Action
+from satisfaction_cache import SatisfactionCache
+from plan_state import PackedPlanState
+from collections import OrderedDict
 import numpy as np
 
 class Plan(object):
@@ -23,6 +26,8 @@ class Plan(object):
         self._free_attrs = {}
         self._saved_free_attrs = {}
         self.sampling_trace = []
+        self._satisfaction_cache = SatisfactionCache()
+        self.packed_state = None
         if determine_free:
             self._determine_free_attrs()
 
@@ -51,6 +56,19 @@ class Plan(object):
                     arr[np.isnan(v)] = 1
                     p._free_attrs[k] = arr
 
+    def pack_state(self):
+        """
+        Packs the Vector attributes and free masks of the plan's parameters
+        into one PackedPlanState. Parameters already copied into a common
+        state (PackedPlanState.copy_params) keep it.
+        """
+        states = set([p.__dict__.get('_packed_state') for p in self.params.itervalues()])
+        state = states.pop() if len(states) == 1 else None
+        if state is None or state.params != self.params:
+            state = PackedPlanState(self.params)
+        self.packed_state = state
+        return state
+
     def save_free_attrs(self):
         for p in self.params.itervalues():
             p.save_free_attrs()
@@ -99,33 +117,83 @@ class Plan(object):
         return res
 
     def get_failed_pred(self, active_ts=None):
-        #just return the first one for now
-        t_min = self.horizon+1
-        pred = None
-        negated = False
-        for n, p, t in self.get_failed_preds(active_ts=active_ts):
-            if t < t_min:
-                t_min = t
-                pred = p
-                negated = n
-        return negated, pred, t_min
-
-    def get_failed_preds(self, active_ts=None):
+        """
+        Returns (negated, pred, t) of the earliest failed predicate, ties are
+        broken by the order of the actions and their predicates. Timesteps are
+        scanned in increasing order and the scan stops at the first failure.
+        """
         if active_ts == None:
             active_ts = (0, self.horizon-1)
-        failed = []
+        self._satisfaction_cache.refresh()
+        pred_ds = []
         for a in self.actions:
-            failed.extend(a.get_failed_preds(active_ts))
+            for pred_d in a.preds:
+                if pred_d['hl_info'] == 'hl_state': continue
+                start, end = pred_d['active_timesteps']
+                start, end = max(start, active_ts[0]), min(end, active_ts[1])
+                if start <= end:
+                    pred_ds.append((start, end, pred_d['negated'], pred_d['pred']))
+        if not len(pred_ds):
+            return False, None, self.horizon+1
+        t_start = min(start for start, _, _, _ in pred_ds)
+        t_end = max(end for _, end, _, _ in pred_ds)
+        for t in range(t_start, t_end+1):
+            for start, end, negated, pred in pred_ds:
+                if start <= t <= end and \
+                    not self._satisfaction_cache.test(pred, t, negated=negated):
+                    return negated, pred, t
+        return False, None, self.horizon+1
+
+    def get_failed_preds(self, active_ts=None, env_pool=None):
+        """
+        With an env_pool (see core.util_classes.env_pool), the predicates are
+        tested in parallel on the clones of the pool, each predicate by one
+        worker. The failures are returned in the same order either way.
+        """
+        if active_ts == None:
+            active_ts = (0, self.horizon-1)
+        ## only predicates touching changed values are re-tested
+        self._satisfaction_cache.refresh()
+        if env_pool is None:
+            failed = []
+            for a in self.actions:
+                failed.extend(a.get_failed_preds(active_ts, cache=self._satisfaction_cache))
+            return failed
+        tests = []
+        for a in self.actions:
+            tests.extend(a.get_pred_tests(active_ts))
+        by_pred = OrderedDict()
+        for i, (negated, pred, t0, t1) in enumerate(tests):
+            by_pred.setdefault(pred, []).append(i)
+        def test_pred(inds):
+            return [(i, self._satisfaction_cache.test_range(tests[i][1], tests[i][2], tests[i][3], negated=tests[i][0]))
+                    for i in inds]
+        results = {}
+        for res in env_pool.map(test_pred, by_pred.values()):
+            results.update(res)
+        failed = []
+        for i, (negated, pred, t0, t1) in enumerate(tests):
+            for t, passed in zip(range(t0, t1+1), results[i]):
+                if not passed:
+                    failed.append((negated, pred, t))
         return failed
 
     def satisfied(self, active_ts=None):
         if active_ts == None:
             active_ts = (0, self.horizon-1)
+        self._satisfaction_cache.refresh()
         success = True
         for a in self.actions:
-            success &= a.satisfied(active_ts)
+            success &= a.satisfied(active_ts, cache=self._satisfaction_cache)
         return success
 
+    def invalidate_pred_cache(self, param=None):
+        """
+        Forces predicates of param (or all predicates) to be re-tested, for
+        changes to state the predicates read outside of their attr_inds.
+        """
+        self._satisfaction_cache.invalidate(param)
+
     def get_active_preds(self, t):
         res = []
         for a in self.actions:
@@ -0,0 +1,259 @@
+from core.util_classes.matrix import Vector
+from collections import OrderedDict
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+
+class PackedAttrDict(dict):
+    """
+    _free_attrs dictionary of a packed parameter. Assigning an array of the
+    same shape to a packed entry copies it into the free mask buffer instead of
+    replacing the view.
+    """
+    def __setitem__(self, key, value):
+        if key in self:
+            cur = dict.__getitem__(self, key)
+            if type(value) == np.ndarray and value is not cur and value.shape == cur.shape:
+                cur[...] = value
+                return
+        dict.__setitem__(self, key, value)
+
+class PackedPlanState(object):
+    """
+    Stores every Vector attribute of a set of parameters in one contiguous
+    float64 buffer, and the matching entries of their _free_attrs in one int
+    buffer. The parameter attributes are rebound to views into these buffers,
+    so copying, diffing, serializing and sharing the state of a plan are single
+    buffer operations.
+
+    Assigning an array of the same shape to a packed attribute copies it into
+    the buffer (see Parameter.__setattr__); assigning one of a different shape
+    detaches that attribute from the buffer.
+
+    layout maps (param name, attr) to (offset, shape) in the buffers. It is
+    computed from the parameters unless given, in which case buf and free_buf
+    are required.
+    """
+    def __init__(self, params, buf=None, free_buf=None, layout=None):
+        self.params = params
+        self.generation = 0
+        if layout is None:
+            layout = OrderedDict()
+            offset = 0
+            for name in sorted(params.keys()):
+                param = params[name]
+                for attr in sorted(param.__dict__.keys()):
+                    val = param.__dict__[attr]
+                    if type(val) == np.ndarray and self._is_vector_attr(param, attr):
+                        layout[(name, attr)] = (offset, val.shape)
+                        offset += val.size
+            self.size = offset
+        else:
+            assert buf is not None and free_buf is not None
+            self.size = len(buf)
+        self.layout = layout
+        if buf is None:
+            buf = np.empty((self.size,))
+            free_buf = np.zeros((self.size,), dtype=np.int)
+            self._copy_in(buf, free_buf)
+        self._bind(buf, free_buf)
+
+    @staticmethod
+    def _is_vector_attr(param, attr):
+        try:
+            return issubclass(param.get_attr_type(attr), Vector)
+        except KeyError:
+            return False
+
+    def _copy_in(self, buf, free_buf):
+        for (name, attr), (offset, shape) in self.layout.iteritems():
+            param = self.params[name]
+            n = int(np.prod(shape))
+            buf[offset:offset+n] = getattr(param, attr).flat
+            free = param._free_attrs.get(attr)
+            if type(free) == np.ndarray and free.shape == shape:
+                free_buf[offset:offset+n] = free.flat
+
+    def _bind(self, buf, free_buf):
+        self.buf = buf
+        self.free = free_buf
+        self.generation += 1
+        free_dicts = {}
+        for (name, attr), (offset, shape) in self.layout.iteritems():
+            param = self.params[name]
+            old_state = param.__dict__.get('_packed_state')
+            if old_state is not None and old_state is not self:
+                old_state.generation += 1
+            param.__dict__['_packed_state'] = self
+            n = int(np.prod(shape))
+            param.__dict__[attr] = buf[offset:offset+n].reshape(shape)
+            if name not in free_dicts:
+                free_dicts[name] = PackedAttrDict(param._free_attrs)
+                param.__dict__['_free_attrs'] = free_dicts[name]
+            dict.__setitem__(free_dicts[name], attr, free_buf[offset:offset+n].reshape(shape))
+
+    @staticmethod
+    def copy_params(params, horizon):
+        """
+        Copies the parameters to a new horizon like Object.copy and
+        Symbol.copy, but allocates one buffer for all of the copies. Values
+        past the old horizon and undefined values are NaN. Returns the dict of
+        new parameters and their PackedPlanState.
+        """
+        shapes, new_params = {}, {}
+        for name, param in params.iteritems():
+            new = type(param)()
+            for attr, v in param.__dict__.items():
+                if attr in ['_packed_state', '_free_attrs', '_saved_free_attrs']:
+                    continue
+                attr_type = param.get_attr_type(attr)
+                if issubclass(attr_type, Vector) and (type(v) == np.ndarray or v == 'undefined'):
+                    cols = 1 if param.is_symbol() else horizon
+                    shapes[(name, attr)] = (attr_type.dim, cols)
+                    new.__dict__[attr] = np.empty((attr_type.dim, cols))
+                else:
+                    setattr(new, attr, v)
+            new_params[name] = new
+        state = PackedPlanState(new_params)
+        state.buf[:] = np.NaN
+        for (name, attr), shape in shapes.iteritems():
+            v = params[name].__dict__[attr]
+            if type(v) != np.ndarray:
+                continue
+            cols = min(v.shape[1], shape[1])
+            getattr(new_params[name], attr)[:v.shape[0], :cols] = v[:, :cols]
+        return new_params, state
+
+    def is_bound(self, name, attr):
+        if (name, attr) not in self.layout or name not in self.params:
+            return False
+        param = self.params[name]
+        if param.__dict__.get('_packed_state') is not self:
+            return False
+        val = param.__dict__.get(attr)
+        return type(val) == np.ndarray and val.base is not None and \
+            np.may_share_memory(val, self.buf)
+
+    def set_attr(self, param, attr, value):
+        """
+        Called on assignment to an attribute of a packed parameter. Returns
+        True if the assignment was handled by copying into the buffers.
+        """
+        if attr == '_free_attrs':
+            cur = param.__dict__.get('_free_attrs')
+            if isinstance(cur, PackedAttrDict) and isinstance(value, dict) and value is not cur:
+                for k in cur.keys():
+                    if k not in value:
+                        dict.__delitem__(cur, k)
+                for k, v in value.iteritems():
+                    cur[k] = v
+                return True
+            return False
+        if (param.name, attr) not in self.layout:
+            return False
+        cur = param.__dict__.get(attr)
+        if value is cur:
+            return True
+        offset, shape = self.layout[(param.name, attr)]
+        if type(value) == np.ndarray and value.shape == shape and type(cur) == np.ndarray:
+            cur[...] = value
+            return True
+        ## different shape, this attribute no longer lives in the buffer
+        del self.layout[(param.name, attr)]
+        self.generation += 1
+        return False
+
+    def snapshot(self):
+        return self.buf.copy(), self.free.copy()
+
+    def restore(self, snapshot):
+        buf, free = snapshot
+        self.buf[:] = buf
+        self.free[:] = free
+
+    def copy_from(self, other):
+        """
+        Copies the values and free masks of another state with the same
+        layout.
+        """
+        assert self.layout == other.layout
+        self.buf[:] = other.buf
+        self.free[:] = other.free
+
+    def diff(self, buf):
+        """
+        Compares the values against buf (e.g. from snapshot) and returns a dict
+        from (param name, attr) to the boolean array of changed timesteps, for
+        the changed attributes only.
+        """
+        if type(buf) == tuple:
+            buf = buf[0]
+        changed = (self.buf != buf) & ~(np.isnan(self.buf) & np.isnan(buf))
+        res = {}
+        if not np.any(changed):
+            return res
+        for (name, attr), (offset, shape) in self.layout.iteritems():
+            n = int(np.prod(shape))
+            c = changed[offset:offset+n].reshape(shape)
+            if np.any(c):
+                res[(name, attr)] = np.any(c, axis=0)
+        return res
+
+    def write_to_hdf5(self, group):
+        group.create_dataset('buf', data=self.buf)
+        group.create_dataset('free', data=self.free)
+        keys = self.layout.keys()
+        group.create_dataset('names', data=np.array([k[0] for k in keys], dtype='S64'))
+        group.create_dataset('attrs', data=np.array([k[1] for k in keys], dtype='S64'))
+        group.create_dataset('offsets', data=np.array([self.layout[k][0] for k in keys], dtype=np.int))
+        group.create_dataset('shapes', data=np.array([self.layout[k][1] for k in keys], dtype=np.int).reshape((len(keys), 2)))
+
+    @staticmethod
+    def _read_layout(group):
+        layout = OrderedDict()
+        for name, attr, offset, shape in zip(group['names'][()], group['attrs'][()],
+                                             group['offsets'][()], group['shapes'][()]):
+            layout[(str(name), str(attr))] = (int(offset), tuple(int(d) for d in shape))
+        return layout
+
+    @staticmethod
+    def from_hdf5(group, params):
+        """
+        Returns the state written by write_to_hdf5, with the attributes of
+        params (restored without their packed arrays) bound to views into the
+        buffers read from the file. Entries of parameters not in params are
+        left out of the layout.
+        """
+        layout = PackedPlanState._read_layout(group)
+        for key in layout.keys():
+            if key[0] not in params:
+                del layout[key]
+        return PackedPlanState(params, group['buf'][()], group['free'][()], layout)
+
+    def read_from_hdf5(self, group):
+        """
+        Reads values written by write_to_hdf5 into this state. Entries are
+        matched by (param name, attr).
+        """
+        buf, free = group['buf'][()], group['free'][()]
+        for key, (offset, shape) in PackedPlanState._read_layout(group).iteritems():
+            if key not in self.layout:
+                continue
+            my_offset, my_shape = self.layout[key]
+            n = int(np.prod(shape))
+            assert tuple(shape) == tuple(my_shape)
+            self.buf[my_offset:my_offset+n] = buf[offset:offset+n]
+            self.free[my_offset:my_offset+n] = free[offset:offset+n]
+
+    def share(self):
+        """
+        Moves the buffers into shared memory, so processes forked afterwards
+        see the same plan state. Returns the shared (values, free mask) arrays.
+        """
+        shared_buf = RawArray('d', self.size)
+        shared_free = RawArray('l', self.size)
+        buf = np.frombuffer(shared_buf, dtype=np.float64)
+        free = np.frombuffer(shared_free, dtype=np.int_)
+        buf[:] = self.buf
+        free[:] = self.free
+        self._bind(buf, free)
+        return shared_buf, shared_free
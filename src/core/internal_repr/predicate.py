@@ -1,5 +1,6 @@
 from IPython import embed as shell
 from errors_exceptions import ParamValidationException
+import numpy as np
 
 class Predicate(object):
     """
@@ -29,6 +30,13 @@ class Predicate(object):
             return False
         raise NotImplementedError("Override this.")
 
+    def test_range(self, t0, t1, negated=False):
+        """
+        Returns a boolean array of the test results for timesteps t0 to t1
+        (inclusive). Subclasses may evaluate the timesteps at once.
+        """
+        return np.array([self.test(t, negated=negated) for t in range(t0, t1+1)], dtype=bool)
+
     def resample(self, negated, time, plan):
         return None, None
 
@@ -0,0 +1,204 @@
+import numpy as np
+import threading
+
+## snapshot of an attribute bound to a packed plan state
+PACKED = 'packed'
+
+class SatisfactionCache(object):
+    """
+    Caches predicate test results of a plan across calls to
+    Plan.get_failed_preds.
+
+    The trajectories of every parameter attribute read by a cached predicate
+    (as given by its attr_inds) are snapshotted. refresh compares the current
+    values against the snapshots to find the timesteps that changed for each
+    (param, attr) pair, and drops the cached results of the predicates whose
+    active range covers a changed timestep. This catches both reassignment
+    and in place writes to the trajectories. Attributes packed into a
+    PackedPlanState are compared with one snapshot of its whole buffer
+    (PackedPlanState.diff) instead of per attribute copies.
+
+    Only predicates with attr_inds (ExprPredicates) are cached, every other
+    predicate is tested on each call.
+
+    test and test_range may be called from several threads, as long as each
+    predicate is only tested by one thread at a time (as Plan.get_failed_preds
+    does with an env_pool): the result dictionary of a predicate is then only
+    used by one thread, while the dictionary of predicates, the dependencies
+    and the hit and miss counts are shared and updated under the lock.
+    refresh and invalidate must not run concurrently with tests.
+    """
+    def __init__(self):
+        self._snapshots = {}
+        self._state_snapshots = {}
+        self._deps = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_deps(self, pred):
+        if pred in self._deps:
+            return self._deps[pred]
+        with self._lock:
+            return self._add_deps(pred)
+
+    def _add_deps(self, pred):
+        if pred not in self._deps:
+            attr_inds = getattr(pred, 'attr_inds', None)
+            if attr_inds is None:
+                self._deps[pred] = None
+            else:
+                deps = []
+                for param, attr_list in attr_inds.iteritems():
+                    for attr, _ in attr_list:
+                        deps.append((param, attr))
+                        if (param, attr) not in self._snapshots:
+                            self._snapshots[(param, attr)] = self._snapshot(param, attr)
+                self._deps[pred] = deps
+        return self._deps[pred]
+
+    def _snapshot(self, param, attr):
+        state = self._packed_state(param, attr)
+        if state is None:
+            return self._copy_val(param, attr)
+        if state not in self._state_snapshots:
+            self._state_snapshots[state] = state.buf.copy()
+        return PACKED
+
+    @staticmethod
+    def _packed_state(param, attr):
+        state = param.__dict__.get('_packed_state')
+        if state is not None and state.is_bound(param.name, attr):
+            return state
+        return None
+
+    @staticmethod
+    def _copy_val(param, attr):
+        val = getattr(param, attr)
+        if type(val) == np.ndarray:
+            return val.copy()
+        return None
+
+    def _cacheable(self, pred):
+        deps = self._get_deps(pred)
+        if deps is None:
+            return False
+        return all(self._snapshots[dep] is not None for dep in deps)
+
+    def _changed_timesteps(self, param, attr):
+        """
+        Returns a boolean array of the changed timesteps of param.attr, True
+        if every timestep should be considered changed, or None if nothing
+        changed.
+        """
+        snapshot = self._snapshots[(param, attr)]
+        val = getattr(param, attr)
+        if type(val) != np.ndarray or type(snapshot) != np.ndarray or val.shape != snapshot.shape:
+            self._snapshots[(param, attr)] = self._copy_val(param, attr)
+            return True
+        changed = (val != snapshot) & ~(np.isnan(val) & np.isnan(snapshot))
+        if not np.any(changed):
+            return None
+        self._snapshots[(param, attr)] = val.copy()
+        if param.is_symbol():
+            return True
+        return np.any(changed, axis=0)
+
+    def refresh(self):
+        """
+        Invalidates the cached results that depend on values changed since
+        the last refresh.
+        """
+        dirty = {}
+        packed = {}
+        for param, attr in self._snapshots.keys():
+            state = self._packed_state(param, attr)
+            if state is not None and self._snapshots[(param, attr)] is PACKED and \
+                    state in self._state_snapshots:
+                packed.setdefault(state, []).append((param, attr))
+                continue
+            changed = self._changed_timesteps(param, attr)
+            if changed is not None:
+                dirty[(param, attr)] = changed
+        for state, deps in packed.iteritems():
+            diff = state.diff(self._state_snapshots[state])
+            if not len(diff):
+                continue
+            self._state_snapshots[state] = state.buf.copy()
+            for param, attr in deps:
+                if (param.name, attr) in diff:
+                    dirty[(param, attr)] = True if param.is_symbol() else diff[(param.name, attr)]
+        if not len(dirty):
+            return
+        for pred in self._results.keys():
+            start, end = pred.active_range
+            stale = set()
+            for dep in self._deps[pred]:
+                if dep not in dirty:
+                    continue
+                changed = dirty[dep]
+                if changed is True:
+                    stale = None
+                    break
+                for c in np.nonzero(changed)[0]:
+                    stale.update(range(c - end, c - start + 1))
+            if stale is None:
+                del self._results[pred]
+            elif len(stale):
+                results = self._results[pred]
+                for key in results.keys():
+                    if key[0] in stale:
+                        del results[key]
+
+    def invalidate(self, param=None):
+        """
+        Drops the cached results of every predicate of param, or every cached
+        result if param is None. Needed when a predicate depends on state that
+        is not in its attr_inds.
+        """
+        if param is None:
+            self._results = {}
+            return
+        for pred in self._results.keys():
+            if any(p is param for p, _ in self._deps[pred]):
+                del self._results[pred]
+
+    def _pred_results(self, pred):
+        with self._lock:
+            return self._results.setdefault(pred, {})
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def test(self, pred, t, negated=False):
+        if not self._cacheable(pred):
+            return pred.test(t, negated=negated)
+        results = self._pred_results(pred)
+        if (t, negated) in results:
+            self._count(1, 0)
+            return results[(t, negated)]
+        self._count(0, 1)
+        res = pred.test(t, negated=negated)
+        results[(t, negated)] = res
+        return res
+
+    def test_range(self, pred, t0, t1, negated=False):
+        if not self._cacheable(pred):
+            return pred.test_range(t0, t1, negated=negated)
+        results = self._pred_results(pred)
+        missing = [t for t in range(t0, t1+1) if (t, negated) not in results]
+        self._count(t1 - t0 + 1 - len(missing), len(missing))
+        ## each run of consecutive missing timesteps is tested at once
+        run_start = 0
+        for i in range(1, len(missing)+1):
+            if i < len(missing) and missing[i] == missing[i-1] + 1:
+                continue
+            lo, hi = missing[run_start], missing[i-1]
+            res = pred.test_range(lo, hi, negated=negated)
+            for t, passed in zip(range(lo, hi+1), res):
+                results[(t, negated)] = bool(passed)
+            run_start = i
+        return np.array([results[(t, negated)] for t in range(t0, t1+1)], dtype=bool)
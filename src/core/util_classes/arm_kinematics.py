@@ -0,0 +1,227 @@
+from collections import OrderedDict
+import threading
+import weakref
+import numpy as np
+
+"""
+Pure NumPy kinematic chains of the robot arms. A chain is read once from the
+OpenRAVE robot (the fixed transforms and axes of the joints from the robot
+root to a link), after which link transforms, joint axes and anchors and
+position jacobians are computed for a whole batch of configurations at once,
+without setting the robot in the OpenRAVE environment.
+
+Joint transforms follow the OpenRAVE kinematic hierarchy: the child link of a
+joint is at parent * left * T(axis, value) * right, where T rotates about (or
+translates along) the axis given in the frame parent * left.
+"""
+
+def rotations(axis, angles):
+    """
+    Rotation matrices (N, 3, 3) about the unit axis by the (N,) angles.
+    """
+    x, y, z = axis
+    K = np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+    s = np.sin(angles)[:, None, None]
+    c = np.cos(angles)[:, None, None]
+    return np.eye(3) + s*K + (1 - c)*K.dot(K)
+
+def base_transforms(base_poses):
+    """
+    Transforms (N, 4, 4) of (N, 3) robot base poses [x, y, rot], as set by
+    OpenRAVEBody.set_pose for robots.
+    """
+    base_poses = np.atleast_2d(base_poses)
+    trans = np.tile(np.eye(4), (len(base_poses), 1, 1))
+    trans[:, :3, :3] = rotations([0, 0, 1], base_poses[:, 2])
+    trans[:, :2, 3] = base_poses[:, :2]
+    return trans
+
+class KinematicChain(object):
+    """
+    Joints from the robot root to a link, as (left, right, axis, dof_index,
+    prismatic) tuples. Joints without a degree of freedom have dof_index -1.
+    """
+    def __init__(self, joints):
+        self.joints = [(np.asarray(left, dtype=np.float), np.asarray(right, dtype=np.float),
+                        np.asarray(axis, dtype=np.float), dof, prismatic)
+                       for left, right, axis, dof, prismatic in joints]
+        self.dof_inds = [dof for _, _, _, dof, _ in self.joints if dof >= 0]
+
+    @staticmethod
+    def from_robot(robot, link_name):
+        """
+        Reads the chain from the root of the OpenRAVE robot to link_name.
+        """
+        link = robot.GetLink(link_name)
+        joints = []
+        for joint in robot.GetChain(0, link.GetIndex(), returnjoints=True):
+            has_dof = joint.GetDOF() > 0
+            joints.append((joint.GetInternalHierarchyLeftTransform(),
+                           joint.GetInternalHierarchyRightTransform(),
+                           joint.GetInternalHierarchyAxis(0),
+                           joint.GetDOFIndex() if has_dof else -1,
+                           has_dof and joint.IsPrismatic(0)))
+        return KinematicChain(joints)
+
+    def forward(self, dof_values, base_trans):
+        """
+        Forward kinematics of the (N, D) robot DOF values with (N, 4, 4) root
+        transforms. Returns the (N, 4, 4) link transforms and an OrderedDict
+        from the DOF index of each joint to its (N, 3) world axes and anchors.
+        """
+        dof_values = np.atleast_2d(dof_values)
+        trans = np.array(base_trans, dtype=np.float).reshape((-1, 4, 4))
+        if len(trans) == 1 and len(dof_values) > 1:
+            trans = np.tile(trans, (len(dof_values), 1, 1))
+        frames = OrderedDict()
+        for left, right, axis, dof, prismatic in self.joints:
+            trans = trans.dot(left)
+            if dof >= 0:
+                values = dof_values[:, dof]
+                frames[dof] = (trans[:, :3, :3].dot(axis), trans[:, :3, 3].copy())
+                joint_trans = np.tile(np.eye(4), (len(values), 1, 1))
+                if prismatic:
+                    joint_trans[:, :3, 3] = values[:, None]*axis
+                else:
+                    joint_trans[:, :3, :3] = rotations(axis, values)
+                trans = np.einsum('nij,njk->nik', trans, joint_trans)
+            trans = trans.dot(right)
+        return trans, frames
+
+    @staticmethod
+    def position_jacobian(points, frames, dof_inds):
+        """
+        Jacobians (N, 3, len(dof_inds)) of the (N, 3) points, attached to the
+        end of the chain, with respect to the DOFs dof_inds.
+        """
+        points = np.atleast_2d(points)
+        jac = np.zeros((len(points), 3, len(dof_inds)))
+        for i, ind in enumerate(dof_inds):
+            axes, anchors = frames[ind]
+            jac[:, :, i] = np.cross(axes, points - anchors)
+        return jac
+
+    @staticmethod
+    def rotation_jacobian(dirs, frames, dof_inds):
+        """
+        Jacobians (N, 3, len(dof_inds)) of the (N, 3) directions, attached to
+        the end of the chain, with respect to the revolute DOFs dof_inds.
+        """
+        dirs = np.atleast_2d(dirs)
+        jac = np.zeros((len(dirs), 3, len(dof_inds)))
+        for i, ind in enumerate(dof_inds):
+            jac[:, :, i] = np.cross(frames[ind][0], dirs)
+        return jac
+
+class JointFrame(object):
+    """
+    Axis and anchor of a joint computed by a KinematicChain, with the
+    accessors of an OpenRAVE joint.
+    """
+    def __init__(self, axis, anchor):
+        self.axis = axis
+        self.anchor = anchor
+
+    def GetAxis(self):
+        return self.axis
+
+    def GetAnchor(self):
+        return self.anchor
+
+class _ChainLink(object):
+
+    def __init__(self, robot, name):
+        self._robot = robot
+        self._name = name
+
+    def GetTransform(self):
+        return self._robot.link_transform(self._name)
+
+class ChainRobot(object):
+    """
+    Stand-in for the OpenRAVE robot of a ChainRobotBody. Link transforms
+    and joints are computed by the kinematic chains of the robot, and
+    manipulators (which only depend on the robot model) are read from the
+    OpenRAVE robot. Anything else is an AttributeError rather than a query
+    of the OpenRAVE robot, whose state is not the configuration set here.
+    """
+    def __init__(self, body):
+        self._body = body
+        self._robot = body.robot_body.env_body
+
+    def GetLink(self, name):
+        return _ChainLink(self, name)
+
+    def link_transform(self, name):
+        trans, frames = self._body.forward(name)
+        return trans[0]
+
+    def GetJointFromDOFIndex(self, ind):
+        axis, anchor = self._body.joint_frame(ind)
+        return JointFrame(axis, anchor)
+
+    def GetDOFValues(self):
+        return self._body.dof_values.copy()
+
+    def GetActiveDOFValues(self):
+        return self._body.dof_values.copy()
+
+    def GetTransform(self):
+        return self._body.base_trans.copy()
+
+    def GetManipulator(self, name):
+        return self._robot.GetManipulator(name)
+
+class ChainRobotBody(object):
+    """
+    Stand-in for the OpenRAVEBody of a robot, for the set_robot_poses and
+    get_robot_info functions of the pose predicates. set_pose and set_dof
+    only record the configuration, and env_body answers link and joint
+    queries with the kinematic chains of the robot.
+    """
+    def __init__(self, robot_body):
+        self.robot_body = robot_body
+        self.name = robot_body.name
+        self._geom = robot_body._geom
+        self.dof_values = np.array(robot_body.env_body.GetDOFValues(), dtype=np.float)
+        self.base_trans = np.eye(4)
+        self.env_body = ChainRobot(self)
+        self._forward = {}
+
+    def set_pose(self, base_pose, rotation = [0, 0, 0]):
+        self.base_trans = base_transforms(np.asarray(base_pose, dtype=np.float))[0]
+        self._forward = {}
+
+    def set_dof(self, dof_value_map):
+        for k, v in dof_value_map.iteritems():
+            self.dof_values[self._geom.dof_map[k]] = v
+        self._forward = {}
+
+    def forward(self, link_name):
+        if link_name not in self._forward:
+            chain = get_chain(self.robot_body, link_name)
+            self._forward[link_name] = chain.forward(self.dof_values, self.base_trans)
+        return self._forward[link_name]
+
+    def joint_frame(self, ind):
+        for trans, frames in self._forward.values():
+            if ind in frames:
+                return frames[ind][0][0], frames[ind][1][0]
+        ## the joint is on the chain to its child link
+        joint = self.robot_body.env_body.GetJointFromDOFIndex(ind)
+        trans, frames = self.forward(joint.GetHierarchyChildLink().GetName())
+        return frames[ind][0][0], frames[ind][1][0]
+
+_chains = weakref.WeakKeyDictionary()
+_chains_lock = threading.Lock()
+
+def get_chain(robot_body, link_name):
+    """
+    Returns the KinematicChain of robot_body to link_name, read from the
+    OpenRAVE robot the first time it is asked for.
+    """
+    with _chains_lock:
+        chains = _chains.setdefault(robot_body, {})
+        if link_name not in chains:
+            chains[link_name] = KinematicChain.from_robot(robot_body.env_body, link_name)
+        return chains[link_name]
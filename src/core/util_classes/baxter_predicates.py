@@ -311,33 +311,6 @@ class BaxterEEReachable(robot_predicates.EEReachable):
         else:
             return rel_step*np.array([0, 0, const.RETREAT_DIST])
 
-    def stacked_f(self, x):
-        i = 0
-        f_res = []
-        start, end = self.active_range
-        for s in range(start, end+1):
-            rel_pt = self.get_rel_pt(s)
-            f_res.append(self.ee_pose_check_rel_obj(x[i:i+self.attr_dim], rel_pt)[0])
-            i += self.attr_dim
-        return np.vstack(tuple(f_res))
-
-
-    def stacked_grad(self, x):
-        f_grad = []
-        start, end = self.active_range
-        t = (2*self._steps+1)
-        k = 3
-
-        grad = np.zeros((k*t, self.attr_dim*t))
-        i = 0
-        j = 0
-        for s in range(start, end+1):
-            rel_pt = self.get_rel_pt(s)
-            grad[j:j+k, i:i+self.attr_dim] = self.ee_pose_check_rel_obj(x[i:i+self.attr_dim], rel_pt)[1]
-            i += self.attr_dim
-            j += k
-        return grad
-
 class BaxterEEReachablePos(BaxterEEReachable):
 
     # EEUnreachable Robot, StartPose, EEPose
@@ -375,6 +348,18 @@ class BaxterEEReachablePos(BaxterEEReachable):
 
         return (dist_val, dist_jac)
 
+    def stack_ee_jac(self, robot_pos, arm_jac, obj_jac):
+        """
+            Batched jacobians (n, 3, 23) of pos_error_rel_to_obj for the
+            (n, 3) gripper positions, joint and object jacobians
+        """
+        n = len(robot_pos)
+        dist_jac = np.zeros((n, 3, self.attr_dim))
+        dist_jac[:, :, 8:15] = arm_jac
+        dist_jac[:, :, 16] = np.cross([0, 0, 1], robot_pos)
+        dist_jac[:, :, 17:23] = obj_jac
+        return dist_jac
+
 class BaxterEEReachableRot(BaxterEEReachable):
 
     # EEUnreachable Robot, StartPose, EEPose
@@ -467,11 +452,11 @@ class BaxterObstructs(robot_predicates.Obstructs):
     def set_active_dof_inds(self, robot_body, reset = False):
         robot = robot_body.env_body
         if reset == True and self.dof_cache != None:
-            robot.SetActiveDOFs(self.dof_cache)
+            robot_body.set_active_dofs(self.dof_cache)
             self.dof_cache = None
         elif reset == False and self.dof_cache == None:
             self.dof_cache = robot.GetActiveDOFIndices()
-            robot.SetActiveDOFs(list(range(2,18)), DOFAffine.RotationAxis, [0,0,1])
+            robot_body.set_active_dofs(list(range(2,18)), DOFAffine.RotationAxis, [0,0,1])
         else:
             raise PredicateException("Incorrect Active DOF Setting")
 
@@ -525,11 +510,11 @@ class BaxterObstructsHolding(robot_predicates.ObstructsHolding):
     def set_active_dof_inds(self, robot_body, reset = False):
         robot = robot_body.env_body
         if reset == True and self.dof_cache != None:
-            robot.SetActiveDOFs(self.dof_cache)
+            robot_body.set_active_dofs(self.dof_cache)
             self.dof_cache = None
         elif reset == False and self.dof_cache == None:
             self.dof_cache = robot.GetActiveDOFIndices()
-            robot.SetActiveDOFs(list(range(2,18)), DOFAffine.RotationAxis, [0,0,1])
+            robot_body.set_active_dofs(list(range(2,18)), DOFAffine.RotationAxis, [0,0,1])
         else:
             raise PredicateException("Incorrect Active DOF Setting")
 
@@ -576,10 +561,10 @@ class BaxterRCollides(robot_predicates.RCollides):
     def set_active_dof_inds(self, robot_body, reset = False):
         robot = robot_body.env_body
         if reset == True and self.dof_cache != None:
-            robot.SetActiveDOFs(self.dof_cache)
+            robot_body.set_active_dofs(self.dof_cache)
             self.dof_cache = None
         elif reset == False and self.dof_cache == None:
             self.dof_cache = robot.GetActiveDOFIndices()
-            robot.SetActiveDOFs(list(range(2,18)), DOFAffine.RotationAxis, [0,0,1])
+            robot_body.set_active_dofs(list(range(2,18)), DOFAffine.RotationAxis, [0,0,1])
         else:
             raise PredicateException("Incorrect Active DOF Setting")
@@ -0,0 +1,51 @@
+from core.util_classes.can import Can
+from core.util_classes.box import Box
+from core.util_classes.table import Table
+from core.util_classes.circle import Circle
+from core.util_classes.wall import Wall
+from core.util_classes.robots import Robot
+import numpy as np
+
+"""
+Bounding spheres of the geometries in core.util_classes, used as a broad
+phase before the collision checker. Each sphere is centered at the pose of
+its body (for robots, at the base) and contains the body in any rotation (and
+for robots, in any joint configuration).
+"""
+
+def bounding_radius(geom):
+    """
+    Radius of the bounding sphere of geom, or None if geom has no known
+    bound.
+    """
+    if isinstance(geom, Can):
+        ## cylinder of full height geom.height centered at the pose
+        return np.sqrt(geom.radius**2 + (geom.height/2.)**2)
+    elif isinstance(geom, Box):
+        ## geom.dim are the half extents of the box
+        return np.linalg.norm(geom.dim)
+    elif isinstance(geom, Table):
+        ## the legs and back plate hang at most 1.5 leg heights below the top
+        dim1, dim2 = geom.table_dim
+        return np.sqrt((dim1/2.)**2 + (dim2/2.)**2 + (1.5*geom.leg_height + geom.thickness)**2)
+    elif isinstance(geom, Circle):
+        return geom.radius
+    elif isinstance(geom, Wall):
+        centers, half_extents = geom.get_boxes()
+        return np.sqrt(np.max(np.sum((np.abs(centers) + half_extents)**2, axis=1)) + 1)
+    elif isinstance(geom, Robot):
+        ## computed from the robot model, which needs OpenRAVE
+        from core.util_classes.openrave_body import get_robot_bound_radius
+        return get_robot_bound_radius(geom)
+    return None
+
+def spheres_apart(pos0, r0, pos1, r1, dist):
+    """
+    True if the bounding spheres of radius r0 at pos0 and r1 at pos1 are
+    more than dist apart.
+    """
+    if r0 is None or r1 is None:
+        return False
+    pos0 = np.asarray(pos0, dtype=np.float).flatten()
+    pos1 = np.asarray(pos1, dtype=np.float).flatten()
+    return np.linalg.norm(pos0 - pos1) - r0 - r1 > dist
@@ -0,0 +1,36 @@
+import os
+import os.path as path
+
+"""
+Location of the on-disk caches of precomputed geometry (signed distance
+fields, sphere trees and convex hull collision meshes), so they do not
+depend on the working directory of the process and are never written into
+the source tree. The directory is $TAMPY_CACHE_DIR if set, ~/.cache/tampy
+otherwise.
+"""
+
+CACHE_DIR_VAR = 'TAMPY_CACHE_DIR'
+DEFAULT_CACHE_DIR = path.join(path.expanduser('~'), '.cache', 'tampy')
+
+def cache_dir():
+    """
+    Returns the cache directory, creating it if needed.
+    """
+    cache = os.environ.get(CACHE_DIR_VAR, DEFAULT_CACHE_DIR)
+    if not path.isdir(cache):
+        try:
+            os.makedirs(cache)
+        except OSError:
+            ## created concurrently by another process
+            if not path.isdir(cache):
+                raise
+    return cache
+
+def cache_path(file_name):
+    """
+    Path of the cache file file_name: relative names are in the cache
+    directory, absolute paths are left alone.
+    """
+    if path.isabs(file_name):
+        return file_name
+    return path.join(cache_dir(), file_name)
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import threading
+import numpy as np
+
+"""
+Process-wide cache of collision query results shared by the collision
+predicates. Entries are (value, jacobian) pairs keyed by the queried body pair
+and the rounded pose vector, and the least recently used entries are evicted
+once the cache holds capacity entries.
+"""
+
+DEFAULT_CAPACITY = 100000
+
+class CollisionCache(object):
+    """
+    LRU cache of collision query results, with hit, miss and eviction counts
+    and the memory held by the cached arrays.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(tag, params, x, n_digs, *args):
+        """
+        Key of a query of type tag between params (in order) at pose vector x
+        rounded to n_digs digits. Bodies are identified by name and geometry,
+        so predicates of different plans over the same bodies share results.
+        args are any other values the result depends on (e.g. dsafe).
+        """
+        bodies = tuple((p.name, getattr(p, 'geom', None)) for p in params)
+        return (tag, bodies, args, tuple(np.asarray(x).round(n_digs).flatten()))
+
+    @staticmethod
+    def _entry_nbytes(value):
+        return sum(v.nbytes for v in value if isinstance(v, np.ndarray))
+
+    def get(self, key):
+        """
+        Returns the cached value of key, or None on a miss.
+        """
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Caches a copy of value, a tuple of arrays, under key.
+        """
+        value = tuple(v.copy() if isinstance(v, np.ndarray) else v for v in value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= self._entry_nbytes(old)
+            self._entries[key] = value
+            self.nbytes += self._entry_nbytes(value)
+            self._evict()
+        return value
+
+    def _evict(self):
+        while len(self._entries) > max(self.capacity, 0):
+            _, value = self._entries.popitem(last=False)
+            self.nbytes -= self._entry_nbytes(value)
+            self.evictions += 1
+
+    def set_capacity(self, capacity):
+        with self._lock:
+            self.capacity = capacity
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self.nbytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.
+        return float(self.hits) / total
+
+    def stats(self):
+        return {'size': len(self._entries), 'capacity': self.capacity,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'evictions': self.evictions,
+                'nbytes': self.nbytes}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+_collision_cache = CollisionCache()
+
+def get_collision_cache():
+    return _collision_cache
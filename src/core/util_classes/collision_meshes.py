@@ -0,0 +1,155 @@
+from openravepy import Environment, TriMesh, GeometryType
+from core.util_classes.cache_paths import cache_path
+import os.path as path
+import h5py
+import numpy as np
+
+"""
+Simplified collision meshes for robot links. Every triangle mesh geometry
+of the links in col_links is replaced, for collision checking only, by its
+convex hull; the render meshes are left alone. Hulls are computed once per
+robot model and cached in an HDF5 file, one group per model geometry hash.
+Hulls precomputed next to the model file are used when they are there,
+otherwise hulls are cached in the cache directory (see cache_paths).
+
+Running this module precomputes the hulls of the PR2 and Baxter models
+next to their model files.
+"""
+
+# Load convex hull collision meshes for robots in OpenRAVEBody._add_robot
+CONVEX_COLLISION_MESHES = False
+CACHE_FILE_NAME = "collision_meshes.hdf5"
+
+# Directory the relative model paths of the robot geometries start from
+PACKAGE_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+
+def model_file(geom):
+    """
+    Absolute path of the model file of the robot geometry geom.
+    """
+    return path.normpath(path.join(PACKAGE_DIR, geom.shape))
+
+def model_cache_file(geom):
+    """
+    File of the hulls precomputed for the robot geometry geom, next to its
+    model file.
+    """
+    return path.join(path.dirname(model_file(geom)), CACHE_FILE_NAME)
+
+def cache_file():
+    """
+    File of the hulls computed at run time, in the cache directory.
+    """
+    return cache_path(CACHE_FILE_NAME)
+
+def convex_hull(vertices):
+    """
+    Returns the (vertices, indices) of the triangle mesh of the convex hull
+    of the (n, 3) vertices, with outward facing triangles.
+    """
+    # scipy is only needed when the hulls are not cached yet
+    from scipy.spatial import ConvexHull
+    hull = ConvexHull(vertices)
+    used = np.unique(hull.simplices)
+    remap = np.zeros(len(vertices), dtype=np.int)
+    remap[used] = np.arange(len(used))
+    indices = remap[hull.simplices]
+    hull_vertices = vertices[used]
+    # orient every triangle along the outward facing normal of its facet
+    v0, v1, v2 = hull_vertices[indices[:, 0]], hull_vertices[indices[:, 1]], hull_vertices[indices[:, 2]]
+    flip = np.sum(np.cross(v1 - v0, v2 - v0) * hull.equations[:, :3], axis=1) < 0
+    indices[flip] = indices[flip][:, ::-1]
+    return hull_vertices, indices
+
+def _mesh_geometries(robot, col_links):
+    for link in robot.GetLinks():
+        if link.GetName() not in col_links:
+            continue
+        for i, geom in enumerate(link.GetGeometries()):
+            if geom.GetType() == GeometryType.Trimesh:
+                yield link.GetName(), i, geom
+
+def compute_hulls(robot, col_links):
+    """
+    Returns a dictionary from (link name, geometry index) to the convex
+    hull (vertices, indices) of each mesh geometry of col_links, in the
+    frame of the geometry.
+    """
+    from scipy.spatial.qhull import QhullError
+    hulls = {}
+    for name, i, geom in _mesh_geometries(robot, col_links):
+        vertices = np.array(geom.GetCollisionMesh().vertices)
+        try:
+            hulls[(name, i)] = convex_hull(vertices)
+        except QhullError:
+            ## flat or degenerate meshes keep their own triangles
+            continue
+    return hulls
+
+def write_hulls(group, hulls):
+    for (name, i), (vertices, indices) in hulls.items():
+        g = group.create_group('{}/{}'.format(name, i))
+        g.create_dataset('vertices', data=vertices)
+        g.create_dataset('indices', data=indices)
+
+def read_hulls(group):
+    hulls = {}
+    for name in group:
+        for i in group[name]:
+            hulls[(str(name), int(i))] = (group[name][i]['vertices'][()], group[name][i]['indices'][()])
+    return hulls
+
+def _read_cached(cache_file_name, key):
+    hulls = None
+    if path.isfile(cache_file_name):
+        hdf5 = h5py.File(cache_file_name, 'r')
+        if key in hdf5:
+            hulls = read_hulls(hdf5[key])
+        hdf5.close()
+    return hulls
+
+def get_hulls(robot, geom, cache_file_name=None):
+    """
+    Returns the convex hulls of the col_links of robot, a KinBody with the
+    original meshes of the robot geometry geom, from cache_file_name if they
+    were computed before, otherwise computed and written to it. By default
+    the hulls precomputed next to the model are used if they are there, and
+    the cache file in the cache directory otherwise.
+    """
+    key = robot.GetKinematicsGeometryHash()
+    if cache_file_name is None:
+        hulls = _read_cached(model_cache_file(geom), key)
+        if hulls is not None:
+            return hulls
+        cache_file_name = cache_file()
+    hulls = _read_cached(cache_file_name, key)
+    if hulls is not None:
+        return hulls
+    hulls = compute_hulls(robot, geom.col_links)
+    hdf5 = h5py.File(cache_file_name, 'a')
+    if key not in hdf5:
+        write_hulls(hdf5.create_group(key), hulls)
+    hdf5.close()
+    return hulls
+
+def load_collision_meshes(robot, geom, cache_file_name=None):
+    """
+    Sets the collision meshes of the mesh geometries of the col_links of
+    robot to their convex hulls. Rendering still uses the original meshes.
+    """
+    hulls = get_hulls(robot, geom, cache_file_name)
+    for name, i, g in list(_mesh_geometries(robot, geom.col_links)):
+        if (name, i) in hulls:
+            vertices, indices = hulls[(name, i)]
+            g.SetCollisionMesh(TriMesh(vertices, indices))
+
+if __name__ == "__main__":
+    from core.util_classes.robots import PR2, Baxter
+    env = Environment()
+    for geom in [PR2(), Baxter()]:
+        robot = env.ReadRobotXMLFile(model_file(geom))
+        env.Add(robot)
+        hulls = get_hulls(robot, geom, model_cache_file(geom))
+        print "{}: {} convex hulls in {}".format(geom.shape, len(hulls), model_cache_file(geom))
+        env.Remove(robot)
+    env.Destroy()
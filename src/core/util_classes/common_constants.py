@@ -3,6 +3,10 @@ This file contains non-robot specific constants.
 This file is refferenced in:
     robot_predicates
     common_predicates
+    ll_solver
+    can_solver
+    robot_ll_solver
+    plan_evaluator
 """
 
 """
@@ -14,6 +18,17 @@ EEREACHABLE_STEPS = 3
 DIST_SAFE = 1e-2
 COLLISION_TOL = 1e-3
 MAX_CONTACT_DISTANCE = .1
+# Compute end effector poses with the NumPy arm kinematics instead of OpenRAVE
+NUMPY_KINEMATICS = False
+
+"""
+Constants used in the low level solvers
+"""
+# Coefficient of the trajectory smoothness objective of NAMOSolver
+TRAJOPT_COEFF = 1e0
+# Coefficient of the trajectory smoothness objective of CanSolver and
+# RobotLLSolver
+ROBOT_TRAJOPT_COEFF = 1e3
 
 """
 Following constants are for testing purposes
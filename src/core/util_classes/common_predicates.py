@@ -2,9 +2,14 @@ from IPython import embed as shell
 from core.internal_repr.predicate import Predicate
 from core.util_classes.matrix import Vector2d
 from core.util_classes.openrave_body import OpenRAVEBody
+from core.util_classes.env_registry import get_registry
+from core.util_classes.env_pool import current_clone, current_env, current_body
+from core.util_classes.sphere_tree import get_collision_fidelity
 from errors_exceptions import PredicateException
+from collections import OrderedDict
 from sco.expr import Expr, AffExpr, EqExpr, LEqExpr
 import numpy as np
+import threading
 from openravepy import Environment
 import ctrajoptpy
 
@@ -17,24 +22,93 @@ pr2_domain specific predicates can be cound in core/util_classes/pr2_predicates.
 
 DEFAULT_TOL=1e-3
 
-def get_param_vector_helper(pred, res_arr, startind, t, attr_inds):
-    i = startind
-    for p in pred.attr_inds:
-        for attr, ind_arr in pred.attr_inds[p]:
-            n_vals = len(ind_arr)
-	    if p.is_symbol():
-                res_arr[i:i+n_vals] = getattr(p, attr)[ind_arr, 0]
-	    else:
-	        res_arr[i:i+n_vals] = getattr(p, attr)[ind_arr, t]
-	    i += n_vals
-    return i
+def _copy_result(res):
+    if isinstance(res, tuple):
+        return tuple(_copy_result(r) for r in res)
+    if isinstance(res, np.ndarray):
+        return res.copy()
+    return res
+
+def last_point_memo(func):
+    """
+    Wraps func(x) so that a call at exactly the point of the previous call
+    in the same thread (and at the same collision fidelity) returns a copy of
+    the previous result instead of evaluating func again.
+
+    This only saves the repeated calls of one solver iterate (merit, then
+    linearization, then test). Calls at other points fall through to the
+    collision cache (collision_cache), which keeps results of many points
+    for all predicates, and Plan.get_failed_preds does not evaluate the
+    expressions of predicates whose results are in its SatisfactionCache.
+    An expression evaluated at several points in turn, like one timestep
+    of a constraint stacked by ll_solver.stack_expr, misses every time, so
+    stack_expr memoizes the stacked expression instead.
+    """
+    local = threading.local()
+    def memo(x, *args, **kwargs):
+        if args or kwargs:
+            return func(x, *args, **kwargs)
+        arr = np.asarray(x, dtype=np.float)
+        key = (get_collision_fidelity(), arr.shape, arr.tobytes())
+        last = getattr(local, 'last', None)
+        if last is None or last[0] != key:
+            last = (key, func(x))
+            local.last = last
+        return _copy_result(last[1])
+    return memo
+
+def memoize_expr(expr):
+    """
+    Memoizes the eval and grad of the nonlinear expression of the constraint
+    expr (see last_point_memo), so evaluating the merit, linearizing and
+    testing at the same solver iterate computes them once.
+    """
+    inner = getattr(expr, 'expr', None)
+    if type(inner) is Expr and not getattr(inner, '_memoized', False):
+        inner.eval = last_point_memo(inner.eval)
+        inner.grad = last_point_memo(inner.grad)
+        inner._memoized = True
+    return expr
+
+def test_columns(expr, expr_val, tol, negated=False):
+    """
+    Returns a boolean array of expr.eval(x, tol, negated) for each column x
+    of a block, given the (m, T) values expr_val of expr.expr on the block.
+    """
+    val = np.asarray(expr.val)
+    if val.ndim == 1:
+        val = val.reshape((-1, 1))
+    if isinstance(expr, LEqExpr):
+        if negated:
+            return ~np.all(expr_val <= val - tol, axis=0)
+        return np.all(expr_val <= val + tol, axis=0)
+    res = np.all(np.isclose(expr_val, val, atol=tol), axis=0)
+    return ~res if negated else res
+
+def _memoized_expr(name):
+    attr = '_memoized_' + name
+    def get(self):
+        try:
+            return self.__dict__[attr]
+        except KeyError:
+            raise AttributeError(name)
+    def set(self, expr):
+        self.__dict__[attr] = memoize_expr(expr)
+    return property(get, set)
 
 
 class ExprPredicate(Predicate):
 
     """
     Predicates which are defined by a target value for a set expression.
+
+    The eval and grad of the nonlinear expressions assigned to expr,
+    neg_expr and opt_expr are memoized at the last point they were
+    evaluated at (see memoize_expr).
     """
+    expr = _memoized_expr('expr')
+    neg_expr = _memoized_expr('neg_expr')
+    opt_expr = _memoized_expr('opt_expr')
 
     def __init__(self, name, expr, attr_inds, params, expected_param_types, env=None, active_range=(0,0), tol=DEFAULT_TOL):
         """
@@ -54,13 +128,35 @@ class ExprPredicate(Predicate):
         start, end = active_range
         self.x_dim *= end + 1 - start
         self.x = np.zeros(self.x_dim)
+        self._gather_src = None
+        self._gather_inds = None
+        self._flat_inds = None
+        self._unpack_inds = None
+
+    @property
+    def _param_to_body(self):
+        """
+        Bodies of the parameters, taken from the environment clone bound to
+        the current thread if there is one (see env_pool).
+        """
+        if current_clone() is None:
+            return self._bodies
+        return dict((p, current_body(b)) for p, b in self._bodies.items())
+
+    @_param_to_body.setter
+    def _param_to_body(self, bodies):
+        self._bodies = bodies
+
+    @property
+    def _registry(self):
+        return get_registry(current_env(self._env))
 
     def lazy_spawn_or_body(self, param, name, geom):
         if param.openrave_body is not None:
             assert geom == param.openrave_body._geom
             assert self._env == param.openrave_body.env_body.GetEnv()
         else:
-            param.openrave_body = OpenRAVEBody(self._env, name, geom)
+            param.openrave_body = get_registry(self._env).get_body(name, geom)
         return param.openrave_body
 
     def get_expr(self, negated):
@@ -69,19 +165,147 @@ class ExprPredicate(Predicate):
         else:
             return self.expr
 
+    def get_gather_inds(self):
+        """
+        Compiles attr_inds into one gather per (param, attr) pair:
+        a list of (param, attr, rows, offsets, dst, t_mask) where
+        x[dst] = getattr(param, attr)[rows, offsets + t*t_mask]
+        gives the entries of get_param_vector(t) read from that attribute.
+        t_mask is 0 for Symbols, which are always read at column 0.
+        """
+        if self._gather_src is not self.attr_inds:
+            table = OrderedDict()
+            i = 0
+            start, end = self.active_range
+            for rel_t in range(start, end+1):
+                for p in self.attr_inds:
+                    is_sym = p.is_symbol()
+                    for attr, ind_arr in self.attr_inds[p]:
+                        n_vals = len(ind_arr)
+                        rows, offsets, dst = table.setdefault((p, attr), ([], [], []))
+                        rows.extend(ind_arr)
+                        offsets.extend([0 if is_sym else rel_t]*n_vals)
+                        dst.extend(range(i, i+n_vals))
+                        i += n_vals
+            self._gather_inds = []
+            for (p, attr), (rows, offsets, dst) in table.iteritems():
+                self._gather_inds.append((p, attr, np.array(rows, dtype=np.int),
+                                          np.array(offsets, dtype=np.int),
+                                          np.array(dst, dtype=np.int),
+                                          0 if p.is_symbol() else 1))
+            self._gather_src = self.attr_inds
+        return self._gather_inds
+
+    def get_flat_inds(self):
+        """
+        When every attribute read by the predicate lives in the buffer of one
+        PackedPlanState, returns (buf, base, t_mask, t_lo, t_hi) such that
+        get_param_vector(t) is buf[base + t*t_mask] for t_lo <= t <= t_hi.
+        Returns None otherwise.
+        """
+        gather_inds = self.get_gather_inds()
+        if not len(gather_inds):
+            return None
+        state = gather_inds[0][0].__dict__.get('_packed_state')
+        if state is None:
+            return None
+        flat = self._flat_inds
+        if flat is not None and flat[0] is state and flat[1] == state.generation \
+            and flat[2] is gather_inds:
+            return flat[3]
+        self._flat_inds = (state, state.generation, gather_inds, None)
+        base = np.empty(self.x_dim, dtype=np.int)
+        t_mask = np.empty(self.x_dim, dtype=np.int)
+        t_lo, t_hi = -np.inf, np.inf
+        for p, attr, rows, offsets, dst, mask in gather_inds:
+            if not len(rows):
+                continue
+            if state.params.get(p.name) is not p or not state.is_bound(p.name, attr):
+                return None
+            offset, shape = state.layout[(p.name, attr)]
+            if rows.max() >= shape[0]:
+                return None
+            base[dst] = offset + rows*shape[1] + offsets
+            t_mask[dst] = mask
+            if mask:
+                t_lo = max(t_lo, -offsets.min())
+                t_hi = min(t_hi, shape[1] - 1 - offsets.max())
+        self._flat_inds = (state, state.generation, gather_inds,
+                           (state.buf, base, t_mask, t_lo, t_hi))
+        return self._flat_inds[3]
+
     def get_param_vector(self, t):
-        end_ind = 0
+        flat = self.get_flat_inds()
+        if flat is not None and flat[3] <= t <= flat[4]:
+            ## a single read from the packed plan state
+            buf, base, t_mask, _, _ = flat
+            self.x[:] = buf[base + t*t_mask]
+            return self.x.reshape((self.x_dim, 1))
         start, end = self.active_range
-        for rel_t in range(start, end+1):
-            try:
-                end_ind = get_param_vector_helper(self, self.x, end_ind, t+rel_t, self.attr_inds)
-            except IndexError as err:
-                if end - start >= 1:
-                    raise PredicateException("Insufficient pose trajectory to check dynamic predicate '%s' at the timestep."%self)
-                else:
-                    raise err
+        try:
+            for p, attr, rows, offsets, dst, t_mask in self.get_gather_inds():
+                self.x[dst] = getattr(p, attr)[rows, offsets + t*t_mask]
+        except IndexError as err:
+            if end - start >= 1:
+                raise PredicateException("Insufficient pose trajectory to check dynamic predicate '%s' at the timestep."%self)
+            else:
+                raise err
         return self.x.reshape((self.x_dim, 1))
 
+    def get_param_vector_range(self, t0, t1):
+        """
+        Returns the (x_dim, t1-t0+1) block whose i-th column is
+        get_param_vector(t0+i). Raises IndexError when a timestep in the range
+        is out of the trajectories.
+        """
+        if t0 + self.active_range[0] < 0:
+            raise IndexError
+        ts = np.arange(t0, t1+1)
+        flat = self.get_flat_inds()
+        if flat is not None and flat[3] <= t0 and t1 <= flat[4]:
+            buf, base, t_mask, _, _ = flat
+            return buf[base[:, None] + ts[None, :]*t_mask[:, None]]
+        X = np.empty((self.x_dim, len(ts)))
+        for p, attr, rows, offsets, dst, t_mask in self.get_gather_inds():
+            cols = offsets[:, None] + ts[None, :]*t_mask
+            X[dst, :] = getattr(p, attr)[rows[:, None], cols]
+        return X
+
+    def _vectorizable(self):
+        ## only the affine constraints evaluate on a block of columns, and only
+        ## when the per timestep test and parameter vector are the default ones
+        return type(self).test == ExprPredicate.test and \
+            type(self).get_param_vector == ExprPredicate.get_param_vector and \
+            isinstance(self.expr, (EqExpr, LEqExpr)) and \
+            isinstance(self.expr.expr, AffExpr)
+
+    def eval_range(self, t0, t1):
+        """
+        Evaluates the affine expression on timesteps t0 to t1 at once,
+        returns an (m, t1-t0+1) array.
+        """
+        return self.expr.expr.eval(self.get_param_vector_range(t0, t1))
+
+    def test_range(self, t0, t1, negated=False):
+        """
+        Returns a boolean array of test(t, negated) for t in [t0, t1].
+        """
+        T = t1 - t0 + 1
+        if T <= 0:
+            return np.zeros((0,), dtype=bool)
+        if not self.is_concrete():
+            return np.zeros((T,), dtype=bool)
+        if t0 < 0 or not self._vectorizable():
+            return super(ExprPredicate, self).test_range(t0, t1, negated=negated)
+        try:
+            expr_val = self.eval_range(t0, t1)
+        except IndexError:
+            ## fall back to report the out of range timestep
+            return super(ExprPredicate, self).test_range(t0, t1, negated=negated)
+        if expr_val.ndim != 2 or expr_val.shape[1] != T:
+            return super(ExprPredicate, self).test_range(t0, t1, negated=negated)
+        return test_columns(self.expr, expr_val, self.tol, negated)
+
     def test(self, time, negated=False):
         if not self.is_concrete():
             return False
@@ -99,14 +323,18 @@ class ExprPredicate(Predicate):
         {param_name: [(attr, (g1,...gi,...gn)]}
         gi are in the same order as the attr_inds list
         """
-        res = {}
-        i = 0
-        for p in self.params:
-            res[p.name] = []
-            for attr, ind_arr in self.attr_inds[p]:
-                n_vals = len(ind_arr)
-                res[p.name].append((attr, y[i:i+n_vals]))
-                i += n_vals
+        if self._unpack_inds is None or self._unpack_inds[0] is not self.attr_inds:
+            unpack_inds = []
+            i = 0
+            for p in self.params:
+                for attr, ind_arr in self.attr_inds[p]:
+                    n_vals = len(ind_arr)
+                    unpack_inds.append((p.name, attr, i, i+n_vals))
+                    i += n_vals
+            self._unpack_inds = (self.attr_inds, unpack_inds)
+        res = dict([(p.name, []) for p in self.params])
+        for name, attr, i, j in self._unpack_inds[1]:
+            res[name].append((attr, y[i:j]))
         return res
 
     def _grad(self, t):
@@ -0,0 +1,60 @@
+import numpy as np
+
+"""
+Array views of the contacts returned by the trajopt collision checker, and
+batched jacobians of contact points, for the collision predicates.
+"""
+
+def contact_arrays(collisions, name0, name1):
+    """
+    Contacts between the bodies named name0 and name1, as a list of the
+    link names of body 0 and body 1 and arrays of the (K, 3) contact points
+    on body 0 and body 1, (K,) distances, (K, 3) normals and (K,) signs. The
+    sign is -1 when body 0 is body A of the contact (the normal points from
+    body 1 to body 0) and 1 otherwise.
+    """
+    links0, links1, pts0, pts1, dists, normals, signs = [], [], [], [], [], [], []
+    for c in collisions:
+        parentA, parentB = c.GetLinkAParentName(), c.GetLinkBParentName()
+        if parentA == name0 and parentB == name1:
+            links0.append(c.GetLinkAName())
+            links1.append(c.GetLinkBName())
+            pts0.append(c.GetPtA())
+            pts1.append(c.GetPtB())
+            signs.append(-1)
+        elif parentB == name0 and parentA == name1:
+            links0.append(c.GetLinkBName())
+            links1.append(c.GetLinkAName())
+            pts0.append(c.GetPtB())
+            pts1.append(c.GetPtA())
+            signs.append(1)
+        else:
+            continue
+        dists.append(c.GetDistance())
+        normals.append(c.GetNormal())
+    return (links0, links1, np.reshape(pts0, (-1, 3)), np.reshape(pts1, (-1, 3)),
+            np.array(dists, dtype=np.float), np.reshape(normals, (-1, 3)),
+            np.array(signs, dtype=np.float))
+
+def directional_point_jacobians(robot, link_inds, pts, dirs):
+    """
+    Rows (K, D) dirs[k].dot(J_k), where J_k is the active DOF jacobian of
+    the point pts[k] fixed to the robot link link_inds[k]. The translation
+    and angular velocity jacobians are computed once per link, at the link
+    origin, and moved to the points with n.(w x r) = w.(r x n).
+    """
+    links = robot.GetLinks()
+    uniq, inv = np.unique(link_inds, return_inverse=True)
+    origins = np.array([links[i].GetTransform()[:3, 3] for i in uniq])
+    trans_jac = np.array([robot.CalculateActiveJacobian(int(i), origins[j]) for j, i in enumerate(uniq)])
+    rot_jac = np.array([robot.CalculateActiveAngularVelocityJacobian(int(i)) for i in uniq])
+    arms = pts - origins[inv]
+    return np.einsum('ki,kij->kj', dirs, trans_jac[inv]) + \
+        np.einsum('ki,kij->kj', np.cross(arms, dirs), rot_jac[inv])
+
+def rotation_jacobians(rot_axises, arms, dirs):
+    """
+    Rows (K, 3) of dirs[k].(axis x arms[k]) for each of the three rotation
+    axes of a body pose, for (K, 3) lever arms and directions.
+    """
+    return np.einsum('kai,ki->ka', np.cross(np.asarray(rot_axises)[None, :, :], arms[:, None, :]), dirs)
@@ -0,0 +1,132 @@
+from core.util_classes.openrave_body import OpenRAVEBody
+from core.util_classes.env_registry import release_registry
+from core.util_classes.sphere_tree import collision_fidelity, get_collision_fidelity
+from multiprocessing.pool import ThreadPool
+from contextlib import contextmanager
+from openravepy import CloningOptions
+import Queue
+import threading
+
+"""
+Pool of clones of a planning environment, so predicates can be evaluated
+in parallel. Predicates move the bodies of the environment they are tested
+in, so each worker thread binds one clone (see EnvironmentPool.acquire) and,
+while it is bound, predicates over the planning environment use the bodies
+of that clone instead (see current_env and current_body).
+"""
+
+_local = threading.local()
+
+class EnvironmentClone(object):
+    """
+    A clone of env, with the OpenRAVEBodies of the clone by name.
+    """
+    def __init__(self, env):
+        self.source = env
+        self.env = env.CloneSelf(CloningOptions.Bodies)
+        self._bodies = {}
+
+    def sync(self):
+        """
+        Copies the bodies of the source environment into the clone again.
+        """
+        self.env.Clone(self.source, CloningOptions.Bodies)
+        self._bodies = {}
+
+    def body(self, body):
+        """
+        Returns the body of the clone for the OpenRAVEBody body of the source
+        environment, spawning it if it was added after the clone was made.
+        """
+        clone = self._bodies.get(body.name)
+        if clone is None or clone._geom != body._geom:
+            clone = OpenRAVEBody(self.env, body.name, body._geom)
+            self._bodies[body.name] = clone
+        return clone
+
+class EnvironmentPool(object):
+    """
+    size clones of env, handed out to one thread at a time.
+    """
+    def __init__(self, env, size):
+        self.env = env
+        self.size = size
+        self.clones = [EnvironmentClone(env) for _ in range(size)]
+        self._free = Queue.Queue()
+        for clone in self.clones:
+            self._free.put(clone)
+        self._pool = None
+
+    def sync(self):
+        for clone in self.clones:
+            clone.sync()
+
+    @contextmanager
+    def acquire(self):
+        """
+        Binds a free clone to the current thread for the with block.
+        """
+        clone = self._free.get()
+        prev = getattr(_local, 'clone', None)
+        _local.clone = clone
+        try:
+            yield clone
+        finally:
+            _local.clone = prev
+            self._free.put(clone)
+
+    def _call(self, call):
+        func, item, fidelity = call
+        with self.acquire(), collision_fidelity(fidelity):
+            return func(item)
+
+    def map(self, func, items):
+        """
+        Applies func to each item on the worker threads of the pool, each
+        call with a clone bound and the collision fidelity of the calling
+        thread, and returns the results in order.
+        """
+        if self._pool is None:
+            self._pool = ThreadPool(self.size)
+        fidelity = get_collision_fidelity()
+        return self._pool.map(self._call, [(func, item, fidelity) for item in items])
+
+    def close(self):
+        """
+        Stops the worker threads and destroys the clones, with the
+        registries of their environments (see env_registry).
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        for clone in self.clones:
+            release_registry(clone.env)
+            clone._bodies = {}
+            clone.env.Destroy()
+        self.clones = []
+        self._free = Queue.Queue()
+
+def current_clone():
+    """
+    Returns the EnvironmentClone bound to the current thread, or None.
+    """
+    return getattr(_local, 'clone', None)
+
+def current_env(env):
+    """
+    Returns the environment to use in place of env in the current thread.
+    """
+    clone = current_clone()
+    if clone is None or not clone.source == env:
+        return env
+    return clone.env
+
+def current_body(body):
+    """
+    Returns the OpenRAVEBody to use in place of body in the current thread.
+    """
+    clone = current_clone()
+    if clone is None or not clone.source == body._env:
+        return body
+    return clone.body(body)
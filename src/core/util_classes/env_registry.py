@@ -0,0 +1,94 @@
+from core.util_classes.openrave_body import OpenRAVEBody
+import threading
+import weakref
+import ctrajoptpy
+
+"""
+Resources shared by all the predicates over one OpenRAVE environment: a
+single trajopt collision checker, whose contact distance is set per query,
+and one OpenRAVEBody per body name, so predicates spawned for different
+plans in the same environment reuse the same bodies.
+
+Registries only hold their environment and bodies weakly: the registry of
+an environment is dropped once nothing else refers to the environment
+object, and bodies no parameter refers to anymore are spawned again (on
+the KinBody still in the environment) when they are asked for.
+"""
+
+class EnvironmentRegistry(object):
+
+    def __init__(self, env):
+        self._env = weakref.ref(env)
+        self._cc = None
+        self._contact_distance = None
+        self._bodies = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+
+    @property
+    def env(self):
+        return self._env()
+
+    def collision_checker(self):
+        with self._lock:
+            if self._cc is None:
+                self._cc = ctrajoptpy.GetCollisionChecker(self.env)
+            return self._cc
+
+    def body_vs_body(self, body0, body1, contact_distance):
+        """
+        Contacts between two KinBodies within contact_distance. The contact
+        distance of the shared checker is only changed when it differs from
+        the one of the previous query.
+        """
+        cc = self.collision_checker()
+        with self._lock:
+            if contact_distance != self._contact_distance:
+                cc.SetContactDistance(contact_distance)
+                self._contact_distance = contact_distance
+            return cc.BodyVsBody(body0, body1)
+
+    def get_body(self, name, geom):
+        """
+        Returns the OpenRAVEBody named name with geometry geom, spawning it
+        if it is not in the environment yet. Bodies are keyed by name only,
+        as names are unique in an OpenRAVE environment: asking for a name
+        with another geometry replaces the OpenRAVEBody of the name, which
+        wraps the KinBody of that name if the environment already has one.
+        """
+        with self._lock:
+            body = self._bodies.get(name)
+            if body is not None and body._geom == geom and \
+                    self.env.GetKinBody(name) == body.env_body:
+                return body
+            body = OpenRAVEBody(self.env, name, geom)
+            self._bodies[name] = body
+            return body
+
+    def clear(self):
+        with self._lock:
+            self._cc = None
+            self._contact_distance = None
+            self._bodies = weakref.WeakValueDictionary()
+
+_registries = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+def get_registry(env):
+    """
+    Returns the EnvironmentRegistry of env, creating it on first use.
+    """
+    with _registries_lock:
+        registry = _registries.get(env)
+        if registry is None:
+            registry = EnvironmentRegistry(env)
+            _registries[env] = registry
+        return registry
+
+def release_registry(env):
+    """
+    Drops the registry of env, e.g. once the environment is destroyed.
+    """
+    with _registries_lock:
+        registry = _registries.pop(env, None)
+    if registry is not None:
+        registry.clear()
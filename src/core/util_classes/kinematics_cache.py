@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import threading
+import weakref
+import numpy as np
+from core.util_classes.arm_kinematics import ChainRobotBody
+
+"""
+Cache of robot forward kinematics shared by the robot predicates. For each
+robot configuration (the robot entries of a predicate's parameter vector),
+it keeps the gripper transform and the axes and anchors of the arm joints
+computed by each distinct get_robot_info. Predicates of different classes
+that read the same configuration share one entry, so a configuration is
+pushed into OpenRAVE at most once until it is evicted.
+
+A cache hit does not move the robot, so after a query the OpenRAVE robot
+may be in any configuration: callers must use the returned transform and
+joint snapshots and never read link or joint state from OpenRAVE.
+"""
+
+DEFAULT_CAPACITY = 1000
+
+class JointSnapshot(object):
+    """
+    Axis and anchor of a robot joint in one configuration, with the
+    accessors of the OpenRAVE joint they are read from.
+    """
+    def __init__(self, joint):
+        self.axis = np.array(joint.GetAxis())
+        self.anchor = np.array(joint.GetAnchor())
+
+    def GetAxis(self):
+        return self.axis
+
+    def GetAnchor(self):
+        return self.anchor
+
+def _func_key(func):
+    ## the function itself: classes inheriting one get_robot_info share its
+    ## entries, classes defining their own (even with the same code, which
+    ## may read different links) do not
+    return getattr(func, 'im_func', func)
+
+class KinematicsCache(object):
+    """
+    LRU cache, per robot body, from configuration keys to a dictionary of
+    get_robot_info results.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._entries = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _configuration(self, robot_body, key, info_key):
+        ## returns the entry of key and its info_key result, if any, and
+        ## counts the hit or miss under the lock
+        with self._lock:
+            entries = self._entries.setdefault(robot_body, OrderedDict())
+            config = entries.pop(key, None)
+            if config is None:
+                config = {}
+                while len(entries) >= max(self.capacity, 1):
+                    entries.popitem(last=False)
+            entries[key] = config
+            info = config.get(info_key)
+            if info is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return config, info
+
+    @staticmethod
+    def _at_configuration(robot_body, key):
+        ## robot state is compared too, other code may have moved the robot
+        state = getattr(robot_body, '_kinematics_state', None)
+        if state is None or state[0] != key:
+            return False
+        robot = robot_body.env_body
+        return np.array_equal(robot.GetDOFValues(), state[1]) and \
+            np.array_equal(robot.GetTransform(), state[2])
+
+    def get_robot_info(self, pred, x, robot_body, key, use_chain=False):
+        """
+        Returns the (robot_trans, arm_joints) of pred at configuration key,
+        with arm_joints as JointSnapshots. On a miss, the robot is set to x
+        with pred.set_robot_poses, unless it already is in that configuration.
+        With use_chain, misses are computed with the NumPy kinematic chains
+        of the robot (see arm_kinematics) and the robot is not moved.
+        Hits never move the robot, so its OpenRAVE state must not be read
+        after this call.
+        """
+        info_key = _func_key(pred.get_robot_info)
+        config, info = self._configuration(robot_body, key, info_key)
+        if info is not None:
+            return info
+        if use_chain:
+            robot_body = ChainRobotBody(robot_body)
+            pred.set_robot_poses(x, robot_body)
+        elif not self._at_configuration(robot_body, key):
+            pred.set_robot_poses(x, robot_body)
+            robot = robot_body.env_body
+            robot_body._kinematics_state = (key, robot.GetDOFValues(), robot.GetTransform())
+        robot = robot_body.env_body
+        robot_trans, arm_inds = pred.get_robot_info(robot_body)
+        arm_joints = [JointSnapshot(robot.GetJointFromDOFIndex(ind)) for ind in arm_inds]
+        config[info_key] = (np.array(robot_trans), arm_joints)
+        return config[info_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries = weakref.WeakKeyDictionary()
+
+_kinematics_cache = KinematicsCache()
+
+def get_kinematics_cache():
+    return _kinematics_cache
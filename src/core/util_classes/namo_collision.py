@@ -0,0 +1,106 @@
+from core.util_classes.circle import Circle
+from core.util_classes.wall import Wall
+from core.util_classes.sdf import get_static_sdf
+import numpy as np
+
+"""
+Analytic signed distances and gradients between the bodies of the 2D NAMO
+domain, circles and walls made of axis-aligned boxes. These give the values
+that CollisionPredicate._calc_grad_and_val computes from the OpenRAVE
+collision checker, without using the OpenRAVE environment.
+
+All functions are vectorized: poses are (N, 2) arrays, one row per query
+(e.g. per timestep). With use_sdf, distances to walls are looked up in the
+signed distance field of the wall instead (see sdf.get_static_sdf), which
+gives one row for the whole wall.
+"""
+
+def circle_circle(p0, r0, p1, r1):
+    """
+    Signed distances (N, 1) between circles of radius r0 at p0 and radius r1
+    at p1, and the unit normals (N, 1, 2) pointing from the second circle to
+    the first.
+    """
+    diff = p0 - p1
+    norm = np.sqrt(np.sum(diff**2, axis=1))
+    normals = np.zeros(diff.shape)
+    normals[:, 0] = 1.
+    nonzero = norm > 0
+    normals[nonzero] = diff[nonzero] / norm[nonzero][:, None]
+    return (norm - r0 - r1)[:, None], normals[:, None, :]
+
+def circle_boxes(p, r, centers, half_extents):
+    """
+    Signed distances (N, M) between circles of radius r at p and the M
+    axis-aligned boxes given by centers and half_extents (each (M, 2) or
+    (N, M, 2)), and the unit normals (N, M, 2) pointing from each box to the
+    circle.
+    """
+    rel = p[:, None, :] - centers
+    outside = np.abs(rel) - half_extents
+    closest = np.clip(rel, -half_extents, half_extents)
+    diff = rel - closest
+    norm = np.sqrt(np.sum(diff**2, axis=2))
+    normals = np.zeros(diff.shape)
+    is_out = norm > 0
+    normals[is_out] = diff[is_out] / norm[is_out][:, None]
+    ## centers inside a box are pushed out through the nearest face
+    dist = norm.copy()
+    if not np.all(is_out):
+        depth = outside.max(axis=2)
+        axis = outside.argmax(axis=2)
+        inside = ~is_out
+        dist[inside] = depth[inside]
+        n, m = np.nonzero(inside)
+        sign = np.sign(rel[n, m, axis[n, m]])
+        sign[sign == 0] = 1.
+        normals[n, m, axis[n, m]] = sign
+    return dist - r, normals
+
+def circle_sdf(p, r, geom, pose):
+    """
+    Signed distances (N, 1) between circles of radius r at p and the static
+    body geom at pose, and the normals (N, 1, 2) pointing from the body to
+    the circle, from the signed distance field of geom.
+    """
+    dist, grads = get_static_sdf(geom).query(p - pose)
+    norm = np.sqrt(np.sum(grads**2, axis=1))
+    norm[norm == 0] = 1.
+    return (dist - r)[:, None], (grads / norm[:, None])[:, None, :]
+
+def distances(geom0, pose0, geom1, pose1, use_sdf=False):
+    """
+    Signed distances (N, M) and normals (N, M, 2) from body 1 to body 0 for
+    the M components of the pair (one for two circles, one per box of a
+    wall, or one for a wall with use_sdf).
+    """
+    pose0 = np.atleast_2d(pose0)
+    pose1 = np.atleast_2d(pose1)
+    if isinstance(geom0, Circle) and isinstance(geom1, Circle):
+        return circle_circle(pose0, geom0.radius, pose1, geom1.radius)
+    elif isinstance(geom0, Circle) and isinstance(geom1, Wall) and use_sdf:
+        return circle_sdf(pose0, geom0.radius, geom1, pose1)
+    elif isinstance(geom0, Circle) and isinstance(geom1, Wall):
+        centers, half_extents = geom1.get_boxes()
+        return circle_boxes(pose0, geom0.radius, pose1[:, None, :] + centers, half_extents)
+    elif isinstance(geom0, Wall) and isinstance(geom1, Circle):
+        dist, normals = distances(geom1, pose1, geom0, pose0, use_sdf)
+        return dist, -normals
+    raise NotImplementedError("No analytic distance between %s and %s."%(type(geom0).__name__, type(geom1).__name__))
+
+def collision_vals_and_jacs(geom0, pose0, geom1, pose1, dsafe, n_cols, use_sdf=False):
+    """
+    Returns the (N, n_cols, 1) values dsafe - distance and (N, n_cols, 4)
+    jacobians with respect to [pose0, pose1], laid out like
+    namo_predicates.CollisionPredicate._calc_grad_and_val. Rows past the
+    components of the pair are zero.
+    """
+    dist, normals = distances(geom0, pose0, geom1, pose1, use_sdf)
+    N, M = dist.shape
+    assert M <= n_cols
+    vals = np.zeros((N, n_cols, 1))
+    jacs = np.zeros((N, n_cols, 4))
+    vals[:, :M, 0] = dsafe - dist
+    jacs[:, :M, :2] = -normals
+    jacs[:, :M, 2:] = normals
+    return vals, jacs
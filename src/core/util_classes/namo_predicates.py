@@ -1,9 +1,11 @@
 from IPython import embed as shell
 from core.internal_repr.predicate import Predicate
 from core.internal_repr.plan import Plan
-from core.util_classes.common_predicates import ExprPredicate
+from core.util_classes.common_predicates import ExprPredicate, last_point_memo, test_columns
 from core.util_classes.matrix import Vector2d
 from core.util_classes.openrave_body import OpenRAVEBody
+from core.util_classes.collision_cache import get_collision_cache
+from core.util_classes.namo_collision import collision_vals_and_jacs
 from errors_exceptions import PredicateException
 from sco.expr import Expr, AffExpr, EqExpr, LEqExpr
 import numpy as np
@@ -24,19 +26,26 @@ contact_dist = 0
 RS_SCALE = 0.5
 N_DIGS = 3
 
+## 'openrave' queries the OpenRAVE collision checker, 'analytic' computes the
+## circle and wall distances directly (see namo_collision), 'sdf' is
+## 'analytic' with the walls looked up in precomputed signed distance fields
+COLLISION_ENGINE = 'openrave'
+
 
 class CollisionPredicate(ExprPredicate):
     def __init__(self, name, e, attr_inds, params, expected_param_types, dsafe = dsafe, debug = False, ind0=0, ind1=1):
         self._debug = debug
         # if self._debug:
         #     self._env.SetViewer("qtcoin")
-        self._cc = ctrajoptpy.GetCollisionChecker(self._env)
         self.dsafe = dsafe
         self.ind0 = ind0
         self.ind1 = ind1
 
-        self._cache = {}
+        self._cache = get_collision_cache()
         self.n_cols = 1
+        self.collision_engine = COLLISION_ENGINE
+        ## the exprs of a range evaluate it once for both values and jacobians
+        self.distance_from_obj_range = last_point_memo(self.distance_from_obj_range)
 
         super(CollisionPredicate, self).__init__(name, e, attr_inds, params, expected_param_types)
 
@@ -52,6 +61,37 @@ class CollisionPredicate(ExprPredicate):
             ## this happens with an invalid time
             raise PredicateException("Out of range time for predicate '%s'."%self)
 
+    def _test_expr(self, negated):
+        ## the constraint test compares, and how
+        return self.neg_expr, not negated
+
+    def test_range(self, t0, t1, negated=False):
+        """
+        Tests timesteps t0 to t1 with one call to distance_from_obj_range.
+        """
+        if t1 < t0 or t0 < 0 or not self.is_concrete():
+            return super(CollisionPredicate, self).test_range(t0, t1, negated=negated)
+        try:
+            X = self.get_param_vector_range(t0, t1)
+        except IndexError:
+            ## fall back to report the out of range timestep
+            return super(CollisionPredicate, self).test_range(t0, t1, negated=negated)
+        expr, expr_negated = self._test_expr(negated)
+        return test_columns(expr, expr.expr.eval_range(X), self.tol, expr_negated)
+
+    def _col_expr(self, val_coeff, jac_coeff):
+        """
+        Returns the Expr of val_coeff times the collision values and
+        jac_coeff times their jacobian. Its eval_range and grad_range
+        evaluate it on all the columns of an (x_dim, T) block at once, as
+        (m, T) values and (T, m, x_dim) jacobians.
+        """
+        col_expr = Expr(lambda x: val_coeff*self.distance_from_obj(x)[0],
+                        lambda x: jac_coeff*self.distance_from_obj(x)[1])
+        col_expr.eval_range = lambda X: val_coeff*self.distance_from_obj_range(X)[0][:, :, 0].T
+        col_expr.grad_range = lambda X: jac_coeff*self.distance_from_obj_range(X)[1]
+        return col_expr
+
     def plot_cols(self, env, t):
         _debug = self._debug
         self._env = env
@@ -62,29 +102,62 @@ class CollisionPredicate(ExprPredicate):
 
     # @profile
     def distance_from_obj(self, x):
-        flattened = tuple(x.round(N_DIGS).flatten())
-        if flattened in self._cache and self._debug is False:
-            return self._cache[flattened]
-        self._cc.SetContactDistance(np.Inf)
         p0 = self.params[self.ind0]
         p1 = self.params[self.ind1]
+        key = self._cache.make_key('namo', [p0, p1], x, N_DIGS, self.dsafe, self.n_cols, self.collision_engine,
+                                   self._param_to_body[p0]._geom, self._param_to_body[p1]._geom)
+        if self._debug is False:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+        val, jac = self._pair_grad_and_val(p0, p1, x[0:2], x[2:4])
+        self._cache.put(key, (val, jac))
+        return val, jac
+
+    def distance_from_obj_range(self, X):
+        """
+        distance_from_obj of each column of the (x_dim, T) block X, as
+        (T, n_cols, 1) values and (T, n_cols, 4) jacobians.
+        """
+        if self.collision_engine in ['analytic', 'sdf'] and not self._debug:
+            return self._pair_range(self.params[self.ind0], self.params[self.ind1], X[0:2], X[2:4])
+        res = [self.distance_from_obj(X[:, i:i+1]) for i in range(X.shape[1])]
+        return np.array([v for v, _ in res]), np.array([j for _, j in res])
+
+    def _pair_range(self, p0, p1, poses0, poses1):
+        """
+            _pair_grad_and_val of each column of the (2, T) poses0 and
+            poses1, with one call to the analytic collision engines
+        """
+        if self.collision_engine in ['analytic', 'sdf'] and not self._debug:
+            return collision_vals_and_jacs(self._param_to_body[p0]._geom, poses0.T,
+                                           self._param_to_body[p1]._geom, poses1.T,
+                                           self.dsafe, self.n_cols,
+                                           use_sdf=self.collision_engine == 'sdf')
+        res = [self._pair_grad_and_val(p0, p1, poses0[:, i:i+1], poses1[:, i:i+1])
+               for i in range(poses0.shape[1])]
+        return np.array([v for v, _ in res]), np.array([j for _, j in res])
+
+    def _pair_grad_and_val(self, p0, p1, pose0, pose1):
+        """
+            Collision values and jacobian between p0 at pose0 and p1 at pose1,
+            from the collision engine of the predicate
+        """
         b0 = self._param_to_body[p0]
         b1 = self._param_to_body[p1]
-        pose0 = x[0:2]
-        pose1 = x[2:4]
+        if self.collision_engine in ['analytic', 'sdf'] and not self._debug:
+            vals, jacs = collision_vals_and_jacs(b0._geom, np.reshape(pose0, (1, 2)),
+                                                 b1._geom, np.reshape(pose1, (1, 2)),
+                                                 self.dsafe, self.n_cols,
+                                                 use_sdf=self.collision_engine == 'sdf')
+            return vals[0], jacs[0]
         b0.set_pose(pose0)
         b1.set_pose(pose1)
 
         assert b0.env_body.GetEnv() == b1.env_body.GetEnv()
 
-        collisions = self._cc.BodyVsBody(b0.env_body, b1.env_body)
-
-        col_val, jac01 = self._calc_grad_and_val(p0.name, p1.name, pose0, pose1, collisions)
-        # val = np.array([col_val])
-        val = col_val
-        jac = jac01
-        self._cache[flattened] = (val.copy(), jac.copy())
-        return val, jac
+        collisions = self._registry.body_vs_body(b0.env_body, b1.env_body, np.Inf)
+        return self._calc_grad_and_val(p0.name, p1.name, pose0, pose1, collisions)
 
 
     # @profile
@@ -194,10 +267,7 @@ class InContact(CollisionPredicate):
                                self.targ: self.lazy_spawn_or_body(self.targ, self.targ.name, self.targ.geom)}
 
         INCONTACT_COEFF = 1e1
-        f = lambda x: INCONTACT_COEFF*self.distance_from_obj(x)[0]
-        grad = lambda x: INCONTACT_COEFF*self.distance_from_obj(x)[1]
-
-        col_expr = Expr(f, grad)
+        col_expr = self._col_expr(INCONTACT_COEFF, INCONTACT_COEFF)
         val = np.ones((1, 1))*dsafe*INCONTACT_COEFF
         # val = np.zeros((1, 1))
         e = EqExpr(col_expr, val)
@@ -206,6 +276,9 @@ class InContact(CollisionPredicate):
     def test(self, time, negated=False):
         return super(CollisionPredicate, self).test(time, negated)
 
+    def _test_expr(self, negated):
+        return self.expr, negated
+
 class Collides(CollisionPredicate):
 
     # Collides Can Obstacle (wall)
@@ -218,23 +291,14 @@ class Collides(CollisionPredicate):
         self._param_to_body = {self.c: self.lazy_spawn_or_body(self.c, self.c.name, self.c.geom),
                                self.w: self.lazy_spawn_or_body(self.w, self.w.name, self.w.geom)}
 
-        f = lambda x: -self.distance_from_obj(x)[0]
-        grad = lambda x: -self.distance_from_obj(x)[1]
-
-        ## so we have an expr for the negated predicate
-        f_neg = lambda x: self.distance_from_obj(x)[0]
-        def grad_neg(x):
-            # print self.distance_from_obj(x)
-            return -self.distance_from_obj(x)[1]
-
-
         N_COLS = 8
 
-        col_expr = Expr(f, grad)
+        col_expr = self._col_expr(-1, -1)
         val = np.zeros((N_COLS,1))
         e = LEqExpr(col_expr, val)
 
-        col_expr_neg = Expr(f_neg, grad_neg)
+        ## so we have an expr for the negated predicate
+        col_expr_neg = self._col_expr(1, -1)
         self.neg_expr = LEqExpr(col_expr_neg, -val)
 
 
@@ -262,27 +326,13 @@ class RCollides(CollisionPredicate):
         self._param_to_body = {self.r: self.lazy_spawn_or_body(self.r, self.r.name, self.r.geom),
                                self.w: self.lazy_spawn_or_body(self.w, self.w.name, self.w.geom)}
 
-        f = lambda x: -self.distance_from_obj(x)[0]
-        grad = lambda x: -self.distance_from_obj(x)[1]
-
-        ## so we have an expr for the negated predicate
-        def f_neg(x):
-            d = self.distance_from_obj(x)[0]
-            # if d > 0:
-            #     import pdb; pdb.set_trace()
-            #     self.distance_from_obj(x)
-            return d
-
-        def grad_neg(x):
-            # print self.distance_from_obj(x)
-            return -self.distance_from_obj(x)[1]
-
         N_COLS = 8
-        col_expr = Expr(f, grad)
+        col_expr = self._col_expr(-1, -1)
         val = np.zeros((N_COLS,1))
         e = LEqExpr(col_expr, val)
 
-        col_expr_neg = Expr(f_neg, grad_neg)
+        ## so we have an expr for the negated predicate
+        col_expr_neg = self._col_expr(1, -1)
         self.neg_expr = LEqExpr(col_expr_neg, -val)
 
 
@@ -312,20 +362,12 @@ class Obstructs(CollisionPredicate):
 
         self.rs_scale = RS_SCALE
 
-        f = lambda x: -self.distance_from_obj(x)[0]
-        grad = lambda x: -self.distance_from_obj(x)[1]
-
-        ## so we have an expr for the negated predicate
-        f_neg = lambda x: self.distance_from_obj(x)[0]
-        def grad_neg(x):
-            # print self.distance_from_obj(x)
-            return self.distance_from_obj(x)[1]
-
-        col_expr = Expr(f, grad)
+        col_expr = self._col_expr(-1, -1)
         val = np.zeros((1,1))
         e = LEqExpr(col_expr, val)
 
-        col_expr_neg = Expr(f_neg, grad_neg)
+        ## so we have an expr for the negated predicate
+        col_expr_neg = self._col_expr(1, 1)
         self.neg_expr = LEqExpr(col_expr_neg, -val)
 
         super(Obstructs, self).__init__(name, e, attr_inds, params,
@@ -439,18 +481,12 @@ class ObstructsHolding(CollisionPredicate):
                                obstr: self.lazy_spawn_or_body(obstr, obstr.name, obstr.geom),
                                held: self.lazy_spawn_or_body(held, held.name, held.geom)}
 
-        f = lambda x: -self.distance_from_obj(x)[0]
-        grad = lambda x: -self.distance_from_obj(x)[1]
-
-        ## so we have an expr for the negated predicate
-        f_neg = lambda x: self.distance_from_obj(x)[0]
-        grad_neg = lambda x: self.distance_from_obj(x)[1]
-
-        col_expr = Expr(f, grad)
+        col_expr = self._col_expr(-1, -1)
         val = np.zeros((1,1))
         e = LEqExpr(col_expr, val)
 
-        col_expr_neg = Expr(f_neg, grad_neg)
+        ## so we have an expr for the negated predicate
+        col_expr_neg = self._col_expr(1, 1)
         self.neg_expr = LEqExpr(col_expr_neg, val)
 
         super(ObstructsHolding, self).__init__(name, e, attr_inds, params, expected_param_types)
@@ -483,20 +519,10 @@ class ObstructsHolding(CollisionPredicate):
 
     def distance_from_obj(self, x):
         # x = [rpx, rpy, obstrx, obstry, heldx, heldy]
-        self._cc.SetContactDistance(np.Inf)
-        b0 = self._param_to_body[self.r]
-        b1 = self._param_to_body[self.obstr]
-
         pose_r = x[0:2]
         pose_obstr = x[2:4]
 
-        b0.set_pose(pose_r)
-        b1.set_pose(pose_obstr)
-
-        assert b0.env_body.GetEnv() == b1.env_body.GetEnv()
-
-        collisions1 = self._cc.BodyVsBody(b0.env_body, b1.env_body)
-        col_val1, jac01 = self._calc_grad_and_val(self.r.name, self.obstr.name, pose_r, pose_obstr, collisions1)
+        col_val1, jac01 = self._pair_grad_and_val(self.r, self.obstr, pose_r, pose_obstr)
 
         if self.obstr.name == self.held.name:
             ## add dsafe to col_val1 b/c we're allowed to touch, but not intersect
@@ -506,12 +532,8 @@ class ObstructsHolding(CollisionPredicate):
             jac = jac01
 
         else:
-            b2 = self._param_to_body[self.held]
             pose_held = x[4:6]
-            b2.set_pose(pose_held)
-
-            collisions2 = self._cc.BodyVsBody(b2.env_body, b1.env_body)
-            col_val2, jac21 = self._calc_grad_and_val(self.held.name, self.obstr.name, pose_held, pose_obstr, collisions2)
+            col_val2, jac21 = self._pair_grad_and_val(self.held, self.obstr, pose_held, pose_obstr)
 
             if col_val1 > col_val2:
                 val = np.array(col_val1)
@@ -522,6 +544,18 @@ class ObstructsHolding(CollisionPredicate):
 
         return val, jac
 
+    def distance_from_obj_range(self, X):
+        vals1, jacs1 = self._pair_range(self.r, self.obstr, X[0:2], X[2:4])
+        if self.obstr.name == self.held.name:
+            return vals1 - (self.dsafe + 1e-3), jacs1
+        vals2, jacs2 = self._pair_range(self.held, self.obstr, X[4:6], X[2:4])
+        zeros = np.zeros(jacs1.shape[:2] + (2,))
+        first = (vals1 > vals2)[:, :, :1]
+        vals = np.where(first, vals1, vals2)
+        jacs = np.where(first, np.concatenate([jacs1, zeros], axis=2),
+                        np.concatenate([zeros, jacs2[:, :, 2:], jacs2[:, :, :2]], axis=2))
+        return vals, jacs
+
 class InGripper(ExprPredicate):
 
     # InGripper, Robot, Can, Grasp
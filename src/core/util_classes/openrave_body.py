@@ -5,15 +5,69 @@ from openravepy import quatFromAxisAngle, matrixFromPose, poseFromMatrix, \
 axisAngleFromRotationMatrix, KinBody, GeometryType, RaveCreateRobot, \
 RaveCreateKinBody, TriMesh, Environment, DOFAffine, IkParameterization, IkParameterizationType, \
 IkFilterOptions, matrixFromAxisAngle
+import threading
+import os
 from core.util_classes.robots import Robot, PR2, Baxter
 from core.util_classes.box import Box
 from core.util_classes.can import Can, BlueCan, RedCan
 from core.util_classes.circle import Circle, BlueCircle, RedCircle, GreenCircle
 from core.util_classes.obstacle import Obstacle
-from core.util_classes.wall import Wall
+from core.util_classes.wall import Wall, wall_boxes, WALL_THICKNESS
 from core.util_classes.table import Table
+from core.util_classes import collision_meshes
+
+# Robot models parsed so far, by model file, in a private environment. Robots
+# are cloned from these instead of reading and parsing the XML and meshes of
+# the model again for every new environment.
+_template_env = []
+_robot_templates = {}
+_robot_bound_radii = {}
+_robot_templates_lock = threading.Lock()
+
+def _template_key(geom):
+    return (os.path.abspath(geom.shape), collision_meshes.CONVEX_COLLISION_MESHES)
+
+def get_robot_template(geom):
+    """
+    Returns the robot parsed from the model file of the robot geometry geom,
+    reading it the first time it is requested in this process.
+    """
+    key = _template_key(geom)
+    with _robot_templates_lock:
+        if key not in _robot_templates:
+            if not _template_env:
+                _template_env.append(Environment())
+            env = _template_env[0]
+            with env:
+                robot = env.ReadRobotXMLFile(geom.shape)
+                if collision_meshes.CONVEX_COLLISION_MESHES:
+                    collision_meshes.load_collision_meshes(robot, geom)
+                robot.SetName('template_{}'.format(len(_robot_templates)))
+                env.Add(robot)
+            _robot_templates[key] = robot
+        return _robot_templates[key]
+
+def get_robot_bound_radius(geom):
+    """
+    Radius of a sphere around the base of the robot geometry geom containing
+    every link in any joint configuration, computed once per model from the
+    link AABBs of its template (see chain_bound_radius).
+    """
+    key = _template_key(geom)
+    template = get_robot_template(geom)
+    with _robot_templates_lock:
+        if key not in _robot_bound_radii:
+            with template.GetEnv():
+                _robot_bound_radii[key] = OpenRAVEBody.chain_bound_radius(template)
+        return _robot_bound_radii[key]
+
+def clear_robot_templates():
+    with _robot_templates_lock:
+        _robot_templates.clear()
+        _robot_bound_radii.clear()
+        if _template_env:
+            _template_env.pop().Destroy()
 
-WALL_THICKNESS = 1
 
 class OpenRAVEBody(object):
     def __init__(self, env, name, geom):
@@ -21,6 +75,12 @@ class OpenRAVEBody(object):
         self.name = name
         self._env = env
         self._geom = geom
+        # Last transform, DOF values and active DOFs pushed to OpenRAVE, valid
+        # while the update stamp of the body is the one after our last change
+        self._transform = None
+        self._dof_values = None
+        self._active_dofs = None
+        self._stamp = None
 
         if env.GetKinBody(name) == None and env.GetRobot(name) == None:
             if isinstance(geom, Circle):
@@ -115,7 +175,10 @@ class OpenRAVEBody(object):
         self._env.Add(self.env_body)
 
     def _add_robot(self, geom):
-        self.env_body = self._env.ReadRobotXMLFile(geom.shape)
+        template = get_robot_template(geom)
+        self.env_body = RaveCreateRobot(self._env, template.GetXMLId())
+        with template.GetEnv():
+            self.env_body.Clone(template, 0)
         self.env_body.SetName(self.name)
         self._env.Add(self.env_body)
         geom.setup(self.env_body)
@@ -133,7 +196,12 @@ class OpenRAVEBody(object):
             trans = OpenRAVEBody.base_pose_to_mat(base_pose)
         elif isinstance(self._geom, Table) or isinstance(self._geom, Can) or isinstance(self._geom, Box):
             trans = OpenRAVEBody.transform_from_obj_pose(base_pose, rotation)
+        self._check_stamp()
+        if self._transform is not None and np.array_equal(trans, self._transform):
+            return
         self.env_body.SetTransform(trans)
+        self._transform = trans
+        self._stamp = self.env_body.GetUpdateStamp()
 
     def set_dof(self, dof_value_map):
         """
@@ -142,13 +210,45 @@ class OpenRAVEBody(object):
         # make sure only sets dof for robot
         assert isinstance(self._geom, Robot)
         # Get current dof value for each joint
-        dof_val = self.env_body.GetActiveDOFValues()
+        self._check_stamp()
+        if self._dof_values is None:
+            self._dof_values = self.env_body.GetDOFValues()
+        dof_val = self._dof_values.copy()
 
         for k, v in dof_value_map.iteritems():
             inds = self._geom.dof_map[k]
             dof_val[inds] = v
-        # Set new DOF value to the robot
-        self.env_body.SetActiveDOFValues(dof_val)
+        if np.array_equal(dof_val, self._dof_values):
+            return
+        # Set new DOF value to the robot, dof_map indexes all the DOFs
+        self.env_body.SetDOFValues(dof_val)
+        self._dof_values = dof_val
+        self._stamp = self.env_body.GetUpdateStamp()
+
+    def _check_stamp(self):
+        """
+        Forgets the transform and DOF values pushed last if the body was
+        moved since by someone else.
+        """
+        if self._stamp is None or self.env_body.GetUpdateStamp() != self._stamp:
+            self._transform = None
+            self._dof_values = None
+            self._stamp = None
+
+    def set_active_dofs(self, inds, affine = 0, rotation_axis = [0, 0, 1]):
+        """
+        SetActiveDOFs for the robot, unless these are its active DOFs already.
+        """
+        robot = self.env_body
+        key = (tuple(int(i) for i in inds), int(affine), tuple(rotation_axis) if affine else ())
+        if self._active_dofs == key and robot.GetAffineDOF() == key[1] and \
+                tuple(robot.GetActiveDOFIndices()) == key[0]:
+            return
+        if affine:
+            robot.SetActiveDOFs(inds, affine, rotation_axis)
+        else:
+            robot.SetActiveDOFs(inds)
+        self._active_dofs = key
 
     def _set_active_dof_inds(self, inds = None):
         """
@@ -165,12 +265,9 @@ class OpenRAVEBody(object):
             dof_inds = np.r_[dof_inds, robot.GetManipulator("leftarm").GetGripperIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetArmIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetGripperIndices()]
-            robot.SetActiveDOFs(
-                                dof_inds,
-                                DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis,
-                                [0, 0, 1])
+            self.set_active_dofs(dof_inds, DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis)
         else:
-            robot.SetActiveDOFs(inds)
+            self.set_active_dofs(inds)
 
     @staticmethod
     def create_cylinder(env, body_name, t, dims, color=[0, 1, 1]):
@@ -203,35 +300,41 @@ class OpenRAVEBody(object):
         infobox._vDiffuseColor = color
         return infobox
 
+    @staticmethod
+    def chain_bound_radius(robot):
+        """
+        Bound on the distance from the origin of robot to any of its links
+        over all joint configurations. Each link is within the sum of the
+        distances between the joint anchors of its chain from the root (plus
+        the travel of prismatic joints), and the farthest corner of its AABB
+        from the last anchor.
+        """
+        origin = robot.GetTransform()[:3, 3]
+        radius = 0.
+        for link in robot.GetLinks():
+            pt, reach = origin, 0.
+            if link.GetIndex() != 0:
+                for joint in robot.GetChain(0, link.GetIndex()):
+                    anchor = joint.GetAnchor()
+                    reach += np.linalg.norm(anchor - pt)
+                    if joint.GetDOF() > 0 and joint.IsPrismatic(0):
+                        lower, upper = joint.GetLimits()
+                        reach += np.max(upper - lower)
+                    pt = anchor
+            aabb = link.ComputeAABB()
+            corner = np.abs(aabb.pos() - pt) + aabb.extents()
+            radius = max(radius, reach + np.linalg.norm(corner))
+        return radius
+
     @staticmethod
     def create_wall(env, wall_type):
         component_type = KinBody.Link.GeomType.Box
         wall_color = [0.5, 0.2, 0.1]
         box_infos = []
-        if wall_type == 'closet':
-            wall_endpoints = [[-1.0,-3.0],[-1.0,4.0],[1.9,4.0],[1.9,8.0],[5.0,8.0],[5.0,4.0],[8.0,4.0],[8.0,-3.0],[-1.0,-3.0]]
-        else:
-            raise NotImplemented
-        for i, (start, end) in enumerate(zip(wall_endpoints[0:-1], wall_endpoints[1:])):
-            dim_x, dim_y = 0, 0
-            thickness = WALL_THICKNESS
-            if start[0] == end[0]:
-                ind_same, ind_diff = 0, 1
-                length = abs(start[ind_diff] - end[ind_diff])
-                dim_x, dim_y = thickness, length/2 + thickness
-            elif start[1] == end[1]:
-                ind_same, ind_diff = 1, 0
-                length = abs(start[ind_diff] - end[ind_diff])
-                dim_x, dim_y = length/2 + thickness, thickness
-            else:
-                raise NotImplemented, 'Can only create axis-aligned walls'
-
+        centers, half_extents = wall_boxes(wall_type)
+        for center, (dim_x, dim_y) in zip(centers, half_extents):
             transform = np.eye(4)
-            transform[ind_same, 3] = start[ind_same]
-            if start[ind_diff] < end[ind_diff]:
-                transform[ind_diff, 3] = start[ind_diff] + length/2
-            else:
-                transform[ind_diff, 3] = end[ind_diff] + length/2
+            transform[:2, 3] = center
             dims = [dim_x, dim_y, 1]
             box_info = OpenRAVEBody.create_body_info(component_type, dims, wall_color)
             box_info._t = transform
@@ -242,47 +345,17 @@ class OpenRAVEBody(object):
 
     @staticmethod
     def create_table(env, geom):
-        thickness = geom.thickness
-        leg_height = geom.leg_height
-        back = geom.back
-        dim1, dim2 = geom.table_dim
-        legdim1, legdim2 = geom.leg_dim
-
         table_color = [0.5, 0.2, 0.1]
         component_type = KinBody.Link.GeomType.Box
-        tabletop = OpenRAVEBody.create_body_info(component_type, [dim1/2, dim2/2, thickness/2], table_color)
-
-        leg1 = OpenRAVEBody.create_body_info(component_type, [legdim1/2, legdim2/2, leg_height/2], table_color)
-        leg1._t[0, 3] = dim1/2 - legdim1/2
-        leg1._t[1, 3] = dim2/2 - legdim2/2
-        leg1._t[2, 3] = -leg_height/2 - thickness/2
-
-        leg2 = OpenRAVEBody.create_body_info(component_type, [legdim1/2, legdim2/2, leg_height/2], table_color)
-        leg2._t[0, 3] = dim1/2 - legdim1/2
-        leg2._t[1, 3] = -dim2/2 + legdim2/2
-        leg2._t[2, 3] = -leg_height/2 - thickness/2
-
-        leg3 = OpenRAVEBody.create_body_info(component_type, [legdim1/2, legdim2/2, leg_height/2], table_color)
-        leg3._t[0, 3] = -dim1/2 + legdim1/2
-        leg3._t[1, 3] = dim2/2 - legdim2/2
-        leg3._t[2, 3] = -leg_height/2 - thickness/2
-
-        leg4 = OpenRAVEBody.create_body_info(component_type, [legdim1/2, legdim2/2, leg_height/2], table_color)
-        leg4._t[0, 3] = -dim1/2 + legdim1/2
-        leg4._t[1, 3] = -dim2/2 + legdim2/2
-        leg4._t[2, 3] = -leg_height/2 - thickness/2
-
-        if back:
-            back_plate = OpenRAVEBody.create_body_info(component_type, [legdim1/10, dim2/2, leg_height-thickness/2], table_color)
-            back_plate._t[0, 3] = dim1/2 - legdim1/10
-            back_plate._t[1, 3] = 0
-            back_plate._t[2, 3] = -leg_height/2 - thickness/4
+        box_infos = []
+        # tabletop, legs and back plate
+        for center, half_extents in zip(*geom.get_boxes()):
+            box_info = OpenRAVEBody.create_body_info(component_type, list(half_extents), table_color)
+            box_info._t[:3, 3] = center
+            box_infos.append(box_info)
 
         table = RaveCreateRobot(env, '')
-        if not back:
-            table.InitFromGeometries([tabletop, leg1, leg2, leg3, leg4])
-        else:
-            table.InitFromGeometries([tabletop, leg1, leg2, leg3, leg4, back_plate])
+        table.InitFromGeometries(box_infos)
         return table
 
     @staticmethod
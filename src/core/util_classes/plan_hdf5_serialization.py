@@ -1,3 +1,4 @@
+import copy
 import h5py
 import importlib
 import os
@@ -8,6 +9,7 @@ from openravepy import Environment
 from core.internal_repr.action import Action
 from core.internal_repr.parameter import Object, Symbol
 from core.internal_repr.plan import Plan
+from core.internal_repr.plan_state import PackedPlanState
 from core.util_classes.robots import Baxter, PR2
 
 class PlanSerializer:
@@ -21,8 +23,13 @@ class PlanSerializer:
         action_group = plan_group.create_group('actions')
         param_group = plan_group.create_group('params')
 
+        ## packed trajectories are only written once, in the state buffer
+        state = plan.packed_state
+        if state is not None:
+            state.write_to_hdf5(plan_group.create_group('packed_state'))
+
         for param in plan.params.values():
-            self._add_param_to_group(param_group, param)
+            self._add_param_to_group(param_group, param, state)
 
         for action in plan.actions:
             self._add_action_to_group(action_group, action)
@@ -61,7 +68,7 @@ class PlanSerializer:
             param_types_dset[i] = pred.params[i].get_type()
 
 
-    def _add_param_to_group(self, group, param):
+    def _add_param_to_group(self, group, param, state=None):
         param_group = group.create_group(param.name)
         param_group['name'] = param.name
 
@@ -77,7 +84,7 @@ class PlanSerializer:
             param.openrave_body = None
 
         try:
-            param_group['data'] = pickle.dumps(param)
+            param_group['data'] = pickle.dumps(self._strip_packed_attrs(param, state))
         except pickle.PicklingError:
             print "Could not pickle {0}.".format(param.name)
 
@@ -88,6 +95,24 @@ class PlanSerializer:
             param.openrave_body = or_body
 
 
+    def _strip_packed_attrs(self, param, state):
+        """
+        Returns a copy of param without the attributes (and free masks)
+        stored in state, or param itself if none are.
+        """
+        if state is None:
+            return param
+        attrs = [attr for name, attr in state.layout.keys()
+                 if name == param.name and state.is_bound(name, attr)]
+        if not len(attrs):
+            return param
+        stripped = copy.copy(param)
+        for attr in attrs:
+            del stripped.__dict__[attr]
+            stripped._free_attrs.pop(attr, None)
+        return stripped
+
+
     def _add_geom_to_group(self, group, geom):
         geom_group = group.create_group('geom')
         geom_group['class_path'] = str(type(geom)).split("'")[1]
@@ -122,11 +147,18 @@ class PlanDeserializer:
             new_param = self._build_param(param)
             params[new_param.name] = new_param
 
+        ## the packed attributes are views into the stored state buffer
+        state = None
+        if 'packed_state' in group:
+            state = PackedPlanState.from_hdf5(group['packed_state'], params)
+
         actions = []
         for action in group['actions'].values():
             actions.append(self._build_action(action, params, env))
 
-        return Plan(params, actions, group['horizon'].value, env, determine_free=False)
+        plan = Plan(params, actions, group['horizon'].value, env, determine_free=False)
+        plan.packed_state = state
+        return plan
 
 
     def _build_action(self, group, plan_params, env):
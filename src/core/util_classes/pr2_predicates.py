@@ -299,31 +299,19 @@ class PR2EEReachable(robot_predicates.EEReachable):
         else:
             return rel_step*np.array([0, 0, const.RETREAT_DIST])
 
-    def stacked_f(self, x):
-        i = 0
-        f_res = []
-        start, end = self.active_range
-        for s in range(start, end+1):
-            rel_pt = self.get_rel_pt(s)
-            f_res.append(self.ee_pose_check_rel_obj(x[i:i+self.attr_dim], rel_pt)[0])
-            i += self.attr_dim
-        return np.vstack(tuple(f_res))
-
-    def stacked_grad(self, x):
-        f_grad = []
-        start, end = self.active_range
-        t = (2*self._steps+1)
-        k = 3
-
-        grad = np.zeros((k*t, self.attr_dim*t))
-        i = 0
-        j = 0
-        for s in range(start, end+1):
-            rel_pt = self.get_rel_pt(s)
-            grad[j:j+k, i:i+self.attr_dim] = self.ee_pose_check_rel_obj(x[i:i+self.attr_dim], rel_pt)[1]
-            i += self.attr_dim
-            j += k
-        return grad
+    def stack_ee_jac(self, robot_pos, arm_jac, obj_jac):
+        """
+            Batched jacobians (n, 3, 26) of pos_error_rel_to_obj for the
+            (n, 3) gripper positions, joint and object jacobians
+        """
+        n = len(robot_pos)
+        dist_jac = np.zeros((n, 3, self.attr_dim))
+        dist_jac[:, :, :3] = np.eye(3)
+        dist_jac[:, :, 2] = np.cross([0, 0, 1], robot_pos - self.x[:3])
+        dist_jac[:, 2, 3] = 1
+        dist_jac[:, :, 12:19] = arm_jac
+        dist_jac[:, :, 20:26] = obj_jac
+        return dist_jac
 
 class PR2EEReachablePos(PR2EEReachable):
 
@@ -382,7 +370,7 @@ class PR2Obstructs(robot_predicates.Obstructs):
     def set_active_dof_inds(self, robot_body, reset = False):
         robot = robot_body.env_body
         if reset == True and self.dof_cache != None:
-            robot.SetActiveDOFs(self.dof_cache)
+            robot_body.set_active_dofs(self.dof_cache)
             self.dof_cache = None
         elif reset == False and self.dof_cache == None:
             self.dof_cache = robot.GetActiveDOFIndices()
@@ -392,10 +380,7 @@ class PR2Obstructs(robot_predicates.Obstructs):
             dof_inds = np.r_[dof_inds, robot.GetManipulator("leftarm").GetGripperIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetArmIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetGripperIndices()]
-            robot.SetActiveDOFs(
-                    dof_inds,
-                    DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis,
-                    [0, 0, 1])
+            robot_body.set_active_dofs(dof_inds, DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis, [0, 0, 1])
         else:
             raise PredicateException("Incorrect Active DOF Setting")
 
@@ -422,7 +407,7 @@ class PR2ObstructsHolding(robot_predicates.ObstructsHolding):
     def set_active_dof_inds(self, robot_body, reset = False):
         robot = robot_body.env_body
         if reset == True and self.dof_cache != None:
-            robot.SetActiveDOFs(self.dof_cache)
+            robot_body.set_active_dofs(self.dof_cache)
             self.dof_cache = None
         elif reset == False and self.dof_cache == None:
             self.dof_cache = robot.GetActiveDOFIndices()
@@ -433,10 +418,7 @@ class PR2ObstructsHolding(robot_predicates.ObstructsHolding):
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetArmIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetGripperIndices()]
             # dof_inds = [12]+ list(range(15, 22)) + [22]+ list(range(27, 34)) + [34]
-            robot.SetActiveDOFs(
-                    dof_inds,
-                    DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis,
-                    [0, 0, 1])
+            robot_body.set_active_dofs(dof_inds, DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis, [0, 0, 1])
         else:
             raise PredicateException("Incorrect Active DOF Setting")
 
@@ -480,7 +462,7 @@ class PR2RCollides(robot_predicates.RCollides):
     def set_active_dof_inds(self, robot_body, reset = False):
         robot = robot_body.env_body
         if reset == True and self.dof_cache != None:
-            robot.SetActiveDOFs(self.dof_cache)
+            robot_body.set_active_dofs(self.dof_cache)
             self.dof_cache = None
         elif reset == False and self.dof_cache == None:
             self.dof_cache = robot.GetActiveDOFIndices()
@@ -490,10 +472,7 @@ class PR2RCollides(robot_predicates.RCollides):
             dof_inds = np.r_[dof_inds, robot.GetManipulator("leftarm").GetGripperIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetArmIndices()]
             dof_inds = np.r_[dof_inds, robot.GetManipulator("rightarm").GetGripperIndices()]
-            robot.SetActiveDOFs(
-                    dof_inds,
-                    DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis,
-                    [0, 0, 1])
+            robot_body.set_active_dofs(dof_inds, DOFAffine.X + DOFAffine.Y + DOFAffine.RotationAxis, [0, 0, 1])
         else:
             raise PredicateException("Incorrect Active DOF Setting")
 
@@ -1,6 +1,12 @@
-from core.util_classes.common_predicates import ExprPredicate
+from core.util_classes.common_predicates import ExprPredicate, last_point_memo
 from core.util_classes.openrave_body import OpenRAVEBody
 from core.util_classes.sampling import get_expr_mult
+from core.util_classes.collision_cache import get_collision_cache
+from core.util_classes.bounding import bounding_radius, spheres_apart
+from core.util_classes.kinematics_cache import get_kinematics_cache
+from core.util_classes.arm_kinematics import rotations
+from core.util_classes.contacts import contact_arrays, directional_point_jacobians, rotation_jacobians
+from core.util_classes.sphere_tree import SPHERES, get_collision_fidelity, get_sphere_tree, sphere_contacts
 import core.util_classes.common_constants as const
 from sco.expr import Expr, AffExpr, EqExpr, LEqExpr
 from errors_exceptions import PredicateException
@@ -15,12 +21,11 @@ class CollisionPredicate(ExprPredicate):
         self._debug = debug
         # if self._debug:
         #     self._env.SetViewer("qtcoin")
-        self._cc = ctrajoptpy.GetCollisionChecker(self._env)
         self.dsafe = dsafe
         self.ind0 = ind0
         self.ind1 = ind1
         self._plot_handles = []
-        self._cache = {}
+        self._cache = get_collision_cache()
         super(CollisionPredicate, self).__init__(name, e, attr_inds, params, expected_param_types, tol=tol)
 
     def robot_obj_collision(self, x):
@@ -32,32 +37,36 @@ class CollisionPredicate(ExprPredicate):
         """
         # Parse the pose value
         self._plot_handles = []
-        flattened = tuple(x.round(5).flatten())
+        key = self._cache.make_key('robot_obj', [self.params[self.ind0], self.params[self.ind1]], x, 5, self.dsafe, self.attr_dim, get_collision_fidelity())
         # cache prevents plotting
-        if flattened in self._cache and not self._debug:
-            return self._cache[flattened]
+        if not self._debug:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
 
-        # Set pose of each rave body
         robot = self.params[self.ind0]
+        obj = self.params[self.ind1]
+        can_pos, can_rot = x[-6:-3], x[-3:]
+        # Broad phase, far apart bodies have no contacts
+        if not self._debug and self._robot_obj_apart(x, obj, can_pos):
+            return self._no_contact_grad_and_val()
+
+        # Set pose of each rave body
         robot_body = self._param_to_body[robot]
         self.set_robot_poses(x, robot_body)
 
-        obj = self.params[self.ind1]
         obj_body = self._param_to_body[obj]
-        can_pos, can_rot = x[-6:-3], x[-3:]
         obj_body.set_pose(can_pos, can_rot)
 
         # Make sure two body is in the same environment
         assert robot_body.env_body.GetEnv() == obj_body.env_body.GetEnv()
         self.set_active_dof_inds(robot_body, reset=False)
-        # Setup collision checkers
-        self._cc.SetContactDistance(const.MAX_CONTACT_DISTANCE)
-        collisions = self._cc.BodyVsBody(robot_body.env_body, obj_body.env_body)
+        contacts = self._robot_contacts(robot_body, obj_body)
         # Calculate value and jacobian
-        col_val, col_jac = self._calc_grad_and_val(robot_body, obj_body, collisions)
+        col_val, col_jac = self._calc_grad_and_val(robot_body, obj_body, contacts)
         # set active dof value back to its original state (For successive function call)
         self.set_active_dof_inds(robot_body, reset=True)
-        self._cache[flattened] = (col_val.copy(), col_jac.copy())
+        self._cache.put(key, (col_val, col_jac))
         return col_val, col_jac
 
     def obj_obj_collision(self, x):
@@ -69,10 +78,12 @@ class CollisionPredicate(ExprPredicate):
             CanPose->CanRot->ObstaclePose->ObstacleRot
         """
         self._plot_handles = []
-        flattened = tuple(x.round(5).flatten())
+        key = self._cache.make_key('obj_obj', [self.params[self.ind0], self.params[self.ind1]], x, 5, self.dsafe)
         # cache prevents plotting
-        if flattened in self._cache and not self._debug:
-            return self._cache[flattened]
+        if not self._debug:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
 
         # Parse the pose value
         can_pos, can_rot = x[:3], x[3:6]
@@ -86,13 +97,10 @@ class CollisionPredicate(ExprPredicate):
         obstr_body.set_pose(obstr_pos, obstr_rot)
         # Make sure two body is in the same environment
         assert can_body.env_body.GetEnv() == obstr_body.env_body.GetEnv()
-        # Setup collision checkers
-        # self._cc.SetContactDistance(const.MAX_CONTACT_DISTANCE)
-        self._cc.SetContactDistance(np.inf)
-        collisions = self._cc.BodyVsBody(can_body.env_body, obstr_body.env_body)
+        collisions = self._registry.body_vs_body(can_body.env_body, obstr_body.env_body, np.inf)
         # Calculate value and jacobian
         col_val, col_jac = self._calc_obj_grad_and_val(can_body, obstr_body, collisions)
-        self._cache[flattened] = (col_val.copy(), col_jac.copy())
+        self._cache.put(key, (col_val, col_jac))
         return col_val, col_jac
 
     def robot_obj_held_collision(self, x):
@@ -103,114 +111,140 @@ class CollisionPredicate(ExprPredicate):
             BasePose->BackHeight->LeftArmPose->LeftGripper->RightArmPose->RightGripper->CanPose->CanRot->HeldPose->HeldRot
         """
         self._plot_handles = []
-        flattened = tuple(x.round(5).flatten())
+        key = self._cache.make_key('robot_obj_held', [self.params[self.ind0], self.params[self.ind1], self.held], x, 5, self.dsafe, self.attr_dim, get_collision_fidelity())
         # cache prevents plotting
-        if flattened in self._cache and not self._debug:
-            return self._cache[flattened]
+        if not self._debug:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
 
         robot = self.params[self.ind0]
         robot_body = self._param_to_body[robot]
-        self.set_robot_poses(x, robot_body)
 
         can_pos, can_rot = x[-12:-9], x[-9:-6]
         held_pose, held_rot = x[-6:-3], x[-3:]
 
         obj = self.params[self.ind1]
         obj_body = self._param_to_body[obj]
-        obj_body.set_pose(can_pos, can_rot)
-        self.set_active_dof_inds(robot_body, reset=False)
-        self._cc.SetContactDistance(const.MAX_CONTACT_DISTANCE)
-        # setup collision between robot and obstruct
-        collisions1 = self._cc.BodyVsBody(robot_body.env_body, obj_body.env_body)
-        col_val1, col_jac1 = self._calc_grad_and_val(robot_body, obj_body, collisions1)
+        # Broad phase, far apart bodies have no contacts
+        if not self._debug and self._robot_obj_apart(x, obj, can_pos):
+            col_val1, col_jac1 = self._no_contact_grad_and_val()
+        else:
+            obj_body.set_pose(can_pos, can_rot)
+            self.set_robot_poses(x, robot_body)
+            self.set_active_dof_inds(robot_body, reset=False)
+            # setup collision between robot and obstruct
+            contacts1 = self._robot_contacts(robot_body, obj_body)
+            col_val1, col_jac1 = self._calc_grad_and_val(robot_body, obj_body, contacts1)
+            self.set_active_dof_inds(robot_body, reset=True)
         num_links = len(robot.geom.col_links)
         col_jac1 = np.c_[col_jac1, np.zeros((num_links,6))]
         # find collision between object and object held
+        obj_body.set_pose(can_pos, can_rot)
         held_body = self._param_to_body[self.held]
         held_body.set_pose(held_pose, held_rot)
-        self._cc.SetContactDistance(np.inf)
-        collisions2 = self._cc.BodyVsBody(held_body.env_body, obj_body.env_body)
+        collisions2 = self._registry.body_vs_body(held_body.env_body, obj_body.env_body, np.inf)
         col_val2, col_jac2 = self._calc_obj_grad_and_val(held_body, obj_body, collisions2)
         col_jac2 = np.c_[np.zeros((1, self.attr_dim)), col_jac2]
         # Stack these val and jac, and return
         val = np.vstack((col_val1, col_val2))
         jac = np.vstack((col_jac1, col_jac2))
-        self.set_active_dof_inds(robot_body, reset=True)
-        self._cache[flattened] = (val.copy(), jac.copy())
+        self._cache.put(key, (val, jac))
         return val, jac
 
-    def _calc_grad_and_val(self, robot_body, obj_body, collisions):
+    def _robot_base_pos(self, x):
+        """
+            Position of the robot base for the pose values in x. A robot pose
+            of (x, y, rot) places the base at (x, y, 0), a rotation only pose
+            keeps it at the origin (see OpenRAVEBody.set_pose)
+        """
+        base = np.zeros(3)
+        robot = self.params[self.ind0]
+        for p, attr, rows, offsets, dst, t_mask in self.get_gather_inds():
+            if p is robot and attr == 'pose' and len(rows) == 3:
+                base[:2] = np.asarray(x)[dst[:2]].flatten()
+        return base
+
+    def _robot_obj_apart(self, x, obj, obj_pos):
+        """
+            Broad phase of robot_obj_collision: True if the bounding spheres of
+            the robot and obj are too far apart for the collision checker to
+            report any contact
+        """
+        robot = self.params[self.ind0]
+        return spheres_apart(self._robot_base_pos(x), bounding_radius(robot.geom),
+                             obj_pos, bounding_radius(obj.geom), const.MAX_CONTACT_DISTANCE)
+
+    def _no_contact_grad_and_val(self):
+        """
+            Value and jacobian of _calc_grad_and_val when there are no contacts
+        """
+        num_links = len(self.params[self.ind0].geom.col_links)
+        vals = (self.dsafe - const.MAX_CONTACT_DISTANCE)*np.ones((num_links, 1))
+        self.links = []
+        return vals, np.zeros((num_links, self.attr_dim+6))
+
+    def _robot_contacts(self, robot_body, obj_body):
+        """
+            Contacts (see contacts.contact_arrays) between the robot links and obj_body
+            within MAX_CONTACT_DISTANCE, from the link meshes, or from the sphere trees
+            of the bodies when the collision fidelity is SPHERES
+        """
+        if get_collision_fidelity() == SPHERES:
+            col_links = self.params[self.ind0].geom.col_links
+            robot_tree = get_sphere_tree(robot_body.env_body, col_links)
+            obj_tree = get_sphere_tree(obj_body.env_body)
+            return sphere_contacts(robot_tree, robot_body.env_body, obj_tree, obj_body.env_body,
+                                   const.MAX_CONTACT_DISTANCE)
+        collisions = self._registry.body_vs_body(robot_body.env_body, obj_body.env_body, const.MAX_CONTACT_DISTANCE)
+        return contact_arrays(collisions, robot_body.name, obj_body.name)
+
+    def _calc_grad_and_val(self, robot_body, obj_body, contacts):
         """
             This function is helper function of robot_obj_collision(self, x)
             It calculates collision distance and gradient between each robot's link and object
 
             robot_body: OpenRAVEBody containing body information of pr2 robot
             obj_body: OpenRAVEBody containing body information of object
-            collisions: list of collision objects returned by collision checker
+            contacts: contact arrays returned by _robot_contacts
             Note: Needs to provide attr_dim indicating robot pose's total attribute dim
         """
         # Initialization
-        links = []
         robot = self.params[self.ind0]
         col_links = robot.geom.col_links
         num_links = len(col_links)
         obj_pos = OpenRAVEBody.obj_pose_from_transform(obj_body.env_body.GetTransform())
         Rz, Ry, Rx = OpenRAVEBody._axis_rot_matrices(obj_pos[:3], obj_pos[3:])
         rot_axises = [[0,0,1], np.dot(Rz, [0,1,0]),  np.dot(Rz, np.dot(Ry, [1,0,0]))]
-        for c in collisions:
-            # Identify the collision points
-            linkA, linkB = c.GetLinkAName(), c.GetLinkBName()
-            linkAParent, linkBParent = c.GetLinkAParentName(), c.GetLinkBParentName()
-            linkRobot, linkObj = None, None
-            sign = 0
-            if linkAParent == robot_body.name and linkBParent == obj_body.name:
-                ptRobot, ptObj = c.GetPtA(), c.GetPtB()
-                linkRobot, linkObj = linkA, linkB
-                sign = -1
-            elif linkBParent == robot_body.name and linkAParent == obj_body.name:
-                ptRobot, ptObj = c.GetPtB(), c.GetPtA()
-                linkRobot, linkObj = linkB, linkA
-                sign = 1
-            else:
-                continue
-            if linkRobot not in col_links:
-                continue
-            # Obtain distance between two collision points, and their normal collision vector
-            distance = c.GetDistance()
-            normal = c.GetNormal()
+        # Pull the contacts of robot links into arrays
+        link_names, _, ptRobot, ptObj, distance, normal, sign = contacts
+        keep = np.array([l in col_links for l in link_names], dtype=bool)
+        robot = robot_body.env_body
+        link_ind = dict((l, robot.GetLink(l).GetIndex()) for l in set(link_names))
+        link_inds = np.array([link_ind[l] for l in link_names], dtype=np.int)[keep]
+        ptRobot, ptObj, distance, normal, sign = ptRobot[keep], ptObj[keep], distance[keep], normal[keep], sign[keep]
+        # arrange contacts in proper link order
+        order = np.argsort(link_inds, kind='mergesort')
+        link_inds, ptRobot, ptObj, distance, normal, sign = link_inds[order], ptRobot[order], ptObj[order], distance[order], normal[order], sign[order]
+        n_contacts = len(link_inds)
+        grads = np.zeros((n_contacts, self.attr_dim+6))
+        if n_contacts:
             # Calculate robot jacobian
-            robot = robot_body.env_body
-            robot_link_ind = robot.GetLink(linkRobot).GetIndex()
-            robot_jac = robot.CalculateActiveJacobian(robot_link_ind, ptRobot)
-            grad = np.zeros((1, self.attr_dim+6))
-            grad[:, :self.attr_dim] = np.dot(sign * normal, robot_jac)
-            # robot_grad = np.dot(sign * normal, robot_jac).reshape((1,20))
-            col_vec = -sign*normal
-            # Calculate object pose jacobian
-            # obj_jac = np.array([-sign*normal])
-            grad[:, self.attr_dim:self.attr_dim+3] = np.array([-sign*normal])
-            torque = ptObj - obj_pos[:3]
-            # Calculate object rotation jacobian
-            rot_vec = np.array([[np.dot(np.cross(axis, torque), col_vec) for axis in rot_axises]])
-            # obj_jac = np.c_[obj_jac, rot_vec]
-            grad[:, self.attr_dim+3:self.attr_dim+6] = rot_vec
-            # Constructing gradient matrix
-            # robot_grad = np.c_[robot_grad, obj_jac]
-            # TODO: remove robot.GetLink(linkRobot) from links (added for debugging purposes)
-            # links.append((robot_link_ind, self.dsafe - distance, robot_grad, robot.GetLink(linkRobot)))
-            links.append((robot_link_ind, self.dsafe - distance, grad, robot.GetLink(linkRobot)))
-
-            if self._debug:
-                self.plot_collision(ptRobot, ptObj, distance)
-
-        # arrange gradients in proper link order
+            grads[:, :self.attr_dim] = directional_point_jacobians(robot, link_inds, ptRobot, sign[:, None]*normal)
+            col_vec = -sign[:, None]*normal
+            # Calculate object pose and rotation jacobian
+            grads[:, self.attr_dim:self.attr_dim+3] = col_vec
+            grads[:, self.attr_dim+3:self.attr_dim+6] = rotation_jacobians(rot_axises, ptObj - obj_pos[:3], col_vec)
+
+        if self._debug:
+            for i in range(n_contacts):
+                self.plot_collision(ptRobot[i], ptObj[i], distance[i])
+
         max_dist = self.dsafe - const.MAX_CONTACT_DISTANCE
         vals, robot_grads = max_dist*np.ones((num_links,1)), np.zeros((num_links, self.attr_dim+6))
-        links = sorted(links, key = lambda x: x[0])
-        vals[:len(links),0] = np.array([link[1] for link in links])
-        robot_grads[:len(links), range(self.attr_dim+6)] = np.array([link[2] for link in links]).reshape((len(links), self.attr_dim+6))
-        # TODO: remove line below which was added for debugging purposes
-        self.links = links
+        vals[:n_contacts,0] = self.dsafe - distance
+        robot_grads[:n_contacts] = grads
+        self.links = zip(link_inds, self.dsafe - distance, grads)
         return vals, robot_grads
 
     def _calc_obj_grad_and_val(self, obj_body, obstr_body, collisions):
@@ -223,59 +257,27 @@ class CollisionPredicate(ExprPredicate):
             obstr_body: OpenRAVEBody containing body information of obstruction
             collisions: list of collision objects returned by collision checker
         """
-        # Initialization
-        vals = []
-        grads = []
-        for c in collisions:
-            # Identify the collision points
-            linkA, linkB = c.GetLinkAName(), c.GetLinkBName()
-            linkAParent, linkBParent = c.GetLinkAParentName(), c.GetLinkBParentName()
-            linkObj, linkObstr = None, None
-            sign = 1
-            if linkAParent == obj_body.name and linkBParent == obstr_body.name:
-                ptObj, ptObstr = c.GetPtA(), c.GetPtB()
-                linkObj, linkObstr = linkA, linkB
-                sign = -1
-            elif linkBParent == obj_body.name and linkAParent == obstr_body.name:
-                ptObj, ptObstr = c.GetPtB(), c.GetPtA()
-                linkObj, linkObstr = linkB, linkA
-                sign = 1
-            else:
-                continue
-            # Obtain distance between two collision points, and their normal collision vector
-            distance = c.GetDistance()
-            normal = c.GetNormal()
-            col_vec = -sign*normal
-            # Calculate object pose jacobian
-            obj_jac = np.array([normal])
-            obj_pos = OpenRAVEBody.obj_pose_from_transform(obj_body.env_body.GetTransform())
-            torque = ptObj - obj_pos[:3]
-            # Calculate object rotation jacobian
-            Rz, Ry, Rx = OpenRAVEBody._axis_rot_matrices(obj_pos[:3], obj_pos[3:])
-            rot_axises = [[0,0,1], np.dot(Rz, [0,1,0]),  np.dot(Rz, np.dot(Ry, [1,0,0]))]
-            rot_vec = np.array([[np.dot(np.cross(axis, torque), col_vec) for axis in rot_axises]])
-            obj_jac = np.c_[obj_jac, -rot_vec]
-            # Calculate obstruct pose jacobian
-            obstr_jac = np.array([-normal])
-            obstr_pos = OpenRAVEBody.obj_pose_from_transform(obstr_body.env_body.GetTransform())
-            torque = ptObstr - obstr_pos[:3]
-            Rz, Ry, Rx = OpenRAVEBody._axis_rot_matrices(obstr_pos[:3], obstr_pos[3:])
-            rot_axises = [[0,0,1], np.dot(Rz, [0,1,0]),  np.dot(Rz, np.dot(Ry, [1,0,0]))]
-            rot_vec = np.array([[np.dot(np.cross(axis, torque), col_vec) for axis in rot_axises]])
-            obstr_jac = np.c_[obstr_jac, rot_vec]
-            # Constructing gradient matrix
-            robot_grad = np.c_[obj_jac, obstr_jac]
-            vals.append(self.dsafe - distance)
-            grads.append(robot_grad)
-
-            if self._debug:
-                self.plot_collision(ptObj, ptObstr, distance)
-
-        vals = np.vstack(vals)
-        grads = np.vstack(grads)
+        _, _, ptObj, ptObstr, distance, normal, sign = contact_arrays(collisions, obj_body.name, obstr_body.name)
+        col_vec = -sign[:, None]*normal
+        # Calculate object pose and rotation jacobian
+        obj_pos = OpenRAVEBody.obj_pose_from_transform(obj_body.env_body.GetTransform())
+        Rz, Ry, Rx = OpenRAVEBody._axis_rot_matrices(obj_pos[:3], obj_pos[3:])
+        rot_axises = [[0,0,1], np.dot(Rz, [0,1,0]),  np.dot(Rz, np.dot(Ry, [1,0,0]))]
+        obj_jac = np.c_[normal, -rotation_jacobians(rot_axises, ptObj - obj_pos[:3], col_vec)]
+        # Calculate obstruct pose and rotation jacobian
+        obstr_pos = OpenRAVEBody.obj_pose_from_transform(obstr_body.env_body.GetTransform())
+        Rz, Ry, Rx = OpenRAVEBody._axis_rot_matrices(obstr_pos[:3], obstr_pos[3:])
+        rot_axises = [[0,0,1], np.dot(Rz, [0,1,0]),  np.dot(Rz, np.dot(Ry, [1,0,0]))]
+        obstr_jac = np.c_[-normal, rotation_jacobians(rot_axises, ptObstr - obstr_pos[:3], col_vec)]
+        vals = self.dsafe - distance
+
+        if self._debug:
+            for i in range(len(vals)):
+                self.plot_collision(ptObj[i], ptObstr[i], distance[i])
+
         ind = np.argmax(vals)
         val = vals[ind].reshape((1,1))
-        grad = grads[ind].reshape((1,12))
+        grad = np.c_[obj_jac, obstr_jac][ind].reshape((1,12))
         return val, grad
 
     def test(self, time, negated=False):
@@ -318,6 +320,29 @@ class PosePredicate(ExprPredicate):
         self.handle = []
         super(PosePredicate, self).__init__(name, e, attr_inds, params, expected_param_types, tol=tol, active_range=active_range)
 
+    def robot_kinematics(self, x, robot_body):
+        """
+            Returns the robot transform and arm joints of get_robot_info for
+            the robot pose values in x, from the kinematics cache shared by
+            the robot predicates. The arm joints only provide GetAxis and
+            GetAnchor, and the robot is only moved to x on a cache miss
+            (never with const.NUMPY_KINEMATICS, which computes misses with
+            the NumPy kinematic chains of the robot): callers must not read
+            link or joint state from OpenRAVE after this call, as the robot
+            may still be in another configuration.
+        """
+        gather_inds = self.get_gather_inds()
+        if getattr(self, '_robot_dst', None) is None or self._robot_dst[0] is not gather_inds:
+            # positions of the robot values within the values of one timestep
+            robot = [p for p, body in self._param_to_body.items() if body is robot_body][0]
+            start, end = self.active_range
+            step_dim = self.x_dim / (end - start + 1)
+            dst = np.sort(np.concatenate([d for p, attr, rows, offsets, d, t_mask in gather_inds if p is robot]))
+            self._robot_dst = (gather_inds, dst[dst < step_dim])
+        x = np.asarray(x)
+        key = tuple(x[self._robot_dst[1]].flatten())
+        return get_kinematics_cache().get_robot_info(self, x, robot_body, key, const.NUMPY_KINEMATICS)
+
     def pos_check(self, x):
         """
             This function is used to check whether:
@@ -331,11 +356,8 @@ class PosePredicate(ExprPredicate):
         # Obtain openrave body
         robot_body = self._param_to_body[self.params[self.ind0]]
         obj_body = self._param_to_body[self.params[self.ind1]]
-        robot = robot_body.env_body
         # Set poses and Get transforms
-        self.set_robot_poses(x, robot_body)
-        robot_trans, arm_inds = self.get_robot_info(robot_body)
-        arm_joints = [robot.GetJointFromDOFIndex(ind) for ind in arm_inds]
+        robot_trans, arm_joints = self.robot_kinematics(x, robot_body)
         # Set Can Pose
         can_pos, can_rot = x[-6: -3], x[-3:]
         obj_body.set_pose(can_pos, can_rot)
@@ -386,11 +408,8 @@ class PosePredicate(ExprPredicate):
         # Obtain openrave body
         robot_body = self._param_to_body[self.params[self.ind0]]
         obj_body = self._param_to_body[self.params[self.ind1]]
-        robot = robot_body.env_body
         # Set poses and Get transforms
-        self.set_robot_poses(x, robot_body)
-        robot_trans, arm_inds = self.get_robot_info(robot_body)
-        arm_joints = [robot.GetJointFromDOFIndex(ind) for ind in arm_inds]
+        robot_trans, arm_joints = self.robot_kinematics(x, robot_body)
         # Set Can Pose
         can_pos, can_rot = x[-6: -3], x[-3:]
         obj_body.set_pose(can_pos, can_rot)
@@ -440,11 +459,8 @@ class PosePredicate(ExprPredicate):
             Note: Child class that uses this function needs to provide set_robot_poses and get_robot_info functions
         """
         robot_body = self._param_to_body[self.robot]
-        robot = robot_body.env_body
 
-        self.set_robot_poses(x, robot_body)
-        robot_trans, arm_inds = self.get_robot_info(robot_body)
-        arm_joints = [robot.GetJointFromDOFIndex(ind) for ind in arm_inds]
+        robot_trans, arm_joints = self.robot_kinematics(x, robot_body)
 
         ee_pos, ee_rot = x[-6:-3], x[-3:]
         obj_trans = OpenRAVEBody.transform_from_obj_pose(ee_pos, ee_rot)
@@ -496,10 +512,7 @@ class PosePredicate(ExprPredicate):
         """
 
         robot_body = self._param_to_body[self.robot]
-        robot = robot_body.env_body
-        self.set_robot_poses(x, robot_body)
-        robot_trans, arm_inds = self.get_robot_info(robot_body)
-        arm_joints = [robot.GetJointFromDOFIndex(ind) for ind in arm_inds]
+        robot_trans, arm_joints = self.robot_kinematics(x, robot_body)
 
         ee_pos, ee_rot = x[-6:-3], x[-3:]
         obj_trans = OpenRAVEBody.transform_from_obj_pose(ee_pos, ee_rot)
@@ -844,6 +857,8 @@ class EEReachable(PosePredicate):
         self._param_to_body = {self.robot: self.lazy_spawn_or_body(self.robot, self.robot.name, self.robot.geom)}
 
         self._steps = steps
+        # the values and jacobian come from one stacked_pos_check call
+        self.stacked_pos_check = last_point_memo(self.stacked_pos_check)
         f = lambda x: self.coeff*self.eval_f(x)
         grad = lambda x: self.coeff*self.eval_grad(x)
 
@@ -861,7 +876,49 @@ class EEReachable(PosePredicate):
         else:
             return self.opt_expr
 
+    def stacked_pos_check(self, x):
+        """
+            Returns the values (3*(2*steps+1), 1) and the block diagonal
+            jacobian of ee_pose_check_rel_obj at all approach and retreat
+            steps, with one kinematics query per timestep and the offset
+            points and jacobians of all steps computed at once.
 
+            Note: Child class that uses this function needs to provide get_rel_pt and stack_ee_jac functions
+        """
+        start, end = self.active_range
+        n = end - start + 1
+        X = np.asarray(x).reshape((n, self.attr_dim))
+        robot_body = self._param_to_body[self.robot]
+        robot_pos, axes, anchors = [], [], []
+        for t in range(n):
+            robot_trans, arm_joints = self.robot_kinematics(X[t][:, None], robot_body)
+            robot_pos.append(robot_trans[:3, 3])
+            axes.append([joint.GetAxis() for joint in arm_joints])
+            anchors.append([joint.GetAnchor() for joint in arm_joints])
+        robot_pos, axes, anchors = np.array(robot_pos), np.array(axes), np.array(anchors)
+        # Offset points relative to the end effector poses
+        ee_pos, ee_rot = X[:, -6:-3], X[:, -3:]
+        Rz = rotations([0, 0, 1], ee_rot[:, 0])
+        RzRy = np.einsum('nij,njk->nik', Rz, rotations([0, 1, 0], ee_rot[:, 1]))
+        obj_rot = np.einsum('nij,njk->nik', RzRy, rotations([1, 0, 0], ee_rot[:, 2]))
+        rel_pts = np.array([self.get_rel_pt(s) for s in range(start, end+1)])
+        obj_pos = ee_pos + np.einsum('nij,nj->ni', obj_rot, rel_pts)
+        dist_val = (robot_pos - obj_pos).reshape((3*n, 1))
+        # Joint jacobians (n, 3, #joints)
+        arm_jac = np.cross(axes, robot_pos[:, None, :] - anchors).transpose((0, 2, 1))
+        # Object jacobians (n, 3, 6), axises = [axis_z, axis_y, axis_x]
+        axises = np.stack([np.tile([0., 0., 1.], (n, 1)), Rz[:, :, 1], RzRy[:, :, 0]], axis=1)
+        rot_jac = -np.cross(axises, (obj_pos - ee_pos)[:, None, :]).transpose((0, 2, 1))
+        obj_jac = np.concatenate([np.tile(-np.eye(3), (n, 1, 1)), rot_jac], axis=2)
+        dist_jac = np.zeros((n, 3, n, self.attr_dim))
+        dist_jac[np.arange(n), :, np.arange(n), :] = self.stack_ee_jac(robot_pos, arm_jac, obj_jac)
+        return dist_val, dist_jac.reshape((3*n, n*self.attr_dim))
+
+    def stacked_f(self, x):
+        return self.stacked_pos_check(x)[0]
+
+    def stacked_grad(self, x):
+        return self.stacked_pos_check(x)[1]
 
 class Obstructs(CollisionPredicate):
     """
@@ -0,0 +1,144 @@
+from core.util_classes.wall import Wall
+from core.util_classes.table import Table
+from core.util_classes.cache_paths import cache_path
+import itertools
+import hashlib
+import h5py
+import os.path as path
+import numpy as np
+
+"""
+Signed distance fields of static geometry (walls and tables), sampled on a
+regular grid in the frame of the body and interpolated with their gradients.
+Fields are cached in memory and in an HDF5 file in the cache directory (see
+cache_paths), one group per geometry and resolution.
+"""
+
+SDF_CACHE_FILE = "sdf_cache.hdf5"
+DEFAULT_RESOLUTION = 0.05
+SDF_PADDING = 1.0
+
+def boxes_signed_distance(points, centers, half_extents):
+    """
+    Signed distance of (N, d) points to the union of the M axis-aligned boxes
+    given by (M, d) centers and half_extents. Returns an (N,) array.
+    """
+    q = np.abs(points[:, None, :] - centers) - half_extents
+    outside = np.sqrt(np.sum(np.maximum(q, 0)**2, axis=2))
+    inside = np.minimum(q.max(axis=2), 0)
+    return np.min(outside + inside, axis=1)
+
+class SignedDistanceField(object):
+    """
+    Signed distances on a regular grid: values[i_1, ..., i_d] is the distance
+    at origin + resolution*(i_1, ..., i_d). query interpolates multilinearly
+    (bilinear in 2D, trilinear in 3D), and extrapolates linearly outside of
+    the grid.
+    """
+    def __init__(self, origin, resolution, values):
+        self.origin = np.asarray(origin, dtype=np.float)
+        self.resolution = float(resolution)
+        self.values = np.asarray(values, dtype=np.float)
+        self.dim = len(self.origin)
+        assert self.values.ndim == self.dim and min(self.values.shape) >= 2
+
+    @staticmethod
+    def from_function(dist_fn, lo, hi, resolution):
+        """
+        Samples dist_fn, which maps (N, d) points to (N,) distances, on the
+        grid covering the box from lo to hi.
+        """
+        lo = np.asarray(lo, dtype=np.float)
+        hi = np.asarray(hi, dtype=np.float)
+        shape = np.maximum(np.ceil((hi - lo) / resolution).astype(np.int) + 1, 2)
+        axes = [lo[i] + resolution*np.arange(shape[i]) for i in range(len(lo))]
+        grid = np.meshgrid(*axes, indexing='ij')
+        points = np.c_[tuple(g.ravel() for g in grid)]
+        values = dist_fn(points).reshape(tuple(shape))
+        return SignedDistanceField(lo, resolution, values)
+
+    def query(self, points):
+        """
+        Returns the interpolated distances (N,) and gradients (N, d) at the
+        (N, d) points.
+        """
+        points = np.atleast_2d(points)
+        u = (points - self.origin) / self.resolution
+        shape = np.array(self.values.shape)
+        i0 = np.clip(np.floor(u).astype(np.int), 0, shape - 2)
+        f = u - i0
+        dists = np.zeros(len(points))
+        grads = np.zeros(points.shape)
+        for corner in itertools.product([0, 1], repeat=self.dim):
+            corner = np.array(corner)
+            val = self.values[tuple((i0 + corner).T)]
+            ## weight of the corner in each dimension
+            w = np.where(corner, f, 1 - f)
+            dw = np.where(corner, 1., -1.)
+            dists += val * np.prod(w, axis=1)
+            for k in range(self.dim):
+                others = np.prod(np.delete(w, k, axis=1), axis=1)
+                grads[:, k] += val * dw[k] * others
+        return dists, grads / self.resolution
+
+    def write_to_hdf5(self, group):
+        group.create_dataset('origin', data=self.origin)
+        group.create_dataset('resolution', data=self.resolution)
+        group.create_dataset('values', data=self.values)
+
+    @staticmethod
+    def read_from_hdf5(group):
+        return SignedDistanceField(group['origin'][()], group['resolution'][()], group['values'][()])
+
+def static_boxes(geom):
+    """
+    Returns the (centers, half_extents) of the boxes of a static geometry, or
+    None if geom is not a static geometry.
+    """
+    if isinstance(geom, (Wall, Table)):
+        return geom.get_boxes()
+    return None
+
+def _sdf_key(geom, resolution):
+    if isinstance(geom, Wall):
+        name = 'wall_{}'.format(geom.wall_type)
+    else:
+        ## tables are identified by their box layout
+        centers, half_extents = geom.get_boxes()
+        name = 'table_{}'.format(hashlib.md5(np.r_[centers.ravel(), half_extents.ravel()].round(6).tostring()).hexdigest())
+    return '{}_{}'.format(name, resolution)
+
+_sdfs = {}
+
+def get_static_sdf(geom, resolution=DEFAULT_RESOLUTION, cache_file=SDF_CACHE_FILE):
+    """
+    Returns the SignedDistanceField of a static geometry, in the frame of
+    the body. The field is read from cache_file if it was computed before,
+    otherwise it is computed and written to cache_file (unless cache_file is
+    None). Relative cache file names are in the cache directory.
+    """
+    key = _sdf_key(geom, resolution)
+    if key in _sdfs:
+        return _sdfs[key]
+    if cache_file is not None:
+        cache_file = cache_path(cache_file)
+    sdf = None
+    if cache_file is not None and path.isfile(cache_file):
+        hdf5 = h5py.File(cache_file, 'r')
+        if key in hdf5:
+            sdf = SignedDistanceField.read_from_hdf5(hdf5[key])
+        hdf5.close()
+    if sdf is None:
+        centers, half_extents = static_boxes(geom)
+        lo = np.min(centers - half_extents, axis=0) - SDF_PADDING
+        hi = np.max(centers + half_extents, axis=0) + SDF_PADDING
+        sdf = SignedDistanceField.from_function(
+            lambda points: boxes_signed_distance(points, centers, half_extents),
+            lo, hi, resolution)
+        if cache_file is not None:
+            hdf5 = h5py.File(cache_file, 'a')
+            if key not in hdf5:
+                sdf.write_to_hdf5(hdf5.create_group(key))
+            hdf5.close()
+    _sdfs[key] = sdf
+    return sdf
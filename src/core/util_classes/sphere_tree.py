@@ -0,0 +1,243 @@
+from core.util_classes.cache_paths import cache_path
+from collections import OrderedDict
+from contextlib import contextmanager
+import os.path as path
+import threading
+import hashlib
+import h5py
+import numpy as np
+
+"""
+Sphere approximations of KinBody links, for cheap collision checks in early
+optimization iterations. Each geometry of a link is covered by a grid of
+spheres computed from its axis-aligned bounding box, and each link also
+gets one bounding sphere around all of its spheres, so links far away from
+an object are skipped without looking at their spheres.
+
+Sphere trees are computed once per body model (by its geometry hash) and
+cached in memory and in an HDF5 file in the cache directory (see
+cache_paths). The collision predicates check robot links against spheres
+while the collision fidelity is SPHERES and against the link meshes
+otherwise (see collision_fidelity). The fidelity is set per thread, and
+EnvironmentPool workers run with the fidelity of the thread that called
+map.
+"""
+
+SPHERE_CACHE_FILE = "sphere_cache.hdf5"
+MAX_SPHERES_PER_AXIS = 8
+
+MESH = 'mesh'
+SPHERES = 'spheres'
+_fidelity = threading.local()
+
+def get_collision_fidelity():
+    return getattr(_fidelity, 'value', MESH)
+
+def set_collision_fidelity(fidelity):
+    assert fidelity in [MESH, SPHERES]
+    _fidelity.value = fidelity
+
+@contextmanager
+def collision_fidelity(fidelity):
+    """
+    Sets the collision fidelity of the current thread for the with block.
+    """
+    prev = get_collision_fidelity()
+    set_collision_fidelity(fidelity)
+    try:
+        yield
+    finally:
+        set_collision_fidelity(prev)
+
+def box_spheres(center, half_extents, max_per_axis=MAX_SPHERES_PER_AXIS):
+    """
+    Centers (n, 3) and radii (n,) of spheres covering the box: the box is
+    cut into a grid of cells no thinner than the box and at most
+    max_per_axis along each axis, and each cell gets its circumscribed
+    sphere.
+    """
+    center = np.asarray(center, dtype=np.float)
+    half_extents = np.maximum(np.asarray(half_extents, dtype=np.float), 1e-6)
+    cell = max(2*half_extents.min(), 2*half_extents.max()/max_per_axis)
+    n = np.maximum(np.ceil(2*half_extents/cell - 1e-9).astype(np.int), 1)
+    h = half_extents / n
+    axes = [center[i] - half_extents[i] + h[i]*(2*np.arange(n[i]) + 1) for i in range(3)]
+    centers = np.array(np.meshgrid(*axes, indexing='ij')).reshape((3, -1)).T
+    return centers, np.ones(len(centers))*np.linalg.norm(h)
+
+class SphereTree(object):
+    """
+    Spheres of each link, in the frame of the link, as an OrderedDict from
+    link names to (centers (n, 3), radii (n,)), with a bounding sphere per
+    link.
+    """
+    def __init__(self, links):
+        self.links = OrderedDict()
+        self.roots = OrderedDict()
+        for name, (centers, radii) in links.items():
+            centers, radii = np.reshape(centers, (-1, 3)), np.ravel(radii)
+            if not len(radii):
+                continue
+            self.links[name] = (centers, radii)
+            lo = np.min(centers - radii[:, None], axis=0)
+            hi = np.max(centers + radii[:, None], axis=0)
+            root = (lo + hi) / 2.
+            self.roots[name] = (root, np.max(np.linalg.norm(centers - root, axis=1) + radii))
+
+    @staticmethod
+    def from_body(env_body, link_names=None):
+        """
+        Covers the geometries of the links link_names (all links by
+        default) of an OpenRAVE KinBody with spheres.
+        """
+        links = OrderedDict()
+        for link in env_body.GetLinks():
+            if link_names is not None and link.GetName() not in link_names:
+                continue
+            centers, radii = [], []
+            for geom in link.GetGeometries():
+                aabb = geom.ComputeAABB(np.eye(4))
+                c, r = box_spheres(aabb.pos(), aabb.extents())
+                centers.append(c)
+                radii.append(r)
+            if len(centers):
+                links[link.GetName()] = (np.vstack(centers), np.concatenate(radii))
+        return SphereTree(links)
+
+    def world_spheres(self, env_body, link_names=None):
+        """
+        Returns the link names, and the world centers (n, 3), radii (n,)
+        and link index (into link names) of each sphere, for the links of
+        link_names (all links by default) at the current body pose.
+        """
+        names, centers, radii, inds = [], [], [], []
+        for name, (c, r) in self.links.items():
+            if link_names is not None and name not in link_names:
+                continue
+            trans = env_body.GetLink(name).GetTransform()
+            centers.append(c.dot(trans[:3, :3].T) + trans[:3, 3])
+            radii.append(r)
+            inds.append(len(names)*np.ones(len(r), dtype=np.int))
+            names.append(name)
+        if not len(names):
+            return names, np.zeros((0, 3)), np.zeros(0), np.zeros(0, dtype=np.int)
+        return names, np.vstack(centers), np.concatenate(radii), np.concatenate(inds)
+
+    def world_roots(self, env_body):
+        """
+        Returns the link names, and the world centers (n, 3) and radii (n,)
+        of the bounding spheres of the links.
+        """
+        names = self.roots.keys()
+        centers = np.zeros((len(names), 3))
+        radii = np.zeros(len(names))
+        for i, name in enumerate(names):
+            trans = env_body.GetLink(name).GetTransform()
+            root, radius = self.roots[name]
+            centers[i] = trans[:3, :3].dot(root) + trans[:3, 3]
+            radii[i] = radius
+        return names, centers, radii
+
+    def write_to_hdf5(self, group):
+        for i, (name, (centers, radii)) in enumerate(self.links.items()):
+            link = group.create_group(str(i))
+            link.attrs['name'] = name
+            link.create_dataset('centers', data=centers)
+            link.create_dataset('radii', data=radii)
+
+    @staticmethod
+    def read_from_hdf5(group):
+        links = OrderedDict()
+        for i in range(len(group)):
+            link = group[str(i)]
+            links[str(link.attrs['name'])] = (link['centers'][()], link['radii'][()])
+        return SphereTree(links)
+
+_trees = {}
+_trees_lock = threading.Lock()
+
+def _tree_key(env_body, link_names):
+    names = 'all' if link_names is None else ','.join(sorted(link_names))
+    return '{}_{}'.format(env_body.GetKinematicsGeometryHash(), hashlib.md5(names).hexdigest())
+
+def get_sphere_tree(env_body, link_names=None, cache_file=SPHERE_CACHE_FILE):
+    """
+    Returns the SphereTree of the links link_names of env_body, read from
+    cache_file if it was computed before for a body with the same geometry,
+    otherwise computed and written to cache_file (unless it is None).
+    Relative cache file names are in the cache directory.
+    """
+    key = _tree_key(env_body, link_names)
+    with _trees_lock:
+        if key in _trees:
+            return _trees[key]
+        if cache_file is not None:
+            cache_file = cache_path(cache_file)
+        tree = None
+        if cache_file is not None and path.isfile(cache_file):
+            hdf5 = h5py.File(cache_file, 'r')
+            if key in hdf5:
+                tree = SphereTree.read_from_hdf5(hdf5[key])
+            hdf5.close()
+        if tree is None:
+            tree = SphereTree.from_body(env_body, link_names)
+            if cache_file is not None:
+                hdf5 = h5py.File(cache_file, 'a')
+                if key not in hdf5:
+                    tree.write_to_hdf5(hdf5.create_group(key))
+                hdf5.close()
+        _trees[key] = tree
+        return tree
+
+def sphere_distances(centers0, radii0, centers1, radii1):
+    """
+    Signed distances (n0, n1) between two sets of spheres, and the unit
+    normals (n0, n1, 3) pointing from the spheres of set 1 to set 0.
+    """
+    diff = centers0[:, None, :] - centers1[None, :, :]
+    norm = np.sqrt(np.sum(diff**2, axis=2))
+    normals = np.zeros(diff.shape)
+    normals[:, :, 2] = 1.
+    nonzero = norm > 0
+    normals[nonzero] = diff[nonzero] / norm[nonzero][:, None]
+    return norm - radii0[:, None] - radii1[None, :], normals
+
+def sphere_contacts(tree0, body0, tree1, body1, contact_distance, link_names=None):
+    """
+    Closest sphere contact of each link of body0 (restricted to link_names)
+    with body1 within contact_distance, laid out like
+    contacts.contact_arrays(collisions, body0 name, body1 name) with body 0
+    as body A of each contact.
+    """
+    names0, roots0, root_radii0 = tree0.world_roots(body0)
+    _, centers1, radii1, _ = tree1.world_spheres(body1)
+    no_contacts = ([], [], np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0), np.zeros((0, 3)), np.zeros(0))
+    if not len(names0) or not len(radii1):
+        return no_contacts
+    # Links whose bounding sphere is out of range have no contacts
+    root_dists, _ = sphere_distances(roots0, root_radii0, centers1, radii1)
+    near = [n for n, d in zip(names0, root_dists.min(axis=1)) if d < contact_distance]
+    if link_names is not None:
+        near = [n for n in near if n in link_names]
+    if not len(near):
+        return no_contacts
+    names0, centers0, radii0, inds0 = tree0.world_spheres(body0, near)
+    dists, normals = sphere_distances(centers0, radii0, centers1, radii1)
+    links0, pts0, pts1, min_dists, min_normals = [], [], [], [], []
+    for i, name in enumerate(names0):
+        rows = np.nonzero(inds0 == i)[0]
+        k, j = np.unravel_index(np.argmin(dists[rows]), (len(rows), len(radii1)))
+        k = rows[k]
+        if dists[k, j] >= contact_distance:
+            continue
+        n = normals[k, j]
+        links0.append(name)
+        pts0.append(centers0[k] - radii0[k]*n)
+        pts1.append(centers1[j] + radii1[j]*n)
+        min_dists.append(dists[k, j])
+        min_normals.append(n)
+    if not len(links0):
+        return no_contacts
+    links1 = [body1.GetName()]*len(links0)
+    return (links0, links1, np.array(pts0), np.array(pts1), np.array(min_dists),
+            np.array(min_normals), -np.ones(len(links0)))
@@ -1,3 +1,5 @@
+import numpy as np
+
 class Table(object):
     """
         Object stores all the information to for a table model
@@ -11,3 +13,23 @@ class Table(object):
         self.leg_dim = [dim[3], dim[4]]
         self.leg_height = dim[5]
         self.back = dim[6]
+
+    def get_boxes(self):
+        """
+            Returns the (centers, half_extents) of the tabletop, the legs and
+            the back plate (if any), as two (n_boxes, 3) arrays in the frame
+            of the table.
+        """
+        thickness = self.thickness
+        leg_height = self.leg_height
+        dim1, dim2 = self.table_dim
+        legdim1, legdim2 = self.leg_dim
+        centers = [[0, 0, 0]]
+        half_extents = [[dim1/2., dim2/2., thickness/2.]]
+        for sx, sy in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+            centers.append([sx*(dim1/2. - legdim1/2.), sy*(dim2/2. - legdim2/2.), -leg_height/2. - thickness/2.])
+            half_extents.append([legdim1/2., legdim2/2., leg_height/2.])
+        if self.back:
+            centers.append([dim1/2. - legdim1/10., 0, -leg_height/2. - thickness/4.])
+            half_extents.append([legdim1/10., dim2/2., leg_height - thickness/2.])
+        return np.array(centers, dtype=np.float), np.array(half_extents, dtype=np.float)
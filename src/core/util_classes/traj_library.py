@@ -0,0 +1,265 @@
+import h5py
+import hashlib
+import os.path as path
+import numpy as np
+
+DEFAULT_RESOLUTION = 0.05
+DEFAULT_SAVE_EVERY = 50
+
+class TrajEntry(object):
+    """
+    A single stored trajectory of an action. start and goal are the
+    flattened parameter values at the first and last timestep of the action,
+    trajs maps the index of a parameter in action.params to a dictionary
+    from attribute name to its (dim, T) trajectory over the action
+    (Symbols are stored as (dim, 1)).
+    """
+    def __init__(self, name, start, goal, trajs):
+        self.name = name
+        self.start = start
+        self.goal = goal
+        self.trajs = trajs
+
+    def features(self):
+        return np.r_[self.start, self.goal]
+
+class TrajLibrary(object):
+    """
+    Persistent library of solved action trajectories, used to warm start the
+    low level solvers. Entries are keyed by the action name together with the
+    start and goal configurations discretized to the given resolution, so
+    solving the same action between nearby poses replaces the stored entry
+    instead of growing the library. Lookup returns the nearest neighbour among
+    the entries of the same action.
+
+    Entries added since the last save are pending; save only writes those
+    into the file. add_plan(save=False) saves once save_every entries are
+    pending, and the remaining pending entries are only written by an
+    explicit save or close (or at the end of a with block over the
+    library), never at exit.
+
+    hdf5 structure:
+    action_name->entry_key->{start, goal, param_j->attr_dataset}
+    """
+    def __init__(self, file_name, resolution=DEFAULT_RESOLUTION, max_dist=None,
+                 save_every=DEFAULT_SAVE_EVERY):
+        self.store_file = file_name
+        if self.store_file[-5:] != '.hdf5':
+            self.store_file += '.hdf5'
+        self.resolution = resolution
+        self.max_dist = max_dist
+        self.save_every = save_every
+        self._entries = {}
+        ## hdf5 group of each stored (action name, key)
+        self._groups = {}
+        self._pending = set()
+        if path.isfile(self.store_file):
+            self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.itervalues())
+
+    def _key(self, start, goal):
+        return (tuple(np.round(start / self.resolution).astype(np.int)),
+                tuple(np.round(goal / self.resolution).astype(np.int)))
+
+    @staticmethod
+    def _group_name(key):
+        return 'entry_' + hashlib.md5(repr(key)).hexdigest()
+
+    @staticmethod
+    def _get_attrs(param):
+        return sorted(param._free_attrs.keys())
+
+    @staticmethod
+    def _param_val(param, attr, t):
+        if param.is_symbol():
+            t = 0
+        return getattr(param, attr)[:, t]
+
+    def get_endpoints(self, action):
+        """
+        Returns the flattened values of the action's parameters at the
+        first and last timestep of the action. Undetermined values are NaN.
+        """
+        t0, t1 = action.active_timesteps
+        start, goal = [], []
+        for param in action.params:
+            for attr in self._get_attrs(param):
+                start.append(self._param_val(param, attr, t0))
+                goal.append(self._param_val(param, attr, t1))
+        if not len(start):
+            return np.zeros((0,)), np.zeros((0,))
+        return np.hstack(start).astype(np.float), np.hstack(goal).astype(np.float)
+
+    def add_action(self, action):
+        start, goal = self.get_endpoints(action)
+        if np.any(np.isnan(start)) or np.any(np.isnan(goal)):
+            return False
+        t0, t1 = action.active_timesteps
+        trajs = {}
+        for i, param in enumerate(action.params):
+            trajs[i] = {}
+            for attr in self._get_attrs(param):
+                if param.is_symbol():
+                    trajs[i][attr] = getattr(param, attr)[:, :1].copy()
+                else:
+                    trajs[i][attr] = getattr(param, attr)[:, t0:t1+1].copy()
+        entries = self._entries.setdefault(action.name, {})
+        key = self._key(start, goal)
+        entries[key] = TrajEntry(action.name, start, goal, trajs)
+        self._pending.add((action.name, key))
+        return True
+
+    def add_plan(self, plan, save=True):
+        """
+        Records the trajectory of every action in a solved plan. With
+        save=False the pending entries are only written once there are
+        save_every of them.
+        """
+        added = [self.add_action(a) for a in plan.actions]
+        if save or len(self._pending) >= self.save_every:
+            self.save()
+        return any(added)
+
+    def lookup(self, action):
+        """
+        Returns the stored entry of the same action whose start and goal are
+        closest to those of the given action. Undetermined values of the
+        action are ignored in the distance computation.
+        """
+        if action.name not in self._entries:
+            return None
+        start, goal = self.get_endpoints(action)
+        query = np.r_[start, goal]
+        known = ~np.isnan(query)
+        if not np.any(known):
+            return None
+        best, best_dist = None, np.inf
+        for entry in self._entries[action.name].itervalues():
+            features = entry.features()
+            if features.shape != query.shape:
+                continue
+            dist = np.linalg.norm(features[known] - query[known])
+            if dist < best_dist:
+                best, best_dist = entry, dist
+        if self.max_dist is not None and best_dist > self.max_dist:
+            return None
+        return best
+
+    @staticmethod
+    def _resize(traj, T):
+        if traj.shape[1] == T:
+            return traj
+        old_ts = np.linspace(0, 1, traj.shape[1])
+        new_ts = np.linspace(0, 1, T)
+        return np.array([np.interp(new_ts, old_ts, row) for row in traj])
+
+    def warm_start(self, plan, active_ts=None):
+        """
+        Writes the nearest stored trajectories into the free values of every
+        action within active_ts. Returns True if every free value of the
+        parameters of those actions was initialized this way, in which case the
+        linear initialization solve can be skipped.
+        """
+        if active_ts is None:
+            active_ts = (0, plan.horizon-1)
+        params = set()
+        for action in plan.actions:
+            t0, t1 = action.active_timesteps
+            if t0 < active_ts[0] or t1 > active_ts[1]:
+                continue
+            params.update(action.params)
+            entry = self.lookup(action)
+            if entry is None:
+                continue
+            for i, param in enumerate(action.params):
+                for attr, traj in entry.trajs.get(i, {}).iteritems():
+                    if attr not in param._free_attrs:
+                        continue
+                    if param.is_symbol():
+                        cols = slice(0, 1)
+                    else:
+                        cols = slice(t0, t1+1)
+                        traj = self._resize(traj, t1-t0+1)
+                    val = getattr(param, attr)[:, cols]
+                    if val.shape != traj.shape:
+                        continue
+                    free = param._free_attrs[attr][:, cols].astype(bool)
+                    val[free] = traj[free]
+
+        for param in params:
+            for attr, free in param._free_attrs.iteritems():
+                val = getattr(param, attr)
+                if param.is_symbol():
+                    val, free = val[:, :1], free[:, :1]
+                else:
+                    val = val[:, active_ts[0]:active_ts[1]+1]
+                    free = free[:, active_ts[0]:active_ts[1]+1]
+                if np.any(np.isnan(val[free.astype(bool)])):
+                    return False
+        return True
+
+    def save(self):
+        """
+        Writes the entries added since the last save, replacing the stored
+        entries with the same keys.
+        """
+        if not self._pending:
+            return
+        hdf5 = h5py.File(self.store_file, 'a')
+        for name, key in self._pending:
+            entry = self._entries[name][key]
+            group_name = self._groups.setdefault((name, key), self._group_name(key))
+            action_group = hdf5.require_group(name)
+            if group_name in action_group:
+                del action_group[group_name]
+            entry_group = action_group.create_group(group_name)
+            entry_group.create_dataset('start', data=entry.start)
+            entry_group.create_dataset('goal', data=entry.goal)
+            for param_ind, attr_dict in entry.trajs.iteritems():
+                param_group = entry_group.create_group('param_{}'.format(param_ind))
+                for attr, traj in attr_dict.iteritems():
+                    param_group.create_dataset(attr, data=traj)
+        hdf5.close()
+        self._pending = set()
+
+    def close(self):
+        """
+        Writes the pending entries.
+        """
+        self.save()
+
+    def discard_pending(self):
+        """
+        Forgets which entries are pending, so they are not written unless
+        they are added again.
+        """
+        self._pending = set()
+
+    def load(self):
+        self._entries = {}
+        self._groups = {}
+        self._pending = set()
+        hdf5 = h5py.File(self.store_file, 'r')
+        for name, action_group in hdf5.iteritems():
+            entries = self._entries.setdefault(name, {})
+            for group_name, entry_group in action_group.iteritems():
+                start = entry_group['start'].value
+                goal = entry_group['goal'].value
+                trajs = {}
+                for param_group_name, param_group in entry_group.iteritems():
+                    if not param_group_name.startswith('param_'):
+                        continue
+                    param_ind = int(param_group_name[len('param_'):])
+                    trajs[param_ind] = dict([(attr, param_group[attr].value) for attr in param_group])
+                key = self._key(start, goal)
+                entries[key] = TrajEntry(name, start, goal, trajs)
+                self._groups[(name, key)] = group_name
+        hdf5.close()
@@ -1,3 +1,10 @@
+import numpy as np
+from errors_exceptions import OpenRAVEException
+
+WALL_THICKNESS = 1
+WALL_ENDPOINTS = {'closet': [[-1.0,-3.0],[-1.0,4.0],[1.9,4.0],[1.9,8.0],[5.0,8.0],[5.0,4.0],[8.0,4.0],[8.0,-3.0],[-1.0,-3.0]]}
+_wall_boxes = {}
+
 class Wall(object):
 
     """
@@ -6,3 +13,37 @@ class Wall(object):
 
     def __init__(self, wall_type):
         self.wall_type = wall_type
+
+    def get_boxes(self):
+        return wall_boxes(self.wall_type)
+
+def wall_boxes(wall_type):
+    """
+    Returns the (centers, half_extents) of the axis-aligned boxes making up a
+    wall of wall_type, as two (n_boxes, 2) arrays in the frame of the wall.
+    """
+    if wall_type in _wall_boxes:
+        return _wall_boxes[wall_type]
+    if wall_type not in WALL_ENDPOINTS:
+        raise OpenRAVEException("Wall type %s not supported."%wall_type)
+    wall_endpoints = WALL_ENDPOINTS[wall_type]
+    centers, half_extents = [], []
+    for start, end in zip(wall_endpoints[0:-1], wall_endpoints[1:]):
+        thickness = WALL_THICKNESS
+        if start[0] == end[0]:
+            ind_same, ind_diff = 0, 1
+            length = abs(start[ind_diff] - end[ind_diff])
+            dims = [thickness, length/2 + thickness]
+        elif start[1] == end[1]:
+            ind_same, ind_diff = 1, 0
+            length = abs(start[ind_diff] - end[ind_diff])
+            dims = [length/2 + thickness, thickness]
+        else:
+            raise OpenRAVEException("Can only create axis-aligned walls.")
+        center = [0, 0]
+        center[ind_same] = start[ind_same]
+        center[ind_diff] = min(start[ind_diff], end[ind_diff]) + length/2
+        centers.append(center)
+        half_extents.append(dims)
+    _wall_boxes[wall_type] = (np.array(centers, dtype=np.float), np.array(half_extents, dtype=np.float))
+    return _wall_boxes[wall_type]
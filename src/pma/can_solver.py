@@ -4,6 +4,7 @@ from sco.expr import BoundExpr, QuadExpr, AffExpr
 from sco.solver import Solver
 from openravepy import matrixFromAxisAngle
 from core.util_classes import common_predicates
+from core.util_classes.common_constants import ROBOT_TRAJOPT_COEFF as TRAJOPT_COEFF
 from core.util_classes.matrix import Vector
 from core.util_classes.pr2 import PR2
 from core.util_classes.namo_predicates import StationaryW, InContact
@@ -19,7 +20,6 @@ from core.util_classes.viewer import OpenRAVEViewer
 
 MAX_PRIORITY=5
 BASE_MOVE_COEFF = 10
-TRAJOPT_COEFF=1e3
 SAMPLE_SIZE = 5
 BASE_SAMPLE_SIZE = 5
 
@@ -32,7 +32,8 @@ attr_map = {'Robot': ['backHeight', 'lArmPose', 'lGripper','rArmPose', 'rGripper
             'Obstacle': ['pose', 'rotation']}
 
 class CanSolver(LLSolver):
-    def __init__(self, early_converge=False):
+    def __init__(self, early_converge=False, traj_library=None, lazy_collisions=False,
+                 stack_cnts=False, compile_affine=False):
         self.transfer_coeff = 1e1
         self.rs_coeff = 1e10
         self.initial_trust_region_size = 1e-2
@@ -43,6 +44,12 @@ class CanSolver(LLSolver):
         self.early_converge=early_converge
         self.child_solver = None
         self.solve_priorities = [2]
+        ## solved plans are added to traj_library without saving it every
+        ## time: the owner of the library saves or closes it
+        self.traj_library = traj_library
+        self.lazy_collisions = lazy_collisions
+        self.stack_cnts = stack_cnts
+        self.compile_affine = compile_affine
 
     def _solve_helper(self, plan, callback, active_ts, verbose):
         # certain constraints should be solved first
@@ -244,8 +251,12 @@ class CanSolver(LLSolver):
         success = False
 
         if force_init or not plan.initialized:
+            ## a trajectory from the library replaces the linear initialization
+            warm_started = self.traj_library is not None and \
+                self.traj_library.warm_start(plan, active_ts)
+            if not warm_started:
+                self._solve_opt_prob(plan, priority=-2, callback=callback, active_ts=active_ts, verbose=verbose)
              ## solve at priority -1 to get an initial value for the parameters
-            self._solve_opt_prob(plan, priority=-2, callback=callback, active_ts=active_ts, verbose=verbose)
             self._solve_opt_prob(plan, priority=-1, callback=callback, active_ts=active_ts, verbose=verbose)
             plan.initialized=True
 
@@ -254,6 +265,7 @@ class CanSolver(LLSolver):
         # if len(fp) == 0:
         #     return True
         if success:
+            self._record_traj(plan)
             return success
 
         for _ in range(n_resamples):
@@ -268,9 +280,14 @@ class CanSolver(LLSolver):
             # if len(fp) == 0:
             #     return True
             if success:
+                self._record_traj(plan)
                 return success
         return success
 
+    def _record_traj(self, plan):
+        if self.traj_library is not None:
+            self.traj_library.add_plan(plan, save=False)
+
     def _solve_opt_prob(self, plan, priority, callback=None, init=True, active_ts=None,
                         verbose=False):
         ## active_ts is the inclusive timesteps to include
@@ -286,6 +303,8 @@ class CanSolver(LLSolver):
         model.update()
 
         self._bexpr_to_pred = {}
+        self._lazy_cnts = []
+        self._aff_cnts = []
 
         if priority == -2:
             obj_bexprs = self._get_trajopt_obj(plan, active_ts)
@@ -334,11 +353,12 @@ class CanSolver(LLSolver):
             self._add_all_timesteps_of_actions(plan, priority=priority, add_nonlin=True, active_ts=active_ts, verbose=verbose)
             tol=1e-3
 
+        self._add_compiled_aff_cnts()
         solv = Solver()
         solv.initial_trust_region_size = self.initial_trust_region_size
         solv.initial_penalty_coeff = self.init_penalty_coeff
         solv.max_merit_coeff_increases = self.max_merit_coeff_increases
-        success = solv.solve(self._prob, method='penalty_sqp', tol=tol, verbose=True)
+        success = self._solve_lazy(solv, tol, True)
         self._update_ll_params()
         print "priority: {}".format(priority)
         # if callback is not None: callback(True)
@@ -445,24 +465,12 @@ class CanSolver(LLSolver):
             assert isinstance(pred, common_predicates.ExprPredicate)
             expr = pred.get_expr(negated)
 
-            for t in effective_timesteps:
-                if t in active_range:
-                    if expr is not None:
-                        if add_nonlin or isinstance(expr.expr, AffExpr):
-                            if verbose:
-                                print "expr being added at time ", t
-                            var = self._spawn_sco_var_for_pred(pred, t)
-                            bexpr = BoundExpr(expr, var)
-                            # TODO: REMOVE line below, for tracing back predicate for debugging.
-                            bexpr.pred = pred
-                            self._bexpr_to_pred[bexpr] = (negated, pred, t)
-                            groups = ['all']
-                            if self.early_converge:
-                                ## this will check for convergence per parameter
-                                ## this is good if e.g., a single trajectory quickly
-                                ## gets stuck
-                                groups.extend([param.name for param in pred.params])
-                            self._prob.add_cnt_expr(bexpr, groups)
+            if expr is not None:
+                if add_nonlin or isinstance(expr.expr, AffExpr):
+                    ts = [t for t in effective_timesteps if t in active_range]
+                    if verbose:
+                        print "expr being added at times ", ts
+                    self._add_cnt_exprs(expr, negated, pred, ts)
 
     def _add_first_and_last_timesteps_of_actions(self, plan, priority = MAX_PRIORITY, add_nonlin=False, active_ts=None, verbose=False):
         if active_ts==None:
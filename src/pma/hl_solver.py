@@ -2,6 +2,7 @@ from IPython import embed as shell
 import subprocess
 from core.internal_repr.action import Action
 from core.internal_repr.plan import Plan
+from core.internal_repr.plan_state import PackedPlanState
 from openravepy import Environment
 
 class HLSolver(object):
@@ -203,7 +204,9 @@ class FFSolver(HLSolver):
         params = self._spawn_plan_params(concr_prob, plan_horizon)
         actions = self._spawn_actions(plan_str, domain, params,
                                       plan_horizon, concr_prob, openrave_env)
-        return Plan(params, actions, plan_horizon, openrave_env)
+        plan = Plan(params, actions, plan_horizon, openrave_env)
+        plan.pack_state()
+        return plan
 
 
     def _extract_horizon(self, plan_str, domain):
@@ -233,9 +236,8 @@ class FFSolver(HLSolver):
             A mapping between parameter name and parameter
             (Dict\{String: internal_repr/parameter\})
         """
-        params = {}
-        for p_name, p in concr_prob.init_state.params.items():
-            params[p_name] = p.copy(plan_horizon)
+        ## all parameters are copied into a single packed buffer
+        params, _ = PackedPlanState.copy_params(concr_prob.init_state.params, plan_horizon)
         return params
 
     def _spawn_actions(self, plan_str, domain, params,
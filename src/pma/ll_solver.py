@@ -1,9 +1,10 @@
 from sco.prob import Prob
 from sco.variable import Variable
-from sco.expr import BoundExpr, QuadExpr, AffExpr
+from sco.expr import Expr, BoundExpr, QuadExpr, AffExpr, EqExpr, LEqExpr
 from sco.solver import Solver
 
 from core.util_classes import common_predicates
+from core.util_classes.common_constants import TRAJOPT_COEFF
 from core.util_classes.matrix import Vector, Vector2d
 
 import gurobipy as grb
@@ -11,12 +12,62 @@ import numpy as np
 GRB = grb.GRB
 from IPython import embed as shell
 import itertools, random
+from collections import OrderedDict
 
 MAX_PRIORITY=5
 WIDTH=7
 HEIGHT=2
-TRAJOPT_COEFF = 1e0
 dsafe = 1e-1
+## collision constraints within this margin of violation are added to the
+## problem when the solver adds collision constraints lazily
+LAZY_CNT_MARGIN = 1e-1
+## most timesteps of a predicate stacked into one constraint block
+STACK_TS = 10
+
+def block_diag(blocks):
+    """
+    Block diagonal matrix of a list of 2D blocks.
+    """
+    blocks = [np.atleast_2d(b) for b in blocks]
+    rows, cols = zip(*[b.shape for b in blocks])
+    res = np.zeros((sum(rows), sum(cols)))
+    i, j = 0, 0
+    for b in blocks:
+        res[i:i+b.shape[0], j:j+b.shape[1]] = b
+        i, j = i + b.shape[0], j + b.shape[1]
+    return res
+
+def stack_expr(expr, n):
+    """
+    Returns the constraint expr (an EqExpr or LEqExpr) applied to n stacked
+    inputs, as one constraint of the same type whose jacobian is block
+    diagonal. Affine expressions stay affine. Nonlinear ones are memoized
+    at the stacked point (see common_predicates.memoize_expr), as the
+    memos of expr itself only remember the last of the n inputs, and are
+    evaluated on all n inputs at once when they have an eval_range and
+    grad_range (like the NAMO collision expressions).
+    """
+    inner = expr.expr
+    val = np.reshape(expr.val, (-1, 1))
+    if len(val) > 1:
+        val = np.tile(val, (n, 1))
+    if isinstance(inner, AffExpr):
+        A = np.atleast_2d(inner.A)
+        b = np.reshape(inner.b, (-1, 1)) * np.ones((A.shape[0], 1))
+        return type(expr)(AffExpr(np.kron(np.eye(n), A), np.tile(b, (n, 1))), val)
+    if hasattr(inner, 'eval_range') and hasattr(inner, 'grad_range'):
+        def f(x):
+            return np.reshape(inner.eval_range(np.reshape(x, (n, -1)).T).T, (-1, 1))
+        def grad(x):
+            return block_diag(list(inner.grad_range(np.reshape(x, (n, -1)).T)))
+        return common_predicates.memoize_expr(type(expr)(Expr(f, grad), val))
+    def f(x):
+        X = np.reshape(x, (n, -1))
+        return np.vstack([np.reshape(inner.eval(X[i][:, None]), (-1, 1)) for i in range(n)])
+    def grad(x):
+        X = np.reshape(x, (n, -1))
+        return block_diag([inner.grad(X[i][:, None]) for i in range(n)])
+    return common_predicates.memoize_expr(type(expr)(Expr(f, grad), val))
 
 class LLSolver(object):
     """
@@ -24,33 +75,199 @@ class LLSolver(object):
     This is where different refinement strategies (e.g. backtracking,
     randomized), different motion planners, and different optimization
     strategies (global, sequential) are implemented.
+
+    With lazy_collisions, collision constraints only join the problem once
+    they are violated or within LAZY_CNT_MARGIN of it: the others are kept
+    aside in _lazy_cnts and checked again after every solve, which is
+    repeated until none of them become active.
+
+    With stack_cnts, the constraints of a predicate over up to STACK_TS
+    timesteps are added as one block (see stack_expr) instead of one
+    constraint per timestep.
+
+    With compile_affine, the affine constraints of all the predicates are
+    collected in _aff_cnts and added as one constraint block per group set
+    and constraint type (see _add_compiled_aff_cnts). Like any other
+    constraint, a block is penalized by sco, so the trust region does not
+    make the problem infeasible, and it counts towards the convergence of
+    its groups. Its linearization is exact, so it is never re-linearized.
     """
+    lazy_collisions = False
+    stack_cnts = False
+    compile_affine = False
+
     def solve(self, plan):
         raise NotImplementedError("Override this.")
 
+    def _add_cnt_exprs(self, expr, negated, pred, ts):
+        """
+        Adds the constraint expr of pred at the timesteps ts to the problem.
+        """
+        if self.compile_affine and self._aff_cnts is not None and self._is_affine(expr):
+            self._aff_cnts.append((expr, pred, ts))
+            return
+        if self.lazy_collisions and self._is_lazy(expr, pred):
+            active_ts = []
+            for t in ts:
+                if self._is_active(expr, pred, t):
+                    active_ts.append(t)
+                else:
+                    self._lazy_cnts.append((expr, negated, pred, t))
+            ts = active_ts
+        if not self.stack_cnts:
+            for t in ts:
+                self._add_cnt_expr(expr, negated, pred, t)
+            return
+        for i in range(0, len(ts), STACK_TS):
+            block_ts = ts[i:i+STACK_TS]
+            if len(block_ts) == 1:
+                self._add_cnt_expr(expr, negated, pred, block_ts[0])
+                continue
+            var = self._spawn_sco_var_for_pred_range(pred, block_ts)
+            bexpr = BoundExpr(stack_expr(expr, len(block_ts)), var)
+            bexpr.pred = pred
+            self._bexpr_to_pred[bexpr] = (negated, pred, block_ts)
+            self._prob.add_cnt_expr(bexpr, self._cnt_groups(pred))
+
+    def _add_cnt_expr(self, expr, negated, pred, t):
+        var = self._spawn_sco_var_for_pred(pred, t)
+        bexpr = BoundExpr(expr, var)
+        # TODO: REMOVE line below, for tracing back predicate for debugging.
+        bexpr.pred = pred
+        self._bexpr_to_pred[bexpr] = (negated, pred, t)
+        self._prob.add_cnt_expr(bexpr, self._cnt_groups(pred))
+
+    def _cnt_groups(self, pred):
+        groups = ['all']
+        if self.early_converge:
+            ## this will check for convergence per parameter
+            ## this is good if e.g., a single trajectory quickly
+            ## gets stuck
+            groups.extend([param.name for param in pred.params])
+        return groups
+
+    def _is_affine(self, expr):
+        return isinstance(expr, (EqExpr, LEqExpr)) and isinstance(expr.expr, AffExpr)
+
+    def _add_compiled_aff_cnts(self):
+        """
+        Adds the affine constraints collected in _aff_cnts to the problem.
+        The rows of the predicates with the same constraint groups and type
+        are stacked into one AffExpr over the Gurobi variables they use.
+        """
+        if not self._aff_cnts:
+            return
+        blocks = OrderedDict()
+        for expr, pred, ts in self._aff_cnts:
+            if not len(ts):
+                continue
+            A = np.atleast_2d(expr.expr.A)
+            m, T = A.shape[0], len(ts)
+            b = np.reshape(expr.expr.b, (-1, 1)) * np.ones((m, 1))
+            val = np.reshape(expr.val, (-1, 1)) * np.ones((m, 1))
+            cnt_type = LEqExpr if isinstance(expr, LEqExpr) else EqExpr
+            groups = self._cnt_groups(pred)
+            rows, cols, data, rhs, grb_vars, values, var_cols = \
+                blocks.setdefault((tuple(groups), cnt_type), ([], [], [], [], [], [], {}))
+            x, v = self._gather_pred_range(pred, ts)
+            x_cols = np.empty(len(x), dtype=np.int)
+            for i, var in enumerate(x):
+                ## gurobi variables overload ==, so they are keyed by id
+                x_cols[i] = var_cols.setdefault(id(var), len(grb_vars))
+                if x_cols[i] == len(grb_vars):
+                    grb_vars.append(var)
+                    values.append(v[i])
+            ## nonzeros of the block diagonal matrix kron(I_T, A)
+            r, c = np.nonzero(A)
+            k = np.arange(T)[:, None]
+            rows.append((len(rhs) + r + m*k).ravel())
+            cols.append(x_cols[(c + A.shape[1]*k).ravel()])
+            data.append(np.tile(A[r, c], T))
+            rhs.extend(np.tile(val - b, (T, 1))[:, 0])
+        self._aff_cnts = []
+        for (groups, cnt_type), (rows, cols, data, rhs, grb_vars, values, _) in blocks.items():
+            rows, cols = np.concatenate(rows), np.concatenate(cols)
+            A = np.zeros((len(rhs), len(grb_vars)))
+            ## sums the coefficients of variables read more than once by a row
+            np.add.at(A, (rows, cols), np.concatenate(data))
+            ## rows without variables are left out, as they are constant
+            used = np.any(A != 0, axis=1)
+            if not np.any(used):
+                continue
+            var = Variable(np.array(grb_vars, dtype=object).reshape((-1, 1)),
+                           np.array(values, dtype=np.float).reshape((-1, 1)))
+            aff = AffExpr(A[used], np.zeros((np.sum(used), 1)))
+            bexpr = BoundExpr(cnt_type(aff, np.array(rhs).reshape((-1, 1))[used]), var)
+            self._prob.add_cnt_expr(bexpr, list(groups))
+
+    def _is_lazy(self, expr, pred):
+        # namo_predicates imports this module
+        from core.util_classes import robot_predicates, namo_predicates
+        return isinstance(expr, LEqExpr) and isinstance(pred,
+            (robot_predicates.CollisionPredicate, namo_predicates.CollisionPredicate))
+
+    def _is_active(self, expr, pred, t):
+        val = expr.expr.eval(pred.get_param_vector(t))
+        return np.any(val > expr.val - LAZY_CNT_MARGIN)
+
+    def _add_lazy_cnts(self):
+        """
+        Adds the constraints kept aside that became active at the current
+        solution, and returns whether any were added.
+        """
+        if not self._lazy_cnts:
+            return False
+        self._update_ll_params()
+        inactive = []
+        for expr, negated, pred, t in self._lazy_cnts:
+            if self._is_active(expr, pred, t):
+                self._add_cnt_expr(expr, negated, pred, t)
+            else:
+                inactive.append((expr, negated, pred, t))
+        added = len(inactive) < len(self._lazy_cnts)
+        self._lazy_cnts = inactive
+        return added
+
+    def _solve_lazy(self, solv, tol, verbose):
+        """
+        Solves the problem until no constraint kept aside becomes active.
+        """
+        success = solv.solve(self._prob, method='penalty_sqp', tol=tol, verbose=verbose)
+        while self._add_lazy_cnts():
+            success = solv.solve(self._prob, method='penalty_sqp', tol=tol, verbose=verbose)
+        return success
+
     def _spawn_sco_var_for_pred(self, pred, t):
         x = np.empty(pred.x_dim , dtype=object)
         v = np.empty(pred.x_dim)
-        i = 0
-        start, end = pred.active_range
-        for rel_t in range(start, end+1):
-            for p in pred.attr_inds:
-                for attr, ind_arr in pred.attr_inds[p]:
-                    n_vals = len(ind_arr)
-                    ll_p = self._param_to_ll[p]
-                    if p.is_symbol():
-                        x[i:i+n_vals] = getattr(ll_p, attr)[ind_arr, 0]
-                        v[i:i+n_vals] = getattr(p, attr)[ind_arr, 0]
-                    else:
-                        x[i:i+n_vals] = getattr(ll_p, attr)[ind_arr, t+rel_t - self.ll_start]
-                        v[i:i+n_vals] = getattr(p, attr)[ind_arr, t+rel_t]
-                    i += n_vals
-
-        assert i >= pred.x_dim
+        ## one gather per (param, attr) using the predicate's compiled indices
+        for p, attr, rows, offsets, dst, t_mask in pred.get_gather_inds():
+            ll_p = self._param_to_ll[p]
+            x[dst] = getattr(ll_p, attr)[rows, offsets + (t - self.ll_start)*t_mask]
+            v[dst] = getattr(p, attr)[rows, offsets + t*t_mask]
+
         x = x.reshape((pred.x_dim, 1))
         v = v.reshape((pred.x_dim, 1))
         return Variable(x, v)
 
+    def _gather_pred_range(self, pred, ts):
+        """
+        Gurobi variables and values of the parameter vectors of pred at the
+        timesteps ts, stacked one timestep after the other.
+        """
+        ts = np.asarray(ts)[:, None]
+        x = np.empty((len(ts), pred.x_dim), dtype=object)
+        v = np.empty((len(ts), pred.x_dim))
+        for p, attr, rows, offsets, dst, t_mask in pred.get_gather_inds():
+            ll_p = self._param_to_ll[p]
+            x[:, dst] = getattr(ll_p, attr)[rows, offsets + (ts - self.ll_start)*t_mask]
+            v[:, dst] = getattr(p, attr)[rows, offsets + ts*t_mask]
+        return x.reshape(-1), v.reshape(-1)
+
+    def _spawn_sco_var_for_pred_range(self, pred, ts):
+        x, v = self._gather_pred_range(pred, ts)
+        return Variable(x.reshape((-1, 1)), v.reshape((-1, 1)))
+
 class LLParam(object):
     """
     LLParam creates the low-level representation of parameters (Numpy array of
@@ -164,7 +381,8 @@ class LLParam(object):
 
 class NAMOSolver(LLSolver):
 
-    def __init__(self, early_converge=True, transfer_norm='min-vel'):
+    def __init__(self, early_converge=True, transfer_norm='min-vel', lazy_collisions=False,
+                 stack_cnts=False, compile_affine=False):
         self.transfer_coeff = 1e1
         self.rs_coeff = 1e6
         self.init_penalty_coeff = 1e2
@@ -174,6 +392,9 @@ class NAMOSolver(LLSolver):
 
         self.early_converge=early_converge
         self.transfer_norm = transfer_norm
+        self.lazy_collisions = lazy_collisions
+        self.stack_cnts = stack_cnts
+        self.compile_affine = compile_affine
 
     def backtrack_solve(self, plan, callback=None, verbose=False):
         plan.save_free_attrs()
@@ -329,6 +550,8 @@ class NAMOSolver(LLSolver):
         model.update()
 
         self._bexpr_to_pred = {}
+        self._lazy_cnts = []
+        self._aff_cnts = []
 
         if priority == -1:
             obj_bexprs = self._get_trajopt_obj(plan, active_ts)
@@ -364,9 +587,10 @@ class NAMOSolver(LLSolver):
             self._add_all_timesteps_of_actions(plan, priority=1, add_nonlin=True, active_ts=active_ts, verbose=verbose)
             tol=1e-4
 
+        self._add_compiled_aff_cnts()
         solv = Solver()
         solv.initial_penalty_coeff = self.init_penalty_coeff
-        success = solv.solve(self._prob, method='penalty_sqp', tol=tol, verbose=verbose)
+        success = self._solve_lazy(solv, tol, verbose)
         self._update_ll_params()
         self._failed_groups = self._prob.nonconverged_groups
         return success
@@ -379,6 +603,9 @@ class NAMOSolver(LLSolver):
         self._spawn_parameter_to_ll_mapping(model, plan)
         model.update()
         self._bexpr_to_pred = {}
+        self._lazy_cnts = []
+        ## the penalized value also counts the affine constraints
+        self._aff_cnts = None
 
         obj_bexprs = self._get_trajopt_obj(plan)
         self._add_obj_bexprs(obj_bexprs)
@@ -501,22 +728,12 @@ class NAMOSolver(LLSolver):
             assert isinstance(pred, common_predicates.ExprPredicate)
             expr = pred.get_expr(negated)
 
-            for t in effective_timesteps:
-                if t in active_range:
-                    if expr is not None:
-                        if add_nonlin or isinstance(expr.expr, AffExpr):
-                            if verbose:
-                                print "expr being added at time ", t
-                            var = self._spawn_sco_var_for_pred(pred, t)
-                            bexpr = BoundExpr(expr, var)
-                            self._bexpr_to_pred[bexpr] = (negated, pred, t)
-                            groups = ['all']
-                            if self.early_converge:
-                                ## this will check for convergence per parameter
-                                ## this is good if e.g., a single trajectory quickly
-                                ## gets stuck
-                                groups.extend([param.name for param in pred.params])
-                            self._prob.add_cnt_expr(bexpr, groups)
+            if expr is not None:
+                if add_nonlin or isinstance(expr.expr, AffExpr):
+                    ts = [t for t in effective_timesteps if t in active_range]
+                    if verbose:
+                        print "expr being added at times ", ts
+                    self._add_cnt_exprs(expr, negated, pred, ts)
 
     def _add_first_and_last_timesteps_of_actions(self, plan, priority = MAX_PRIORITY, add_nonlin=False, active_ts=None, verbose=False):
         if active_ts==None:
@@ -0,0 +1,98 @@
+import numpy as np
+from sco.expr import EqExpr, LEqExpr, AffExpr
+from core.util_classes.common_constants import TRAJOPT_COEFF
+
+"""
+Penalized objective of a plan computed directly from its parameter arrays,
+without building a Gurobi model: the same value as NAMOSolver.get_value,
+i.e. the trajectory smoothness cost plus penalty_coeff times the total
+violation of the constraints of the plan's actions. Cheap enough to rank
+search nodes and to monitor plans during refinement.
+"""
+
+class PlanEvaluator(object):
+    """
+    traj_types are the parameter types with a trajectory cost, priority
+    the highest predicate priority counted (as in NAMOSolver.get_value).
+    The default traj_coeff is the one of NAMOSolver: plans of CanSolver or
+    RobotLLSolver take common_constants.ROBOT_TRAJOPT_COEFF.
+    """
+    def __init__(self, traj_coeff=TRAJOPT_COEFF, traj_types=('Robot', 'Can'), priority=1):
+        self.traj_coeff = traj_coeff
+        self.traj_types = traj_types
+        self.priority = priority
+
+    def traj_cost(self, plan, active_ts=None):
+        """
+        Sum of traj_coeff/2 * ||pose[:, t+1] - pose[:, t]||^2 over the
+        traj_types parameters, the value of NAMOSolver._get_trajopt_obj.
+        """
+        if active_ts is None:
+            active_ts = (0, plan.horizon-1)
+        start, end = active_ts
+        cost = 0.
+        for param in plan.params.values():
+            if param._type not in self.traj_types:
+                continue
+            pose = param.pose[:, start:end+1]
+            cost += 0.5 * self.traj_coeff * np.sum(np.diff(pose, axis=1)**2)
+        return cost
+
+    def _pred_timesteps(self, plan, active_ts):
+        ## (negated, pred, ts) the solver adds in _add_all_timesteps_of_actions
+        for action in plan.actions:
+            action_start, action_end = action.active_timesteps
+            if action_start >= active_ts[1] and action_start > active_ts[0]: continue
+            if action_end < active_ts[0]: continue
+            lo = max(action_start, active_ts[0])
+            hi = min(action_end, active_ts[1])
+            for pred_dict in action.preds:
+                if pred_dict['hl_info'] == "hl_state":
+                    continue
+                pred = pred_dict['pred']
+                if pred.priority > max(self.priority, 0):
+                    continue
+                start, end = pred_dict['active_timesteps']
+                t0, t1 = max(lo, start), min(hi, end)
+                if t0 <= t1:
+                    yield pred_dict['negated'], pred, t0, t1
+
+    def violations(self, plan, active_ts=None):
+        """
+        Returns a list of (negated, pred, t, violation) for every constraint
+        the solver would add, where violation is the array of the absolute
+        (equalities) or positive (inequalities) constraint errors at t.
+        """
+        if active_ts is None:
+            active_ts = (0, plan.horizon-1)
+        res = []
+        for negated, pred, t0, t1 in self._pred_timesteps(plan, active_ts):
+            expr = pred.get_expr(negated)
+            if expr is None:
+                continue
+            if isinstance(expr.expr, AffExpr):
+                ## one evaluation for all the timesteps
+                vals = expr.expr.eval(pred.get_param_vector_range(t0, t1))
+                errs = [_violation(expr, vals[:, [i]]) for i in range(t1-t0+1)]
+            else:
+                errs = [_violation(expr, expr.expr.eval(pred.get_param_vector(t)))
+                        for t in range(t0, t1+1)]
+            res.extend((negated, pred, t, e) for t, e in zip(range(t0, t1+1), errs))
+        return res
+
+    def total_violation(self, plan, active_ts=None):
+        return sum(np.sum(v) for _, _, _, v in self.violations(plan, active_ts))
+
+    def get_value(self, plan, penalty_coeff=1e0, active_ts=None):
+        """
+        Trajectory cost plus penalty_coeff times the total constraint
+        violation.
+        """
+        return self.traj_cost(plan, active_ts) + \
+            penalty_coeff * self.total_violation(plan, active_ts)
+
+def _violation(expr, val):
+    if isinstance(expr, LEqExpr):
+        return np.maximum(val - expr.val, 0)
+    assert isinstance(expr, EqExpr)
+    return np.absolute(val - expr.val)
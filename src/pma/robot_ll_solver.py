@@ -4,6 +4,7 @@ from sco.expr import BoundExpr, QuadExpr, AffExpr
 from sco.solver import Solver
 from openravepy import matrixFromAxisAngle
 from core.util_classes import common_predicates
+from core.util_classes.common_constants import ROBOT_TRAJOPT_COEFF as TRAJOPT_COEFF
 from core.util_classes import baxter_predicates
 from core.util_classes.matrix import Vector
 from core.util_classes.robots import Baxter
@@ -18,13 +19,15 @@ from IPython import embed as shell
 from core.util_classes import sampling
 from core.util_classes.viewer import OpenRAVEViewer
 from core.util_classes import baxter_sampling
+from core.util_classes.sphere_tree import SPHERES, collision_fidelity
 
 
 MAX_PRIORITY=5
 BASE_MOVE_COEFF = 10
-TRAJOPT_COEFF=1e3
 SAMPLE_SIZE = 5
 BASE_SAMPLE_SIZE = 5
+## tolerance of the sphere collision pass of multi fidelity solves
+SPHERE_TOL = 1e-1
 
 
 attr_map = {'Robot': ['lArmPose', 'lGripper','rArmPose', 'rGripper', 'pose'],
@@ -35,7 +38,8 @@ attr_map = {'Robot': ['lArmPose', 'lGripper','rArmPose', 'rGripper', 'pose'],
             'Obstacle': ['pose', 'rotation']}
 
 class RobotLLSolver(LLSolver):
-    def __init__(self, early_converge=False, transfer_norm='min-vel'):
+    def __init__(self, early_converge=False, transfer_norm='min-vel', traj_library=None, multi_fidelity=False,
+                 lazy_collisions=False, stack_cnts=False, compile_affine=False):
         self.transfer_coeff = 1e1
         self.rs_coeff = 1e10
         self.initial_trust_region_size = 1e-2
@@ -47,6 +51,18 @@ class RobotLLSolver(LLSolver):
         self.child_solver = None
         self.solve_priorities = [2]
         self.transfer_norm = transfer_norm
+        ## solved plans are added to traj_library without saving it every
+        ## time: the owner of the library saves or closes it
+        self.traj_library = traj_library
+        ## check collisions against sphere trees during initialization and
+        ## until the solution is close, and against link meshes after that
+        self.multi_fidelity = multi_fidelity
+        ## add collision constraints to the problem once they become active
+        self.lazy_collisions = lazy_collisions
+        ## add the constraints of each predicate as blocks over timesteps
+        self.stack_cnts = stack_cnts
+        ## add the affine constraints to the model once, as hard constraints
+        self.compile_affine = compile_affine
 
 
     def _solve_helper(self, plan, callback, active_ts, verbose):
@@ -65,9 +81,13 @@ class RobotLLSolver(LLSolver):
               verbose=False, force_init=False):
         success = False
         if force_init or not plan.initialized:
+            ## a trajectory from the library replaces the linear initialization
+            warm_started = self.traj_library is not None and \
+                self.traj_library.warm_start(plan, active_ts)
+            if not warm_started:
+                self._solve_opt_prob(plan, priority=-2, callback=callback,
+                    active_ts=active_ts, verbose=verbose)
              ## solve at priority -1 to get an initial value for the parameters
-            self._solve_opt_prob(plan, priority=-2, callback=callback,
-                active_ts=active_ts, verbose=verbose)
             self._solve_opt_prob(plan, priority=-1, callback=callback,
                 active_ts=active_ts, verbose=verbose)
             plan.initialized=True
@@ -78,6 +98,7 @@ class RobotLLSolver(LLSolver):
         # self.saver.write_plan_to_hdf5("temp_plan.hdf5", plan)
 
         if success or len(plan.get_failed_preds()) == 0:
+            self._record_traj(plan)
             return True
             # return success
 
@@ -92,9 +113,14 @@ class RobotLLSolver(LLSolver):
                             callback=callback, active_ts=active_ts, verbose=verbose)
             if success or len(plan.get_failed_preds()) == 0:
                 print "Optimization success after {} resampling.".format(_)
+                self._record_traj(plan)
                 return _
         return success
 
+    def _record_traj(self, plan):
+        if self.traj_library is not None:
+            self.traj_library.add_plan(plan, save=False)
+
     def _solve_opt_prob(self, plan, priority, callback=None, init=True,
                         active_ts=None, verbose=False):
         robot = plan.params['baxter']
@@ -119,6 +145,8 @@ class RobotLLSolver(LLSolver):
 
 
         self._bexpr_to_pred = {}
+        self._lazy_cnts = []
+        self._aff_cnts = []
         if priority == -2:
             """
             Initialize an linear trajectory while enforceing the linear constraints in the intermediate step.
@@ -171,11 +199,16 @@ class RobotLLSolver(LLSolver):
                                                active_ts=active_ts, verbose=verbose)
             tol=1e-3
 
+        self._add_compiled_aff_cnts()
         solv = Solver()
         solv.initial_trust_region_size = self.initial_trust_region_size
         solv.initial_penalty_coeff = self.init_penalty_coeff
         solv.max_merit_coeff_increases = self.max_merit_coeff_increases
-        success = solv.solve(self._prob, method='penalty_sqp', tol=tol, verbose=True)
+        if self.multi_fidelity and priority != -2:
+            with collision_fidelity(SPHERES):
+                success = self._solve_lazy(solv, max(tol, SPHERE_TOL), True)
+        if not self.multi_fidelity or priority != -1:
+            success = self._solve_lazy(solv, tol, True)
         self._update_ll_params()
         print "priority: {}".format(priority)
 
@@ -315,24 +348,12 @@ class RobotLLSolver(LLSolver):
             assert isinstance(pred, common_predicates.ExprPredicate)
             expr = pred.get_expr(negated)
 
-            for t in effective_timesteps:
-                if t in active_range:
-                    if expr is not None:
-                        if add_nonlin or isinstance(expr.expr, AffExpr):
-                            if verbose:
-                                print "expr being added at time ", t
-                            var = self._spawn_sco_var_for_pred(pred, t)
-                            bexpr = BoundExpr(expr, var)
-                            # TODO: REMOVE line below, for tracing back predicate for debugging.
-                            bexpr.pred = pred
-                            self._bexpr_to_pred[bexpr] = (negated, pred, t)
-                            groups = ['all']
-                            if self.early_converge:
-                                ## this will check for convergence per parameter
-                                ## this is good if e.g., a single trajectory quickly
-                                ## gets stuck
-                                groups.extend([param.name for param in pred.params])
-                            self._prob.add_cnt_expr(bexpr, groups)
+            if expr is not None:
+                if add_nonlin or isinstance(expr.expr, AffExpr):
+                    ts = [t for t in effective_timesteps if t in active_range]
+                    if verbose:
+                        print "expr being added at times ", ts
+                    self._add_cnt_exprs(expr, negated, pred, ts)
 
     def _add_first_and_last_timesteps_of_actions(self, plan, priority = MAX_PRIORITY,
                                                  add_nonlin=False, active_ts=None, verbose=False):
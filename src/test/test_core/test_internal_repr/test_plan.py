@@ -92,6 +92,36 @@ class TestPlan(unittest.TestCase):
         self.assertEqual(test_plan.get_failed_preds(), [])
         self.assertTrue(test_plan.satisfied())
 
+    def test_get_failed_pred_early_termination(self):
+        self.setup()
+        params = [self.can1, self.target]
+        pred_dict = [{'pred': self.pred0, 'negated': False, 'hl_info': 'pre', 'active_timesteps': (0, 3)}]
+        act0 = action.Action(0, 'test_action0', (0,3), params, pred_dict)
+        params = [self.can2, self.target]
+        pred_dict = [{'pred': self.pred1, 'negated': False, 'hl_info': 'pre', 'active_timesteps': (0, 3)}]
+        act1 = action.Action(1, 'test_action1', (0,3), params, pred_dict)
+        plan_params = {"can1": self.can1, "can2": self.can2, "target": self.target}
+        test_plan = plan.Plan(plan_params, [act0, act1], 4, 1) #1 is a dummy_env
+
+        self.can1.pose = np.array([[5, 5, 7, 9],
+                                   [5, 5, 6, 8]])
+        self.can2.pose = np.array([[5, 9, 5, 5],
+                                   [5, 4, 5, 5]])
+        self.target.value = np.array([[5],
+                                      [5]])
+        ## ties are broken by the order of the actions
+        self.can2.pose[:, 1] = [5, 5]
+        self.can1.pose[:, 1] = [9, 9]
+        self.assertEqual(test_plan.get_failed_pred(), (False, self.pred0, 1))
+        ## only the timesteps up to the first failure are tested
+        self.assertEqual(test_plan._satisfaction_cache.misses, 3)
+        self.can1.pose[:, 1] = [5, 5]
+        self.assertEqual(test_plan.get_failed_pred(), (False, self.pred0, 2))
+        self.assertEqual(test_plan.get_failed_pred(active_ts=(3, 3)), (False, self.pred0, 3))
+        self.can1.pose = np.array([[5, 5, 5, 5],
+                                   [5, 5, 5, 5]])
+        self.assertEqual(test_plan.get_failed_pred(), (False, None, 5))
+
     def test_get_active_preds(self):
         self.setup()
         params = [self.can1, self.target]
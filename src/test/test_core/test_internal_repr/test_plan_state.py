@@ -0,0 +1,134 @@
+import unittest, os, pickle, copy
+import h5py
+import numpy as np
+from core.internal_repr import parameter
+from core.internal_repr.plan_state import PackedPlanState, PackedAttrDict
+from core.util_classes import circle
+from core.util_classes.matrix import Vector2d
+
+TEST_FILE = "test_plan_state.hdf5"
+
+class TestPackedPlanState(unittest.TestCase):
+
+    def setUp(self):
+        attrs = {"name": ["robot"], "geom": [1], "pose": [(0,0)], "_type": ["Robot"]}
+        attr_types = {"name": str, "geom": circle.RedCircle,"pose": Vector2d, "_type": str}
+        self.robot = parameter.Object(attrs, attr_types)
+        self.robot.pose = np.array([[1., 2., 3.],
+                                    [4., 5., 6.]])
+        self.robot._free_attrs['pose'] = np.array([[0, 1, 1],
+                                                   [0, 1, 1]])
+
+        attrs = {"name": ["target"], "geom": [1], "value": [(7,8)], "_type": ["Target"]}
+        attr_types = {"name": str, "geom": circle.BlueCircle, "value": Vector2d, "_type": str}
+        self.target = parameter.Symbol(attrs, attr_types)
+        self.target._free_attrs['value'] = np.zeros((2, 1), dtype=np.int)
+        self.params = {"robot": self.robot, "target": self.target}
+
+    def tearDown(self):
+        if os.path.isfile(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def test_packing(self):
+        state = PackedPlanState(self.params)
+        self.assertEqual(state.size, 8)
+        self.assertTrue(np.allclose(state.buf, [1, 2, 3, 4, 5, 6, 7, 8]))
+        self.assertEqual(state.free.tolist(), [0, 1, 1, 0, 1, 1, 0, 0])
+        self.assertTrue(state.is_bound("robot", "pose"))
+        self.assertTrue(isinstance(self.robot._free_attrs, PackedAttrDict))
+
+        ## in place writes and assignment of the same shape go to the buffer
+        self.robot.pose[:, 0] = [9, 9]
+        self.assertTrue(np.allclose(state.buf[[0, 3]], [9, 9]))
+        self.robot.pose = np.zeros((2, 3))
+        self.assertTrue(np.allclose(state.buf[:6], 0))
+        self.assertTrue(state.is_bound("robot", "pose"))
+        self.robot._free_attrs['pose'] = np.ones((2, 3), dtype=np.int)
+        self.assertEqual(state.free.tolist(), [1, 1, 1, 1, 1, 1, 0, 0])
+
+        ## save and restore of free attrs keep the packed buffer
+        self.robot.save_free_attrs()
+        self.robot._free_attrs['pose'][:] = 0
+        self.robot.restore_free_attrs()
+        self.assertEqual(state.free.tolist(), [1, 1, 1, 1, 1, 1, 0, 0])
+
+        ## a different shape detaches the attribute
+        self.robot.pose = np.zeros((2, 4))
+        self.assertFalse(state.is_bound("robot", "pose"))
+        self.assertEqual(self.robot.pose.shape, (2, 4))
+
+    def test_snapshot_and_diff(self):
+        state = PackedPlanState(self.params)
+        snapshot = state.snapshot()
+        self.assertEqual(state.diff(snapshot), {})
+        self.robot.pose[1, 2] = 0
+        diff = state.diff(snapshot)
+        self.assertEqual(diff.keys(), [("robot", "pose")])
+        self.assertEqual(diff[("robot", "pose")].tolist(), [False, False, True])
+        state.restore(snapshot)
+        self.assertTrue(np.allclose(self.robot.pose, [[1, 2, 3], [4, 5, 6]]))
+
+    def test_hdf5(self):
+        state = PackedPlanState(self.params)
+        f = h5py.File(TEST_FILE, 'w')
+        state.write_to_hdf5(f.create_group('packed_state'))
+        f.close()
+        self.robot.pose[:] = 0
+        self.target.value[:] = 0
+        f = h5py.File(TEST_FILE, 'r')
+        state.read_from_hdf5(f['packed_state'])
+        f.close()
+        self.assertTrue(np.allclose(self.robot.pose, [[1, 2, 3], [4, 5, 6]]))
+        self.assertTrue(np.allclose(self.target.value, [[7], [8]]))
+
+    def test_from_hdf5(self):
+        state = PackedPlanState(self.params)
+        f = h5py.File(TEST_FILE, 'w')
+        state.write_to_hdf5(f.create_group('packed_state'))
+        f.close()
+        ## parameters restored without their packed arrays
+        params = {}
+        for name, param in self.params.iteritems():
+            param = copy.copy(param)
+            attr = 'pose' if name == 'robot' else 'value'
+            del param.__dict__[attr]
+            del param._free_attrs[attr]
+            params[name] = param
+        f = h5py.File(TEST_FILE, 'r')
+        new_state = PackedPlanState.from_hdf5(f['packed_state'], params)
+        f.close()
+        self.assertEqual(new_state.layout, state.layout)
+        self.assertTrue(new_state.is_bound("robot", "pose"))
+        self.assertTrue(np.allclose(params["robot"].pose, [[1, 2, 3], [4, 5, 6]]))
+        self.assertEqual(params["robot"]._free_attrs['pose'].tolist(), [[0, 1, 1], [0, 1, 1]])
+        self.assertTrue(np.allclose(params["target"].value, [[7], [8]]))
+        params["robot"].pose[0, 0] = 0
+        self.assertEqual(new_state.buf[0], 0)
+
+    def test_copy_params(self):
+        new_params, state = PackedPlanState.copy_params(self.params, 5)
+        robot, target = new_params["robot"], new_params["target"]
+        self.assertEqual(state.size, 12)
+        self.assertEqual(robot.pose.shape, (2, 5))
+        self.assertTrue(np.allclose(robot.pose[:, :3], self.robot.pose))
+        self.assertTrue(np.all(np.isnan(robot.pose[:, 3:])))
+        self.assertTrue(np.allclose(target.value, self.target.value))
+        self.assertTrue(target.is_symbol())
+        self.assertEqual(robot.geom, self.robot.geom)
+        ## the copies do not share values with the originals
+        robot.pose[0, 0] = 10
+        self.assertEqual(self.robot.pose[0, 0], 1)
+
+    def test_share_and_pickle(self):
+        state = PackedPlanState(self.params)
+        shared_buf, shared_free = state.share()
+        self.robot.pose[0, 0] = 10
+        self.assertEqual(np.frombuffer(shared_buf)[0], 10)
+        self.assertTrue(state.is_bound("robot", "pose"))
+        robot = pickle.loads(pickle.dumps(self.robot))
+        self.assertFalse('_packed_state' in robot.__dict__)
+        robot.pose[0, 0] = 0
+        self.assertEqual(self.robot.pose[0, 0], 10)
+
+if __name__ == "__main__":
+    unittest.main()
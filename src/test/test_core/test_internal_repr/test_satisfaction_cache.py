@@ -0,0 +1,107 @@
+import unittest
+from core.internal_repr import parameter
+from core.internal_repr.satisfaction_cache import SatisfactionCache, PACKED
+from core.internal_repr.plan_state import PackedPlanState
+from core.util_classes import namo_predicates
+from core.util_classes import circle
+from core.util_classes.matrix import Vector2d
+import numpy as np
+
+
+class TestSatisfactionCache(unittest.TestCase):
+
+    def setUp(self):
+        attrs = {"name": ["can"], "geom": [1], "pose": [(3,4)], "_type": ["Can"]}
+        attr_types = {"name": str, "geom": circle.RedCircle, "pose": Vector2d, "_type": str}
+        self.can = parameter.Object(attrs, attr_types)
+
+        attrs = {"name": ["target"], "geom": [1], "value": [(5,5)], "_type": ["Target"]}
+        attr_types = {"name": str, "geom": circle.BlueCircle, "value": Vector2d, "_type": str}
+        self.target = parameter.Symbol(attrs, attr_types)
+
+        self.pred = namo_predicates.At("At_0", [self.can, self.target], ["Can", "Target"])
+        self.can.pose = np.array([[5, 5, 7, 9],
+                                  [5, 5, 6, 8]], dtype=np.float)
+
+    def test_cached_results(self):
+        cache = SatisfactionCache()
+        results = [cache.test(self.pred, t) for t in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(cache.misses, 4)
+        cache.refresh()
+        self.assertEqual([cache.test(self.pred, t) for t in range(4)], results)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 4)
+        ## negated results are cached separately
+        self.assertFalse(cache.test(self.pred, 0, negated=True))
+        self.assertEqual(cache.misses, 5)
+
+    def test_in_place_change(self):
+        cache = SatisfactionCache()
+        for t in range(4):
+            cache.test(self.pred, t)
+        self.can.pose[:, 2] = [5, 5]
+        cache.refresh()
+        self.assertTrue(cache.test(self.pred, 2))
+        self.assertEqual(cache.misses, 5)
+        ## other timesteps are still cached
+        self.assertTrue(cache.test(self.pred, 1))
+        self.assertFalse(cache.test(self.pred, 3))
+        self.assertEqual(cache.misses, 5)
+
+    def test_reassignment(self):
+        cache = SatisfactionCache()
+        for t in range(4):
+            cache.test(self.pred, t)
+        self.can.pose = np.array([[5, 5, 7, 5],
+                                  [5, 5, 6, 5]], dtype=np.float)
+        cache.refresh()
+        self.assertTrue(cache.test(self.pred, 3))
+        self.assertEqual(cache.misses, 5)
+
+    def test_symbol_change(self):
+        cache = SatisfactionCache()
+        for t in range(4):
+            cache.test(self.pred, t)
+        self.target.value = np.array([[9], [8]], dtype=np.float)
+        cache.refresh()
+        self.assertEqual([cache.test(self.pred, t) for t in range(4)], [False, False, False, True])
+        self.assertEqual(cache.misses, 8)
+
+    def test_packed_state(self):
+        state = PackedPlanState({"can": self.can, "target": self.target})
+        cache = SatisfactionCache()
+        for t in range(4):
+            cache.test(self.pred, t)
+        ## one snapshot of the state buffer instead of per attribute copies
+        self.assertEqual(cache._snapshots[(self.can, 'pose')], PACKED)
+        self.assertEqual(len(cache._state_snapshots), 1)
+        self.can.pose[:, 2] = [5, 5]
+        cache.refresh()
+        self.assertTrue(cache.test(self.pred, 2))
+        self.assertTrue(cache.test(self.pred, 1))
+        self.assertEqual(cache.misses, 5)
+        self.target.value = np.array([[7], [6]], dtype=np.float)
+        cache.refresh()
+        self.assertEqual([cache.test(self.pred, t) for t in range(4)], [False, False, False, False])
+        self.assertEqual(cache.misses, 9)
+        ## a detached attribute falls back to its own snapshot
+        self.can.pose = np.array([[7, 7, 7, 7, 7],
+                                  [6, 6, 6, 6, 6]], dtype=np.float)
+        self.assertFalse(state.is_bound("can", "pose"))
+        cache.refresh()
+        self.assertEqual([cache.test(self.pred, t) for t in range(4)], [True]*4)
+        self.assertEqual(cache.misses, 13)
+
+    def test_invalidate(self):
+        cache = SatisfactionCache()
+        cache.test(self.pred, 0)
+        cache.invalidate(self.can)
+        cache.test(self.pred, 0)
+        self.assertEqual(cache.misses, 2)
+        cache.invalidate()
+        cache.test(self.pred, 0)
+        self.assertEqual(cache.misses, 3)
+
+if __name__ == "__main__":
+    unittest.main()
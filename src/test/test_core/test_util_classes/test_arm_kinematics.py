@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+from core.util_classes.arm_kinematics import KinematicChain, ChainRobotBody, base_transforms, rotations
+
+N = 10
+
+def translation(p):
+    trans = np.eye(4)
+    trans[:3, 3] = p
+    return trans
+
+class TestArmKinematics(unittest.TestCase):
+
+    def setUp(self):
+        ## planar arm: a shoulder about z at the root, a unit link, an elbow
+        ## about z, a unit link, and a fixed tool frame raised by a slider
+        self.chain = KinematicChain([
+            (np.eye(4), np.eye(4), [0, 0, 1], 1, False),
+            (translation([1, 0, 0]), np.eye(4), [0, 0, 1], 3, False),
+            (translation([1, 0, 0]), np.eye(4), [0, 0, 1], 0, True),
+            (translation([0, 0, 0.5]), np.eye(4), [0, 0, 1], -1, False)])
+
+    def test_forward(self):
+        dof_values = np.array([[0, 0, 0, 0], [0.2, np.pi/2, 0, 0], [0, np.pi/2, 0, -np.pi/2]])
+        trans, frames = self.chain.forward(dof_values, np.eye(4))
+        self.assertEqual(trans.shape, (3, 4, 4))
+        self.assertEqual(self.chain.dof_inds, [1, 3, 0])
+        self.assertTrue(np.allclose(trans[:, :3, 3], [[2, 0, 0.5], [0, 2, 0.7], [1, 1, 0.5]]))
+        self.assertTrue(np.allclose(frames[3][1], [[1, 0, 0], [0, 1, 0], [0, 1, 0]]))
+        self.assertTrue(np.allclose(trans[2, :3, :3], np.eye(3)))
+        ## moving the base moves the whole arm
+        base = base_transforms([[1, 2, np.pi]])
+        trans, frames = self.chain.forward(dof_values, base)
+        self.assertTrue(np.allclose(trans[0, :3, 3], [-1, 2, 0.5]))
+
+    def test_jacobian(self):
+        dof_values = np.array([[0.1, 0.3, 0, -0.7]])
+        trans, frames = self.chain.forward(dof_values, np.eye(4))
+        jac = self.chain.position_jacobian(trans[:, :3, 3], frames, [1, 3])
+        eps = 1e-6
+        for i, ind in enumerate([1, 3]):
+            dx = dof_values.copy()
+            dx[0, ind] += eps
+            trans_eps, _ = self.chain.forward(dx, np.eye(4))
+            self.assertTrue(np.allclose((trans_eps - trans)[0, :3, 3]/eps, jac[0, :, i], atol=1e-4))
+            rot_jac = self.chain.rotation_jacobian(trans[:, :3, 0], frames, [ind])
+            self.assertTrue(np.allclose((trans_eps - trans)[0, :3, 0]/eps, rot_jac[0, :, 0], atol=1e-4))
+
+    def test_openrave_models(self):
+        from openravepy import Environment
+        from core.util_classes.openrave_body import OpenRAVEBody
+        from core.util_classes.robots import PR2, Baxter
+        env = Environment()
+        for name, geom, link_name, manip, base in [
+                ('pr2', PR2(), 'r_gripper_tool_frame', 'rightarm', [0.3, -0.2, 0]),
+                ('baxter', Baxter(), 'right_gripper', 'right_arm', [0, 0, 0])]:
+            body = OpenRAVEBody(env, name, geom)
+            robot = body.env_body
+            link = robot.GetLink(link_name)
+            lower, upper = robot.GetDOFLimits()
+            lower, upper = np.maximum(lower, -np.pi), np.minimum(upper, np.pi)
+            for _ in range(N):
+                dof_values = lower + np.random.rand(len(lower))*(upper - lower)
+                base_pose = np.array(base) + [0, 0, np.random.uniform(-np.pi, np.pi)]
+                body.set_pose(base_pose)
+                robot.SetDOFValues(dof_values)
+                chain_body = ChainRobotBody(body)
+                chain_body.set_pose(base_pose)
+                chain_body.dof_values = dof_values.copy()
+                ## link transforms
+                chain_trans = chain_body.env_body.GetLink(link_name).GetTransform()
+                self.assertTrue(np.allclose(chain_trans, link.GetTransform(), atol=1e-6))
+                ## position jacobian of a point on the link
+                trans, frames = chain_body.forward(link_name)
+                pt = trans[0, :3, 3] + np.random.rand(3)*0.1
+                chain_jac = KinematicChain.position_jacobian(pt, frames, list(frames.keys()))[0]
+                jac = robot.CalculateJacobian(link.GetIndex(), pt)
+                self.assertTrue(np.allclose(chain_jac, jac[:, list(frames.keys())], atol=1e-6))
+                other = [i for i in range(robot.GetDOF()) if i not in frames]
+                self.assertTrue(np.allclose(jac[:, other], 0))
+                ## joint axes and anchors
+                for ind in frames:
+                    joint = robot.GetJointFromDOFIndex(ind)
+                    chain_joint = chain_body.env_body.GetJointFromDOFIndex(ind)
+                    self.assertTrue(np.allclose(chain_joint.GetAxis(), joint.GetAxis(), atol=1e-6))
+                    self.assertTrue(np.allclose(np.cross(joint.GetAxis(), chain_joint.GetAnchor() - joint.GetAnchor()), 0, atol=1e-6))
+            ## only the robot model is read from OpenRAVE
+            self.assertEqual(chain_body.env_body.GetManipulator(manip).GetName(), manip)
+            with self.assertRaises(AttributeError):
+                chain_body.env_body.GetLinks()
+        env.Destroy()
+
+    def test_rotations(self):
+        rot = rotations([0, 0, 1], np.array([np.pi/2]))
+        self.assertTrue(np.allclose(rot[0].dot([1, 0, 0]), [0, 1, 0]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -251,6 +251,14 @@ class TestBaxterPredicates(unittest.TestCase):
 
         if const.TEST_GRAD: pred2.expr.expr.grad(pred2.get_param_vector(3), True, 1e-3)
 
+        # Batched evaluation agrees with evaluating each step on its own
+        x = pred.get_param_vector(3)
+        val, jac = pred.stacked_pos_check(x)
+        for i, s in enumerate(range(-3, 4)):
+            step_val, step_jac = pred.ee_pose_check_rel_obj(x[i*pred.attr_dim:(i+1)*pred.attr_dim], pred.get_rel_pt(s))
+            self.assertTrue(np.allclose(val[3*i:3*i+3], step_val))
+            self.assertTrue(np.allclose(jac[3*i:3*i+3, i*pred.attr_dim:(i+1)*pred.attr_dim], step_jac))
+
 
     def test_obstructs(self):
 
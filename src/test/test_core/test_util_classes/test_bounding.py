@@ -0,0 +1,30 @@
+import unittest
+import numpy as np
+from core.util_classes import bounding, can, box, table, circle, wall, robots
+
+class TestBounding(unittest.TestCase):
+
+    def test_bounding_radius(self):
+        self.assertAlmostEqual(bounding.bounding_radius(can.BlueCan(0.3, 0.8)), 0.5)
+        self.assertAlmostEqual(bounding.bounding_radius(box.Box([1, 2, 2])), 3)
+        self.assertAlmostEqual(bounding.bounding_radius(circle.RedCircle(1)), 1)
+        self.assertTrue(bounding.bounding_radius(object()) is None)
+        table_geom = table.Table([2, 1, 0.1, 0.1, 0.1, 0.6, False])
+        ## every leg corner is inside the sphere
+        corner = np.array([1, 0.5, 0.6 + 0.05])
+        self.assertTrue(bounding.bounding_radius(table_geom) >= np.linalg.norm(corner))
+        ## every wall box corner is inside the sphere
+        wall_geom = wall.Wall('closet')
+        centers, half_extents = wall_geom.get_boxes()
+        corners = np.abs(centers) + half_extents
+        r = bounding.bounding_radius(wall_geom)
+        self.assertTrue(np.all(np.sum(corners**2, axis=1) + 1 <= r**2 + 1e-8))
+
+    def test_spheres_apart(self):
+        self.assertTrue(bounding.spheres_apart([0, 0, 0], 1, [3, 0, 0], 1, 0.5))
+        self.assertFalse(bounding.spheres_apart([0, 0, 0], 1, [3, 0, 0], 1, 1.))
+        self.assertFalse(bounding.spheres_apart([0, 0, 0], None, [30, 0, 0], 1, 0.5))
+        self.assertTrue(bounding.spheres_apart(np.zeros((3, 1)), 1, np.array([[0], [4], [0]]), 1, 0.1))
+
+if __name__ == "__main__":
+    unittest.main()
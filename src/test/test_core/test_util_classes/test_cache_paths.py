@@ -0,0 +1,32 @@
+import unittest, os, shutil, tempfile
+from core.util_classes import cache_paths
+
+class TestCachePaths(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.prev = os.environ.get(cache_paths.CACHE_DIR_VAR)
+        os.environ[cache_paths.CACHE_DIR_VAR] = os.path.join(self.tmp, 'cache')
+
+    def tearDown(self):
+        if self.prev is None:
+            del os.environ[cache_paths.CACHE_DIR_VAR]
+        else:
+            os.environ[cache_paths.CACHE_DIR_VAR] = self.prev
+        shutil.rmtree(self.tmp)
+
+    def test_cache_path(self):
+        cache = os.path.join(self.tmp, 'cache')
+        self.assertEqual(cache_paths.cache_path('sdf_cache.hdf5'), os.path.join(cache, 'sdf_cache.hdf5'))
+        self.assertTrue(os.path.isdir(cache))
+        ## independent of the working directory
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            self.assertEqual(cache_paths.cache_path('sdf_cache.hdf5'), os.path.join(cache, 'sdf_cache.hdf5'))
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(cache_paths.cache_path('/tmp/x.hdf5'), '/tmp/x.hdf5')
+
+if __name__ == "__main__":
+    unittest.main()
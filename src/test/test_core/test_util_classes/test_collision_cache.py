@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from core.internal_repr import parameter
+from core.util_classes import circle
+from core.util_classes.matrix import Vector2d
+from core.util_classes.collision_cache import CollisionCache, get_collision_cache
+
+class TestCollisionCache(unittest.TestCase):
+
+    def setUp(self):
+        attrs = {"name": ["robot"], "geom": [1], "pose": [(0,0)], "_type": ["Robot"]}
+        attr_types = {"name": str, "geom": circle.RedCircle,"pose": Vector2d, "_type": str}
+        self.robot = parameter.Object(attrs, attr_types)
+        attrs = {"name": ["can"], "geom": [1], "pose": [(3,4)], "_type": ["Can"]}
+        attr_types = {"name": str, "geom": circle.BlueCircle,"pose": Vector2d, "_type": str}
+        self.can = parameter.Object(attrs, attr_types)
+
+    def test_keys(self):
+        cache = CollisionCache()
+        x = np.array([0., 0., 3., 4.])
+        key = cache.make_key('namo', [self.robot, self.can], x, 3, 1e-1)
+        ## rounding makes nearby poses share a key
+        self.assertEqual(key, cache.make_key('namo', [self.robot, self.can], x + 1e-5, 3, 1e-1))
+        self.assertNotEqual(key, cache.make_key('namo', [self.can, self.robot], x, 3, 1e-1))
+        self.assertNotEqual(key, cache.make_key('namo', [self.robot, self.can], x, 3, 1e-2))
+        self.assertNotEqual(key, cache.make_key('namo', [self.robot, self.can], x + 1e-2, 3, 1e-1))
+
+    def test_lru(self):
+        cache = CollisionCache(capacity=2)
+        val, jac = np.zeros((1, 1)), np.ones((1, 4))
+        self.assertTrue(cache.get('a') is None)
+        cached = cache.put('a', (val, jac))
+        ## values are copied into the cache
+        jac[:] = 2
+        self.assertTrue(np.allclose(cache.get('a')[1], 1))
+        self.assertTrue(np.allclose(cached[1], 1))
+        cache.put('b', (val, jac))
+        cache.get('a')
+        cache.put('c', (val, jac))
+        ## b is the least recently used entry
+        self.assertTrue('a' in cache and 'c' in cache)
+        self.assertFalse('b' in cache)
+        stats = cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['nbytes'], 2*(val.nbytes + jac.nbytes))
+        self.assertAlmostEqual(cache.hit_rate(), 2./3)
+
+        cache.set_capacity(1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_shared(self):
+        self.assertTrue(get_collision_cache() is get_collision_cache())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import os
+import numpy as np
+from core.util_classes import collision_meshes
+from core.util_classes.robots import Baxter
+from core.util_classes.param_setup import ParamSetup
+
+TEST_FILE = os.path.abspath('test_collision_meshes.hdf5')
+
+class TestCollisionMeshes(unittest.TestCase):
+
+    def tearDown(self):
+        if os.path.isfile(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def test_convex_hull(self):
+        corners = np.array(np.meshgrid([0, 1], [0, 1], [0, 1])).reshape((3, -1)).T
+        vertices = np.r_[corners, np.random.rand(50, 3)*0.8 + 0.1].astype(np.float)
+        hull_vertices, indices = collision_meshes.convex_hull(vertices)
+        ## interior points are dropped
+        self.assertEqual(len(hull_vertices), 8)
+        self.assertTrue(np.all(np.sort(hull_vertices.sum(axis=1)) == np.sort(corners.sum(axis=1))))
+        ## triangles face outwards
+        v0, v1, v2 = hull_vertices[indices[:, 0]], hull_vertices[indices[:, 1]], hull_vertices[indices[:, 2]]
+        normals = np.cross(v1 - v0, v2 - v0)
+        self.assertTrue(np.all(np.sum(normals * (v0 - [0.5, 0.5, 0.5]), axis=1) > 0))
+
+    def test_cache_files(self):
+        geom = Baxter()
+        ## model paths do not depend on the working directory
+        cwd = os.getcwd()
+        model = collision_meshes.model_file(geom)
+        os.chdir('/')
+        try:
+            self.assertEqual(collision_meshes.model_file(geom), model)
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(os.path.isfile(model))
+        self.assertEqual(os.path.dirname(collision_meshes.model_cache_file(geom)), os.path.dirname(model))
+        ## hulls computed at run time go to the cache directory
+        self.assertNotEqual(os.path.dirname(collision_meshes.cache_file()), os.path.dirname(model))
+
+    def test_load(self):
+        env = ParamSetup.setup_env()
+        geom = Baxter()
+        robot = env.ReadRobotXMLFile(geom.shape)
+        env.Add(robot)
+        hulls = collision_meshes.get_hulls(robot, geom, TEST_FILE)
+        self.assertTrue(len(hulls) > 0)
+        self.assertTrue(all(name in geom.col_links for name, _ in hulls))
+        ## the second call reads the cache
+        cached = collision_meshes.get_hulls(robot, geom, TEST_FILE)
+        self.assertEqual(sorted(cached.keys()), sorted(hulls.keys()))
+        collision_meshes.load_collision_meshes(robot, geom, TEST_FILE)
+        name, i = hulls.keys()[0]
+        mesh = robot.GetLink(name).GetGeometries()[i].GetCollisionMesh()
+        self.assertEqual(len(mesh.vertices), len(hulls[(name, i)][0]))
+
+if __name__ == "__main__":
+    unittest.main()
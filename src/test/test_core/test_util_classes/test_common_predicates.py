@@ -45,6 +45,14 @@ class TestCommonPredicates(unittest.TestCase):
         self.assertTrue(np.allclose(pred.get_param_vector(1), [2]))
         self.assertTrue(np.allclose(pred.get_param_vector(2), [3]))
 
+        ## compiled gather indices
+        gather_inds = pred.get_gather_inds()
+        self.assertEqual(len(gather_inds), 1)
+        p, attr, rows, offsets, dst, t_mask = gather_inds[0]
+        self.assertEqual((p, attr, t_mask), (p1, "pose", 1))
+        self.assertEqual((rows.tolist(), offsets.tolist(), dst.tolist()), ([0], [0], [0]))
+        self.assertTrue(pred.get_gather_inds() is gather_inds)
+
         ## unpacking
         unpacked = pred.unpack([10])
         self.assertTrue("can" in unpacked)
@@ -138,6 +146,15 @@ class TestCommonPredicates(unittest.TestCase):
         self.assertTrue(pred2.test(1))
         self.assertTrue(pred2.test(2))
 
+        ## range tests evaluate all timesteps at once
+        for pred in [pred0, pred1, pred2]:
+            for negated in [False, True]:
+                res = [pred.test(t, negated=negated) for t in range(3)]
+                self.assertEqual(pred.test_range(0, 2, negated=negated).tolist(), res)
+        self.assertEqual(pred1.eval_range(0, 2).shape, (1, 3))
+        self.assertEqual(pred1.get_param_vector_range(1, 2).shape, (4, 2))
+        self.assertTrue(np.allclose(pred1.get_param_vector_range(1, 1), pred1.get_param_vector(1)))
+
         ## its LEq, so increasing value for sym should make everything work
         p2.value += 5
         self.assertTrue(pred0.test(0))
@@ -152,6 +169,34 @@ class TestCommonPredicates(unittest.TestCase):
 
 
 
+    def test_expr_memo(self):
+        attrs = {"name": ["can"], "geom": [1], "pose": ["undefined"], "_type": ["Can"]}
+        attr_types = {"name": str, "geom": circle.RedCircle, "pose": float, "_type": str}
+        p1 = parameter.Object(attrs, attr_types)
+        p1.pose = np.array([[1, 2], [3, 4]], dtype=np.float64).T
+        attr_inds = {p1: [("pose", np.array([0, 1], dtype=np.int))]}
+        calls = []
+        def f(x):
+            calls.append(x.copy())
+            return np.array([[x[0, 0]**2 + x[1, 0]**2]])
+        e = expr.LEqExpr(expr.Expr(f, lambda x: 2*x.T), np.array([[5.]]))
+        pred = common_predicates.ExprPredicate("memo_pred", e, attr_inds, [p1], ["Can"])
+        self.assertTrue(pred.test(0))
+        self.assertTrue(pred.test(0))
+        self.assertEqual(len(calls), 1)
+        ## results are copies
+        val = pred.expr.expr.eval(pred.get_param_vector(0))
+        val[0, 0] = 100
+        self.assertEqual(pred.expr.expr.eval(pred.get_param_vector(0))[0, 0], 5.)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(pred.test(1))
+        self.assertEqual(len(calls), 2)
+        ## a different point is evaluated again
+        p1.pose[1, 0] = 1
+        self.assertTrue(pred.test(0))
+        self.assertEqual(len(calls), 3)
+
+
 
 if __name__ is "__main__":
     unittest.main()
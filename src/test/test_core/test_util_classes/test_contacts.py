@@ -0,0 +1,143 @@
+import unittest
+import numpy as np
+from core.util_classes.contacts import contact_arrays, directional_point_jacobians, rotation_jacobians
+from core.util_classes.openrave_body import OpenRAVEBody
+
+class Contact(object):
+    def __init__(self, parents, links, pts, distance, normal):
+        self.parents, self.links, self.pts = parents, links, pts
+        self.distance, self.normal = distance, np.array(normal, dtype=np.float)
+
+    def GetLinkAParentName(self): return self.parents[0]
+    def GetLinkBParentName(self): return self.parents[1]
+    def GetLinkAName(self): return self.links[0]
+    def GetLinkBName(self): return self.links[1]
+    def GetPtA(self): return np.array(self.pts[0], dtype=np.float)
+    def GetPtB(self): return np.array(self.pts[1], dtype=np.float)
+    def GetDistance(self): return self.distance
+    def GetNormal(self): return self.normal
+
+class Link(object):
+    def __init__(self, origin):
+        self.origin = np.array(origin, dtype=np.float)
+
+    def GetTransform(self):
+        trans = np.eye(4)
+        trans[:3, 3] = self.origin
+        return trans
+
+class PlanarArm(object):
+    """
+    Two revolute joints about z at the origin and at (1, 0, 0), with links
+    0 and 1 attached after them.
+    """
+    def GetLinks(self):
+        return [Link([0, 0, 0]), Link([1, 0, 0])]
+
+    def CalculateActiveAngularVelocityJacobian(self, ind):
+        jac = np.zeros((3, 2))
+        jac[2, :ind+1] = 1
+        return jac
+
+    def CalculateActiveJacobian(self, ind, pt):
+        anchors = [np.zeros(3), np.array([1., 0, 0])]
+        jac = np.zeros((3, 2))
+        for j in range(ind+1):
+            jac[:, j] = np.cross([0, 0, 1], pt - anchors[j])
+        return jac
+
+class TestContacts(unittest.TestCase):
+
+    def test_contact_arrays(self):
+        collisions = [Contact(("robot", "can"), ("l0", "c"), ([0, 0, 0], [1, 0, 0]), 0.5, [-1, 0, 0]),
+                      Contact(("can", "robot"), ("c", "l1"), ([1, 1, 0], [2, 1, 0]), 0.2, [0, 1, 0]),
+                      Contact(("table", "can"), ("t", "c"), ([0, 0, 1], [0, 0, 2]), 0.1, [0, 0, 1])]
+        links0, links1, pts0, pts1, dists, normals, signs = contact_arrays(collisions, "robot", "can")
+        self.assertEqual(links0, ["l0", "l1"])
+        self.assertEqual(links1, ["c", "c"])
+        self.assertTrue(np.allclose(pts0, [[0, 0, 0], [2, 1, 0]]))
+        self.assertTrue(np.allclose(pts1, [[1, 0, 0], [1, 1, 0]]))
+        self.assertTrue(np.allclose(dists, [0.5, 0.2]))
+        self.assertTrue(np.allclose(signs, [-1, 1]))
+        empty = contact_arrays([], "robot", "can")
+        self.assertEqual(empty[2].shape, (0, 3))
+
+    def test_point_jacobians(self):
+        robot = PlanarArm()
+        link_inds = np.array([1, 0, 1])
+        pts = np.array([[2., 0.5, 0], [0.5, 0.5, 0], [1., 2., 0]])
+        dirs = np.array([[0., 1, 0], [1, 0, 0], [1, 1, 0]])
+        jac = directional_point_jacobians(robot, link_inds, pts, dirs)
+        for k in range(len(pts)):
+            expected = dirs[k].dot(robot.CalculateActiveJacobian(link_inds[k], pts[k]))
+            self.assertTrue(np.allclose(jac[k], expected))
+
+    def test_rotation_jacobians(self):
+        axes = np.eye(3)
+        arms = np.array([[1., 0, 0], [0, 1, 0]])
+        dirs = np.array([[0., 1, 0], [0, 0, 1]])
+        jac = rotation_jacobians(axes, arms, dirs)
+        for k in range(2):
+            self.assertTrue(np.allclose(jac[k], [np.dot(np.cross(a, arms[k]), dirs[k]) for a in axes]))
+
+    def test_pr2_obstructs(self):
+        ## rows of a real collision predicate against one
+        ## CalculateActiveJacobian per contact
+        from core.util_classes import pr2_predicates
+        from core.util_classes.param_setup import ParamSetup
+        import core.util_classes.common_constants as const
+        robot = ParamSetup.setup_pr2()
+        rPose = ParamSetup.setup_pr2_pose()
+        can = ParamSetup.setup_blue_can(geom = (0.04, 0.25))
+        env = ParamSetup.setup_env()
+        pred = pr2_predicates.PR2Obstructs("test_obstructs", [robot, rPose, rPose, can], ["Robot", "RobotPose", "RobotPose", "Can"], env)
+        n_rows = 0
+        for pose in [[0, 0, 0], [.578, -.127, .838], [.5, -.1, .8], [.3, .2, .7]]:
+            can.pose = np.array([pose]).T
+            x = pred.get_param_vector(0)
+            robot_body = pred._param_to_body[robot]
+            obj_body = pred._param_to_body[can]
+            pred.set_robot_poses(x, robot_body)
+            obj_body.set_pose(x[-6:-3], x[-3:])
+            pred.set_active_dof_inds(robot_body, reset=False)
+            collisions = pred._registry.body_vs_body(robot_body.env_body, obj_body.env_body, const.MAX_CONTACT_DISTANCE)
+            vals, grads = pred._calc_grad_and_val(robot_body, obj_body, contact_arrays(collisions, robot_body.name, obj_body.name))
+            rows = self._reference_rows(pred, robot_body, obj_body, collisions)
+            pred.set_active_dof_inds(robot_body, reset=True)
+            self.assertTrue(np.allclose(vals[:len(rows), 0], [val for _, val, _ in rows]))
+            self.assertTrue(np.allclose(grads[:len(rows)], np.reshape([grad for _, _, grad in rows], (-1, pred.attr_dim+6))))
+            self.assertTrue(np.allclose(grads[len(rows):], 0))
+            n_rows += len(rows)
+        self.assertTrue(n_rows > 0)
+
+    @staticmethod
+    def _reference_rows(pred, robot_body, obj_body, collisions):
+        ## (link index, value, gradient) of each contact, as computed before
+        ## the jacobians were batched
+        col_links = pred.params[pred.ind0].geom.col_links
+        robot = robot_body.env_body
+        obj_pos = OpenRAVEBody.obj_pose_from_transform(obj_body.env_body.GetTransform())
+        Rz, Ry, Rx = OpenRAVEBody._axis_rot_matrices(obj_pos[:3], obj_pos[3:])
+        rot_axises = [[0,0,1], np.dot(Rz, [0,1,0]), np.dot(Rz, np.dot(Ry, [1,0,0]))]
+        rows = []
+        for c in collisions:
+            if c.GetLinkAParentName() == robot_body.name and c.GetLinkBParentName() == obj_body.name:
+                ptRobot, ptObj, linkRobot, sign = c.GetPtA(), c.GetPtB(), c.GetLinkAName(), -1
+            elif c.GetLinkBParentName() == robot_body.name and c.GetLinkAParentName() == obj_body.name:
+                ptRobot, ptObj, linkRobot, sign = c.GetPtB(), c.GetPtA(), c.GetLinkBName(), 1
+            else:
+                continue
+            if linkRobot not in col_links:
+                continue
+            normal = c.GetNormal()
+            link_ind = robot.GetLink(linkRobot).GetIndex()
+            grad = np.zeros(pred.attr_dim+6)
+            grad[:pred.attr_dim] = np.dot(sign*normal, robot.CalculateActiveJacobian(link_ind, ptRobot))
+            col_vec = -sign*normal
+            grad[pred.attr_dim:pred.attr_dim+3] = col_vec
+            grad[pred.attr_dim+3:] = [np.dot(np.cross(axis, ptObj - obj_pos[:3]), col_vec) for axis in rot_axises]
+            rows.append((link_ind, pred.dsafe - c.GetDistance(), grad))
+        return sorted(rows, key=lambda row: row[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from core.util_classes.param_setup import ParamSetup
+from core.util_classes.openrave_body import OpenRAVEBody
+from core.util_classes.env_pool import EnvironmentPool, current_clone, current_env, current_body
+from core.util_classes.env_registry import get_registry
+from core.util_classes import can
+from core.parsing import parse_domain_config, parse_problem_config
+from pma import hl_solver
+import numpy as np
+import main
+
+class TestEnvPool(unittest.TestCase):
+
+    def setUp(self):
+        self.env = ParamSetup.setup_env()
+        self.body = OpenRAVEBody(self.env, "can0", can.GreenCan(0.02, 0.25))
+        self.body.set_pose([1, 0, 0])
+        self.pool = EnvironmentPool(self.env, 2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_acquire(self):
+        self.assertIsNone(current_clone())
+        self.assertIs(current_body(self.body), self.body)
+        with self.pool.acquire() as clone:
+            self.assertIs(current_clone(), clone)
+            self.assertIs(current_env(self.env), clone.env)
+            body = current_body(self.body)
+            self.assertIsNot(body, self.body)
+            self.assertTrue(np.allclose(body.env_body.GetTransform(), self.body.env_body.GetTransform()))
+            ## moving the cloned body leaves the planning environment alone
+            body.set_pose([2, 0, 0])
+            self.assertTrue(np.allclose(self.body.env_body.GetTransform()[:3, 3], [1, 0, 0]))
+            ## bodies added after cloning are spawned in the clone
+            new_body = OpenRAVEBody(self.env, "can1", can.GreenCan(0.02, 0.25))
+            self.assertEqual(current_body(new_body).env_body.GetEnv(), clone.env)
+        self.assertIsNone(current_clone())
+
+    def test_map(self):
+        def env_of(i):
+            return i, current_env(self.env)
+        res = self.pool.map(env_of, range(6))
+        self.assertEqual([i for i, _ in res], range(6))
+        for _, env in res:
+            self.assertTrue(any(env == clone.env for clone in self.pool.clones))
+
+    def test_close(self):
+        clone_envs = [clone.env for clone in self.pool.clones]
+        registries = [get_registry(env) for env in clone_envs]
+        self.pool.map(lambda i: current_body(self.body), range(4))
+        self.pool.close()
+        self.assertEqual(self.pool.clones, [])
+        ## the registries of the clones are dropped with them
+        for env, registry in zip(clone_envs, registries):
+            self.assertIsNot(get_registry(env), registry)
+
+    def test_failed_preds(self):
+        ## the pool finds the same failures, in the same order, as the
+        ## serial tests
+        domain_fname = '../domains/namo_domain/namo.domain'
+        d_c = main.parse_file_to_dict(domain_fname)
+        domain = parse_domain_config.ParseDomainConfig.parse(d_c)
+        hls = hl_solver.FFSolver(d_c)
+        p_c = main.parse_file_to_dict('../domains/namo_domain/namo_probs/putaway.prob')
+        problem = parse_problem_config.ParseProblemConfig.parse(p_c, domain)
+        plan = hls.solve(hls.translate_problem(problem), domain, problem)
+        np.random.seed(0)
+        for param in plan.params.values():
+            for attr in ['pose', 'value']:
+                val = getattr(param, attr, None)
+                if type(val) == np.ndarray:
+                    val[:] = np.random.rand(*val.shape)*4
+        serial = plan.get_failed_preds()
+        self.assertTrue(len(serial) > 0)
+        pool = EnvironmentPool(plan.env, 3)
+        try:
+            plan.invalidate_pred_cache()
+            self.assertEqual(plan.get_failed_preds(env_pool=pool), serial)
+            ## and from the cached results
+            self.assertEqual(plan.get_failed_preds(env_pool=pool), serial)
+            plan.params['pr2'].pose[:, 3:5] += 1.
+            plan.invalidate_pred_cache()
+            serial = plan.get_failed_preds()
+            plan.invalidate_pred_cache()
+            self.assertEqual(plan.get_failed_preds(env_pool=pool), serial)
+        finally:
+            pool.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from core.util_classes.param_setup import ParamSetup
+from core.util_classes.env_registry import get_registry, release_registry
+from core.util_classes import can
+import numpy as np
+import weakref
+import gc
+
+class TestEnvRegistry(unittest.TestCase):
+
+    def test_shared_per_env(self):
+        env = ParamSetup.setup_env()
+        registry = get_registry(env)
+        self.assertIs(get_registry(env), registry)
+        self.assertIs(registry.collision_checker(), registry.collision_checker())
+        self.assertIsNot(get_registry(ParamSetup.setup_env()), registry)
+        release_registry(env)
+        self.assertIsNot(get_registry(env), registry)
+
+    def test_released_with_env(self):
+        env = ParamSetup.setup_env()
+        registry = weakref.ref(get_registry(env))
+        body = get_registry(env).get_body("can0", can.GreenCan(0.02, 0.25))
+        del body
+        env.Destroy()
+        del env
+        gc.collect()
+        self.assertIsNone(registry())
+
+    def test_bodies(self):
+        env = ParamSetup.setup_env()
+        registry = get_registry(env)
+        geom = can.GreenCan(0.02, 0.25)
+        body = registry.get_body("can0", geom)
+        self.assertIs(registry.get_body("can0", geom), body)
+        ## deleted bodies are spawned again
+        body.delete()
+        self.assertIsNot(registry.get_body("can0", geom), body)
+
+    def test_contact_distance(self):
+        env = ParamSetup.setup_env()
+        registry = get_registry(env)
+        geom = can.GreenCan(0.02, 0.25)
+        b0 = registry.get_body("can0", geom)
+        b1 = registry.get_body("can1", geom)
+        b0.set_pose([0, 0, 0])
+        b1.set_pose([0.5, 0, 0])
+        self.assertEqual(len(registry.body_vs_body(b0.env_body, b1.env_body, 0.1)), 0)
+        self.assertTrue(len(registry.body_vs_body(b0.env_body, b1.env_body, np.inf)) > 0)
+        self.assertEqual(len(registry.body_vs_body(b0.env_body, b1.env_body, 0.1)), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import threading
+import numpy as np
+from core.util_classes.kinematics_cache import KinematicsCache, JointSnapshot
+
+class Joint(object):
+    def __init__(self, robot, ind):
+        self.robot, self.ind = robot, ind
+    def GetAxis(self):
+        return np.array([0, 0, 1.])
+    def GetAnchor(self):
+        return np.array([self.robot.dofs[self.ind], 0, 0])
+
+class EnvBody(object):
+    def __init__(self):
+        self.dofs = np.zeros(2)
+        self.set_count = 0
+    def GetDOFValues(self):
+        return self.dofs.copy()
+    def GetTransform(self):
+        return np.eye(4)
+    def GetJointFromDOFIndex(self, ind):
+        return Joint(self, ind)
+
+class RobotBody(object):
+    def __init__(self):
+        self.env_body = EnvBody()
+
+class Pred(object):
+    def set_robot_poses(self, x, robot_body):
+        robot_body.env_body.dofs = np.array(x, dtype=np.float)
+        robot_body.env_body.set_count += 1
+    def get_robot_info(self, robot_body):
+        trans = np.eye(4)
+        trans[:2, 3] = robot_body.env_body.dofs
+        return trans, [0, 1]
+
+class SubPred(Pred):
+    pass
+
+class OtherPred(Pred):
+    def get_robot_info(self, robot_body):
+        trans = np.eye(4)
+        trans[:2, 3] = robot_body.env_body.dofs
+        return trans, [0, 1]
+
+class TestKinematicsCache(unittest.TestCase):
+
+    def test_get_robot_info(self):
+        cache = KinematicsCache()
+        body = RobotBody()
+        x = np.array([1., 2.])
+        trans, joints = cache.get_robot_info(Pred(), x, body, tuple(x))
+        self.assertTrue(np.allclose(trans[:2, 3], x))
+        self.assertTrue(isinstance(joints[0], JointSnapshot))
+        self.assertTrue(np.allclose(joints[1].GetAnchor(), [2, 0, 0]))
+        ## the same configuration is not set again, even from another class
+        ## with the same get_robot_info
+        cache.get_robot_info(SubPred(), x, body, tuple(x))
+        self.assertEqual(body.env_body.set_count, 1)
+        self.assertEqual(cache.hits, 1)
+        ## a get_robot_info of its own gets its own entry, without moving
+        ## the robot that is already in the configuration
+        cache.get_robot_info(OtherPred(), x, body, tuple(x))
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(body.env_body.set_count, 1)
+
+        y = np.array([3., 4.])
+        cache.get_robot_info(Pred(), y, body, tuple(y))
+        self.assertEqual(body.env_body.set_count, 2)
+        ## snapshots do not change with the robot
+        self.assertTrue(np.allclose(joints[1].GetAnchor(), [2, 0, 0]))
+        trans, _ = cache.get_robot_info(Pred(), x, body, tuple(x))
+        self.assertTrue(np.allclose(trans[:2, 3], x))
+        self.assertEqual(body.env_body.set_count, 2)
+        ## hits leave the robot where it was
+        self.assertTrue(np.allclose(body.env_body.dofs, y))
+
+    def test_capacity(self):
+        cache = KinematicsCache(capacity=1)
+        body = RobotBody()
+        for x in [np.array([1., 2.]), np.array([3., 4.]), np.array([1., 2.])]:
+            cache.get_robot_info(Pred(), x, body, tuple(x))
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(body.env_body.set_count, 3)
+
+    def test_counts_across_threads(self):
+        ## each thread has its own robot, as with an EnvironmentPool
+        cache = KinematicsCache()
+        x = np.array([1., 2.])
+        def lookups():
+            body = RobotBody()
+            for _ in range(500):
+                cache.get_robot_info(Pred(), x, body, tuple(x))
+        threads = [threading.Thread(target=lookups) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cache.misses, 4)
+        self.assertEqual(cache.hits + cache.misses, 2000)
+
+if __name__ == "__main__":
+    unittest.main()
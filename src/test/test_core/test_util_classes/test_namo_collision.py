@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from core.util_classes import circle, wall, namo_collision
+from errors_exceptions import OpenRAVEException
+
+class TestNamoCollision(unittest.TestCase):
+
+    def test_circle_circle(self):
+        c0, c1 = circle.GreenCircle(1), circle.RedCircle(0.5)
+        poses0 = np.array([[0., 0.], [0., 0.], [1., 1.]])
+        poses1 = np.array([[3., 4.], [1., 0.], [1., 1.]])
+        dist, normals = namo_collision.distances(c0, poses0, c1, poses1)
+        self.assertEqual(dist.shape, (3, 1))
+        self.assertTrue(np.allclose(dist[:, 0], [3.5, -0.5, -1.5]))
+        self.assertTrue(np.allclose(normals[0, 0], [-0.6, -0.8]))
+        self.assertTrue(np.allclose(normals[1, 0], [-1, 0]))
+
+        vals, jacs = namo_collision.collision_vals_and_jacs(c0, poses0, c1, poses1, 0.1, 1)
+        self.assertEqual(vals.shape, (3, 1, 1))
+        self.assertEqual(jacs.shape, (3, 1, 4))
+        self.assertTrue(np.allclose(vals[:, 0, 0], [-3.4, 0.6, 1.6]))
+        self.assertTrue(np.allclose(jacs[0, 0], [0.6, 0.8, -0.6, -0.8]))
+
+    def test_circle_wall(self):
+        c = circle.RedCircle(0.5)
+        w = wall.Wall('closet')
+        centers, half_extents = w.get_boxes()
+        self.assertEqual(centers.shape, (8, 2))
+        ## the first wall segment runs from (-1, -3) to (-1, 4)
+        self.assertTrue(np.allclose(centers[0], [-1, 0.5]))
+        self.assertTrue(np.allclose(half_extents[0], [1, 4.5]))
+
+        poses = np.array([[1., 0.5], [-0.5, 0.5]])
+        w_poses = np.zeros((2, 2))
+        dist, normals = namo_collision.distances(c, poses, w, w_poses)
+        self.assertEqual(dist.shape, (2, 8))
+        self.assertTrue(np.allclose(dist[:, 0], [0.5, -1]))
+        self.assertTrue(np.allclose(normals[:, 0], [[1, 0], [1, 0]]))
+        ## moving the wall moves its boxes
+        dist, _ = namo_collision.distances(c, poses, w, w_poses + [[-1, 0], [-1, 0]])
+        self.assertTrue(np.allclose(dist[:, 0], [1.5, 0]))
+        ## swapping the bodies flips the normals
+        dist_w, normals_w = namo_collision.distances(w, w_poses, c, poses)
+        self.assertTrue(np.allclose(dist_w, namo_collision.distances(c, poses, w, w_poses)[0]))
+        self.assertTrue(np.allclose(normals_w, -normals))
+        self.assertRaises(OpenRAVEException, wall.wall_boxes, 'unknown')
+
+    def test_gradient(self):
+        c = circle.RedCircle(0.5)
+        w = wall.Wall('closet')
+        x = np.array([[4.3, 1.7, 0.2, -0.1]])
+        vals, jacs = namo_collision.collision_vals_and_jacs(c, x[:, :2], w, x[:, 2:], 0.1, 8)
+        eps = 1e-5
+        for i in range(4):
+            dx = np.zeros((1, 4))
+            dx[0, i] = eps
+            vals_eps, _ = namo_collision.collision_vals_and_jacs(c, x[:, :2] + dx[:, :2], w,
+                                                                 x[:, 2:] + dx[:, 2:], 0.1, 8)
+            self.assertTrue(np.allclose((vals_eps - vals)[0, :, 0]/eps, jacs[0, :, i], atol=1e-4))
+
+if __name__ == "__main__":
+    unittest.main()
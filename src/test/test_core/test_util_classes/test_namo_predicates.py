@@ -477,6 +477,79 @@ class TestNamoPredicates(unittest.TestCase):
         # v.draw([robot, border], 2, 0.5)
         # import ipdb; ipdb.set_trace()
 
+    def _engine_vals(self, pred, engine, p0, p1, pose0, pose1):
+        pred.collision_engine = engine
+        return pred._pair_grad_and_val(p0, p1, np.array(pose0, dtype=np.float),
+                                       np.array(pose1, dtype=np.float))
+
+    def test_analytic_matches_openrave(self):
+        env = Environment()
+        attrs = {"geom": [1], "pose": [(0, 0)], "_type": ["Robot"], "name": ["pr2"]}
+        attr_types = {"geom": circle.GreenCircle, "pose": Vector2d, "_type": str, "name": str}
+        robot = parameter.Object(attrs, attr_types)
+        attrs = {"value": [(0, 0)], "_type": ["RobotPose"], "name": ["r_pose"]}
+        attr_types = {"value": Vector2d, "_type": str, "name": str}
+        robotPose = parameter.Symbol(attrs, attr_types)
+        attrs = {"geom": [0.5], "pose": [(0, 0)], "_type": ["Can"], "name": ["can1"]}
+        attr_types = {"geom": circle.BlueCircle, "pose": Vector2d, "_type": str, "name": str}
+        can = parameter.Object(attrs, attr_types)
+        attrs = {"geom": ["closet"], "pose": [(0, 0)], "_type": ["Obstacle"], "name": ["wall"]}
+        attr_types = {"geom": wall.Wall, "pose": Vector2d, "_type": str, "name": str}
+        border = parameter.Object(attrs, attr_types)
+
+        ## circle/circle, apart, touching and overlapping
+        pred = namo_predicates.Obstructs("obstructs", [robot, robotPose, robotPose, can], ["Robot", "RobotPose", "RobotPose", "Can"], env)
+        for pose1 in [[3., 4.], [1.5, 0.], [0.3, -0.9], [-1., 0.2]]:
+            val, jac = self._engine_vals(pred, 'openrave', robot, can, [0., 0.], pose1)
+            a_val, a_jac = self._engine_vals(pred, 'analytic', robot, can, [0., 0.], pose1)
+            self.assertTrue(np.allclose(val, a_val, atol=1e-3))
+            self.assertTrue(np.allclose(jac, a_jac, atol=1e-3))
+
+        ## circle/wall, every OpenRAVE contact is one of the wall boxes
+        pred = namo_predicates.RCollides("collides", [robot, border], ["Robot", "Obstacle"], env)
+        for pose0 in [[3.5, 0.5], [1.1, 0.], [0.5, 2.], [3.4, 6.5], [7.5, -2.5]]:
+            val, jac = self._engine_vals(pred, 'openrave', robot, border, pose0, [0., 0.])
+            a_val, a_jac = self._engine_vals(pred, 'analytic', robot, border, pose0, [0., 0.])
+            self.assertTrue(np.allclose(np.max(val), np.max(a_val), atol=1e-3))
+            for i in np.nonzero(np.any(jac != 0, axis=1))[0]:
+                match = np.all(np.isclose(a_val, val[i], atol=1e-3), axis=1) & \
+                    np.all(np.isclose(a_jac, jac[i], atol=1e-3), axis=1)
+                self.assertTrue(np.any(match))
+
+    def test_analytic_range(self):
+        env = Environment()
+        attrs = {"geom": [1], "pose": [(0, 0)], "_type": ["Robot"], "name": ["pr2"]}
+        attr_types = {"geom": circle.GreenCircle, "pose": Vector2d, "_type": str, "name": str}
+        robot = parameter.Object(attrs, attr_types)
+        attrs = {"value": [(0, 0)], "_type": ["RobotPose"], "name": ["r_pose"]}
+        attr_types = {"value": Vector2d, "_type": str, "name": str}
+        robotPose = parameter.Symbol(attrs, attr_types)
+        attrs = {"geom": [0.5], "pose": [(0, 0)], "_type": ["Can"], "name": ["can1"]}
+        attr_types = {"geom": circle.BlueCircle, "pose": Vector2d, "_type": str, "name": str}
+        can = parameter.Object(attrs, attr_types)
+        attrs = {"geom": ["closet"], "pose": [(0, 0)], "_type": ["Obstacle"], "name": ["wall"]}
+        attr_types = {"geom": wall.Wall, "pose": Vector2d, "_type": str, "name": str}
+        border = parameter.Object(attrs, attr_types)
+        robot.pose = np.array([[3., 1.5, 0.3, 1.3, 3.4],
+                               [4., 0., -0.9, 0., 6.5]])
+        can.pose = np.zeros((2, 5))
+        border.pose = np.zeros((2, 5))
+
+        ## the range path calls the analytic engine once for all timesteps
+        preds = [namo_predicates.Obstructs("obstructs", [robot, robotPose, robotPose, can], ["Robot", "RobotPose", "RobotPose", "Can"], env),
+                 namo_predicates.RCollides("collides", [robot, border], ["Robot", "Obstacle"], env)]
+        for pred in preds:
+            pred.collision_engine = 'analytic'
+            X = pred.get_param_vector_range(0, 4)
+            for e in [pred.expr.expr, pred.neg_expr.expr]:
+                vals, jacs = e.eval_range(X), e.grad_range(X)
+                for t in range(5):
+                    self.assertTrue(np.allclose(vals[:, t:t+1], e.eval(X[:, t:t+1])))
+                    self.assertTrue(np.allclose(jacs[t], e.grad(X[:, t:t+1])))
+            for negated in [False, True]:
+                self.assertEqual(pred.test_range(0, 4, negated=negated).tolist(),
+                                 [pred.test(t, negated=negated) for t in range(5)])
+
     def test_stationary_w(self):
         attrs = {"geom": ["closet"], "pose": [(0, 0)], "_type": ["Obstacle"], "name": ["wall"]}
         attr_types = {"geom": wall.Wall, "pose": Vector2d, "_type": str, "name": str}
@@ -91,6 +91,71 @@ class TestOpenRAVEBody(unittest.TestCase):
         arr[0,3] = 2
         self.assertTrue(np.allclose(obstacle_body.env_body.GetTransform(), arr))
 
+    def test_robot_template(self):
+        from core.util_classes import openrave_body
+        env0, env1 = Environment(), Environment()
+        pr2_0 = OpenRAVEBody(env0, 'pr2', PR2())
+        template = openrave_body.get_robot_template(PR2())
+        pr2_1 = OpenRAVEBody(env1, 'pr2', PR2())
+        ## the model is parsed once and cloned into both environments
+        self.assertEqual(openrave_body.get_robot_template(PR2()), template)
+        self.assertEqual(pr2_1.env_body.GetKinematicsGeometryHash(), template.GetKinematicsGeometryHash())
+        self.assertEqual([l.GetName() for l in pr2_0.env_body.GetLinks()],
+                         [l.GetName() for l in pr2_1.env_body.GetLinks()])
+        self.assertEqual(env1.GetRobot('pr2'), pr2_1.env_body)
+        ## moving one clone leaves the other alone
+        pr2_0.set_pose([1, 2, 0])
+        self.assertTrue(np.allclose(pr2_1.env_body.GetTransform(), np.eye(4)))
+        env0.Destroy()
+        env1.Destroy()
+
+    def test_robot_bound_radius(self):
+        from core.util_classes import openrave_body, bounding
+        from core.util_classes.robots import Baxter
+        env = Environment()
+        for name, geom in [('pr2', PR2()), ('baxter', Baxter())]:
+            radius = bounding.bounding_radius(geom)
+            self.assertEqual(radius, openrave_body.get_robot_bound_radius(geom))
+            body = OpenRAVEBody(env, name, geom).env_body
+            lower, upper = body.GetDOFLimits()
+            lower, upper = np.maximum(lower, -np.pi), np.minimum(upper, np.pi)
+            ## every link AABB stays in the sphere around the base
+            for _ in range(N):
+                body.SetDOFValues(lower + np.random.rand(len(lower))*(upper - lower))
+                for link in body.GetLinks():
+                    aabb = link.ComputeAABB()
+                    corner = np.abs(aabb.pos()) + aabb.extents()
+                    self.assertTrue(np.linalg.norm(corner) <= radius)
+        env.Destroy()
+
+    def test_dirty_tracking(self):
+        env = Environment()
+        pr2 = OpenRAVEBody(env, 'pr2', PR2())
+        robot = pr2.env_body
+        pr2.set_pose([1, 2, 0])
+        pr2.set_dof({'lArmPose': np.ones(7)*0.1})
+        stamp = robot.GetUpdateStamp()
+        ## setting the same state again does not touch OpenRAVE
+        pr2.set_pose([1, 2, 0])
+        pr2.set_dof({'lArmPose': np.ones(7)*0.1})
+        self.assertEqual(robot.GetUpdateStamp(), stamp)
+        pr2.set_pose([1, 3, 0])
+        self.assertNotEqual(robot.GetUpdateStamp(), stamp)
+        ## bodies moved by someone else are set again
+        robot.SetTransform(np.eye(4))
+        pr2.set_pose([1, 3, 0])
+        self.assertTrue(np.allclose(robot.GetTransform()[:3, 3], [1, 3, 0]))
+        robot.SetDOFValues(np.zeros(robot.GetDOF()))
+        pr2.set_dof({'lArmPose': np.ones(7)*0.1})
+        self.assertTrue(np.allclose(robot.GetDOFValues()[PR2().dof_map['lArmPose']], 0.1))
+        ## active DOFs
+        pr2._set_active_dof_inds()
+        self.assertEqual(robot.GetActiveDOF(), 20)
+        robot.SetActiveDOFs(range(39))
+        pr2._set_active_dof_inds()
+        self.assertEqual(robot.GetActiveDOF(), 20)
+        env.Destroy()
+
     def test_pr2_table(self):
         #TODO fix the pr2 domain problem
         #domain_fname, problem_fname = '../domains/can_domain/pr2.init', '../domains/can_domain/pr2.prob'
@@ -8,6 +8,7 @@ from core.util_classes.matrix import Vector2d
 from core.util_classes import plan_hdf5_serialization
 from errors_exceptions import PredicateException
 import numpy as np
+import h5py, pickle
 
 
 class TestPlanHDF5Serialization(unittest.TestCase):
@@ -82,6 +83,28 @@ class TestPlanHDF5Serialization(unittest.TestCase):
                 self.assertEqual(active_preds[i].name, test_plan_active_preds[i].name)
                 self.assertEqual(active_preds[i].get_type(), test_plan_active_preds[i].get_type())
 
+    def test_packed_serialization(self):
+        self.setup()
+        self.robot.pose = np.arange(20.).reshape((2, 10))
+        self.plan.pack_state()
+        serializer = plan_hdf5_serialization.PlanSerializer()
+        serializer.write_plan_to_hdf5("test/test_plan.hdf5", self.plan)
+        ## trajectories are only stored in the state buffer
+        f = h5py.File("test/test_plan.hdf5", 'r')
+        robot = pickle.loads(f['plan/params/robot/data'].value)
+        f.close()
+        self.assertFalse('pose' in robot.__dict__)
+        self.assertFalse('pose' in robot._free_attrs)
+        self.assertTrue(self.plan.packed_state.is_bound("robot", "pose"))
+
+        deserializer = plan_hdf5_serialization.PlanDeserializer()
+        test_plan = deserializer.read_from_hdf5("test/test_plan.hdf5")
+        state = test_plan.packed_state
+        self.assertEqual(state.layout, self.plan.packed_state.layout)
+        self.assertTrue(np.allclose(state.buf, self.plan.packed_state.buf, equal_nan=True))
+        self.assertTrue(state.is_bound("robot", "pose"))
+        self.assertTrue(np.allclose(test_plan.params["robot"].pose, self.robot.pose))
+
 
 if __name__ == "__main__":
     unittest.main()
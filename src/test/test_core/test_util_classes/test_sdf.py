@@ -0,0 +1,65 @@
+import unittest, os
+import numpy as np
+from core.util_classes import sdf, wall, table, circle, namo_collision
+
+TEST_FILE = os.path.abspath("test_sdf.hdf5")
+
+class TestSDF(unittest.TestCase):
+
+    def tearDown(self):
+        if os.path.isfile(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def test_boxes_signed_distance(self):
+        centers = np.array([[0., 0.], [3., 0.]])
+        half_extents = np.array([[1., 1.], [1., 1.]])
+        points = np.array([[1.5, 0.], [0., 0.], [0.5, 0.], [2., 2.], [5., 0.]])
+        dists = sdf.boxes_signed_distance(points, centers, half_extents)
+        self.assertTrue(np.allclose(dists, [0.5, -1, -0.5, 1, 1]))
+
+    def test_query(self):
+        ## affine fields are interpolated exactly, in 2D and 3D
+        for d in [2, 3]:
+            a = np.arange(1., d+1)
+            field = sdf.SignedDistanceField.from_function(lambda p: p.dot(a) + 1,
+                                                          -np.ones(d), np.ones(d), 0.1)
+            points = np.random.uniform(-1, 1, (20, d))
+            dists, grads = field.query(points)
+            self.assertTrue(np.allclose(dists, points.dot(a) + 1))
+            self.assertTrue(np.allclose(grads, np.tile(a, (20, 1))))
+
+    def test_static_sdf(self):
+        w = wall.Wall('closet')
+        field = sdf.get_static_sdf(w, resolution=0.1, cache_file=TEST_FILE)
+        self.assertTrue(os.path.isfile(TEST_FILE))
+        centers, half_extents = w.get_boxes()
+        points = np.array([[3., 1.], [0.5, 0.5], [-0.5, 0.5]])
+        dists, _ = field.query(points)
+        self.assertTrue(np.allclose(dists, sdf.boxes_signed_distance(points, centers, half_extents), atol=0.05))
+        ## the field is read back from the cache file
+        sdf._sdfs.clear()
+        field2 = sdf.get_static_sdf(w, resolution=0.1, cache_file=TEST_FILE)
+        self.assertTrue(np.allclose(field.values, field2.values))
+
+        t = table.Table([2., 1., 0.1, 0.1, 0.1, 0.6, True])
+        field = sdf.get_static_sdf(t, resolution=0.05, cache_file=None)
+        self.assertEqual(field.dim, 3)
+        dists, grads = field.query(np.array([[0., 0., 0.5]]))
+        self.assertTrue(np.allclose(dists, 0.45, atol=0.01))
+        self.assertTrue(np.allclose(grads, [[0, 0, 1]], atol=0.05))
+
+    def test_namo_sdf(self):
+        c = circle.RedCircle(0.5)
+        w = wall.Wall('closet')
+        poses = np.array([[3., 1.], [4.3, 1.7]])
+        w_poses = np.array([[0., 0.], [0.2, -0.1]])
+        ## computes the field without writing the cache file
+        sdf.get_static_sdf(w, cache_file=None)
+        dist, normals = namo_collision.distances(c, poses, w, w_poses, use_sdf=True)
+        exact, _ = namo_collision.distances(c, poses, w, w_poses)
+        self.assertEqual(dist.shape, (2, 1))
+        self.assertTrue(np.allclose(dist[:, 0], exact.min(axis=1), atol=0.05))
+        self.assertTrue(np.allclose(np.sum(normals**2, axis=2), 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import os
+import threading
+import hashlib
+import h5py
+import numpy as np
+from collections import OrderedDict
+from core.util_classes import sphere_tree
+from core.util_classes.sphere_tree import SphereTree, box_spheres, sphere_contacts
+
+TEST_FILE = os.path.abspath('test_sphere_tree.hdf5')
+
+class Link(object):
+    def __init__(self, trans):
+        self.trans = trans
+
+    def GetTransform(self):
+        return self.trans
+
+class Body(object):
+    def __init__(self, name, offsets):
+        self.name = name
+        self.offsets = offsets
+
+    def GetName(self):
+        return self.name
+
+    def GetLink(self, name):
+        trans = np.eye(4)
+        trans[:3, 3] = self.offsets[name]
+        return Link(trans)
+
+class GeomBody(object):
+    """
+    KinBody with one box geometry per link.
+    """
+    class Geom(object):
+        def __init__(self, half_extents):
+            self.half_extents = half_extents
+        def ComputeAABB(self, trans):
+            return AABB(self.half_extents)
+
+    class Link(object):
+        def __init__(self, name, half_extents):
+            self.name, self.geom = name, GeomBody.Geom(half_extents)
+        def GetName(self):
+            return self.name
+        def GetGeometries(self):
+            return [self.geom]
+
+    def __init__(self, geometry_hash, links):
+        self.geometry_hash = geometry_hash
+        self.links = [GeomBody.Link(n, h) for n, h in links]
+    def GetKinematicsGeometryHash(self):
+        return self.geometry_hash
+    def GetLinks(self):
+        return self.links
+
+class AABB(object):
+    def __init__(self, half_extents):
+        self.half_extents = np.array(half_extents, dtype=np.float)
+    def pos(self):
+        return np.zeros(3)
+    def extents(self):
+        return self.half_extents
+
+class TestSphereTree(unittest.TestCase):
+
+    def tearDown(self):
+        if os.path.isfile(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def test_box_spheres(self):
+        half_extents = np.array([0.5, 0.2, 0.025])
+        centers, radii = box_spheres([1, 0, 0], half_extents)
+        self.assertTrue(len(centers) <= sphere_tree.MAX_SPHERES_PER_AXIS**2)
+        ## every point of the box is in a sphere
+        points = [1, 0, 0] + (np.random.rand(1000, 3)*2 - 1)*half_extents
+        dists = np.linalg.norm(points[:, None, :] - centers[None, :, :], axis=2) - radii
+        self.assertTrue(np.all(dists.min(axis=1) <= 1e-9))
+
+    def test_contacts(self):
+        tree0 = SphereTree(OrderedDict([('l0', box_spheres([0, 0, 0], [0.1, 0.1, 0.1])),
+                                        ('l1', box_spheres([0, 0, 0], [0.3, 0.1, 0.1]))]))
+        tree1 = SphereTree({'obj': (np.zeros((1, 3)), np.array([0.1]))})
+        body0 = Body('robot', {'l0': [0, 0, 0], 'l1': [5, 0, 0]})
+        body1 = Body('can', {'obj': [0.5, 0, 0]})
+        links0, links1, pts0, pts1, dists, normals, signs = sphere_contacts(tree0, body0, tree1, body1, 0.5)
+        ## l1 is out of range
+        self.assertEqual(links0, ['l0'])
+        self.assertEqual(links1, ['can'])
+        self.assertTrue(np.allclose(normals, [[-1, 0, 0]]))
+        self.assertTrue(np.allclose(signs, [-1]))
+        ## spheres over approximate the bodies
+        self.assertTrue(dists[0] <= 0.3)
+        self.assertTrue(np.allclose(pts1, [[0.4, 0, 0]]))
+        self.assertTrue(np.allclose(np.linalg.norm(pts0 - pts1, axis=1), dists))
+        self.assertEqual(sphere_contacts(tree0, body0, tree1, body1, 0.1)[0], [])
+
+    def test_hdf5(self):
+        tree = SphereTree(OrderedDict([('l0', box_spheres([0, 0, 0], [0.1, 0.2, 0.1]))]))
+        f = h5py.File(TEST_FILE, 'w')
+        tree.write_to_hdf5(f.create_group('tree'))
+        f.close()
+        f = h5py.File(TEST_FILE, 'r')
+        tree2 = SphereTree.read_from_hdf5(f['tree'])
+        f.close()
+        self.assertEqual(tree2.links.keys(), ['l0'])
+        self.assertTrue(np.allclose(tree2.links['l0'][0], tree.links['l0'][0]))
+        self.assertTrue(np.allclose(tree2.roots['l0'][1], tree.roots['l0'][1]))
+
+    def test_get_sphere_tree(self):
+        body = GeomBody('hash0', [('l0', [0.1, 0.1, 0.1]), ('l1', [0.2, 0.1, 0.1])])
+        tree = sphere_tree.get_sphere_tree(body, ['l1', 'l0'], cache_file=TEST_FILE)
+        self.assertIs(sphere_tree.get_sphere_tree(body, ['l0', 'l1'], cache_file=TEST_FILE), tree)
+        ## the file key only depends on the geometry and the link names
+        f = h5py.File(TEST_FILE, 'r')
+        self.assertEqual(list(f.keys()), [sphere_tree._tree_key(body, ['l0', 'l1'])])
+        f.close()
+        self.assertEqual(sphere_tree._tree_key(body, ['l1', 'l0']), 'hash0_' + hashlib.md5('l0,l1').hexdigest())
+        sphere_tree._trees.clear()
+        tree2 = sphere_tree.get_sphere_tree(body, ['l0', 'l1'], cache_file=TEST_FILE)
+        self.assertEqual(tree2.links.keys(), tree.links.keys())
+        self.assertTrue(np.allclose(tree2.links['l1'][0], tree.links['l1'][0]))
+        self.assertEqual(sphere_tree.get_sphere_tree(body, ['l0'], cache_file=None).links.keys(), ['l0'])
+
+    def test_fidelity(self):
+        self.assertEqual(sphere_tree.get_collision_fidelity(), sphere_tree.MESH)
+        with sphere_tree.collision_fidelity(sphere_tree.SPHERES):
+            self.assertEqual(sphere_tree.get_collision_fidelity(), sphere_tree.SPHERES)
+            ## other threads keep their own fidelity
+            res = []
+            thread = threading.Thread(target=lambda: res.append(sphere_tree.get_collision_fidelity()))
+            thread.start()
+            thread.join()
+            self.assertEqual(res, [sphere_tree.MESH])
+        self.assertEqual(sphere_tree.get_collision_fidelity(), sphere_tree.MESH)
+
+if __name__ == "__main__":
+    unittest.main()
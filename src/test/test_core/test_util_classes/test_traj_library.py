@@ -0,0 +1,120 @@
+import unittest, os
+import numpy as np
+from pma import hl_solver
+from core.parsing import parse_domain_config, parse_problem_config
+from core.util_classes.traj_library import TrajLibrary
+import main
+
+LIB_FILE = "test_traj_library.hdf5"
+
+class TestTrajLibrary(unittest.TestCase):
+    def setUp(self):
+        domain_fname = '../domains/namo_domain/namo.domain'
+        d_c = main.parse_file_to_dict(domain_fname)
+        domain = parse_domain_config.ParseDomainConfig.parse(d_c)
+        hls = hl_solver.FFSolver(d_c)
+        def get_plan(p_fname):
+            p_c = main.parse_file_to_dict(p_fname)
+            problem = parse_problem_config.ParseProblemConfig.parse(p_c, domain)
+            abs_problem = hls.translate_problem(problem)
+            return hls.solve(abs_problem, domain, problem)
+        self.get_plan = get_plan
+        if os.path.isfile(LIB_FILE):
+            os.remove(LIB_FILE)
+
+    def tearDown(self):
+        if os.path.isfile(LIB_FILE):
+            os.remove(LIB_FILE)
+
+    def _fill_plan(self, plan):
+        robot = plan.params['pr2']
+        robot.pose = np.linspace(0, 1, plan.horizon*2).reshape((2, plan.horizon))
+        for param in plan.params.itervalues():
+            for attr in param._free_attrs:
+                val = getattr(param, attr)
+                val[np.isnan(val)] = 0
+
+    def test_add_and_lookup(self):
+        plan = self.get_plan('../domains/namo_domain/namo_probs/move_no_obs.prob')
+        lib = TrajLibrary("test_traj_library")
+        self.assertEqual(lib.store_file, LIB_FILE)
+        self.assertEqual(len(lib), 0)
+        move = plan.actions[0]
+        self.assertTrue(lib.lookup(move) is None)
+        self._fill_plan(plan)
+        self.assertTrue(lib.add_plan(plan, save=False))
+        self.assertEqual(len(lib), 1)
+        ## adding the same action again replaces the entry
+        lib.add_plan(plan, save=False)
+        self.assertEqual(len(lib), 1)
+        entry = lib.lookup(move)
+        self.assertEqual(entry.name, move.name)
+        t0, t1 = move.active_timesteps
+        self.assertTrue(np.allclose(entry.trajs[0]['pose'], plan.params['pr2'].pose[:, t0:t1+1]))
+        lib.discard_pending()
+        lib.save()
+        self.assertFalse(os.path.isfile(LIB_FILE))
+
+    def test_save_and_load(self):
+        plan = self.get_plan('../domains/namo_domain/namo_probs/move_no_obs.prob')
+        self._fill_plan(plan)
+        lib = TrajLibrary(LIB_FILE)
+        lib.add_plan(plan)
+        self.assertTrue(os.path.isfile(LIB_FILE))
+        lib2 = TrajLibrary(LIB_FILE)
+        self.assertEqual(len(lib2), 1)
+        entry, entry2 = lib.lookup(plan.actions[0]), lib2.lookup(plan.actions[0])
+        self.assertTrue(np.allclose(entry.features(), entry2.features()))
+        for attr, traj in entry.trajs[0].iteritems():
+            self.assertTrue(np.allclose(traj, entry2.trajs[0][attr]))
+
+    def test_incremental_save(self):
+        plan = self.get_plan('../domains/namo_domain/namo_probs/move_no_obs.prob')
+        self._fill_plan(plan)
+        lib = TrajLibrary(LIB_FILE, save_every=2)
+        lib.add_plan(plan, save=False)
+        self.assertFalse(os.path.isfile(LIB_FILE))
+        ## a second entry reaches save_every
+        plan.params['pr2'].pose += 1.
+        lib.add_plan(plan, save=False)
+        self.assertEqual(len(TrajLibrary(LIB_FILE)), 2)
+        ## saving a replaced entry overwrites its group
+        plan.params['pr2'].pose[:, 1:-1] += .01
+        lib.add_plan(plan)
+        lib2 = TrajLibrary(LIB_FILE)
+        self.assertEqual(len(lib2), 2)
+        t0, t1 = plan.actions[0].active_timesteps
+        self.assertTrue(np.allclose(lib2.lookup(plan.actions[0]).trajs[0]['pose'],
+                                    plan.params['pr2'].pose[:, t0:t1+1]))
+        ## pending entries are written at the end of a with block
+        plan.params['pr2'].pose += 1.
+        with TrajLibrary(LIB_FILE) as lib3:
+            lib3.add_plan(plan, save=False)
+            self.assertEqual(len(TrajLibrary(LIB_FILE)), 2)
+        self.assertEqual(len(TrajLibrary(LIB_FILE)), 3)
+
+    def test_warm_start(self):
+        solved = self.get_plan('../domains/namo_domain/namo_probs/move_no_obs.prob')
+        self._fill_plan(solved)
+        lib = TrajLibrary(LIB_FILE)
+        lib.add_plan(solved, save=False)
+
+        plan = self.get_plan('../domains/namo_domain/namo_probs/move_no_obs.prob')
+        robot = plan.params['pr2']
+        free = robot._free_attrs['pose'].astype(bool)
+        fixed_val = robot.pose[~free].copy()
+        self.assertTrue(np.any(np.isnan(robot.pose)))
+        self.assertTrue(lib.warm_start(plan))
+        self.assertFalse(np.any(np.isnan(robot.pose)))
+        ## only free values are overwritten
+        self.assertTrue(np.allclose(robot.pose[~free], fixed_val))
+        self.assertTrue(np.allclose(robot.pose[free], solved.params['pr2'].pose[free]))
+        lib.discard_pending()
+
+    def test_resize(self):
+        traj = np.array([[0., 1., 2.]])
+        self.assertTrue(np.allclose(TrajLibrary._resize(traj, 5), [[0., .5, 1., 1.5, 2.]]))
+        self.assertTrue(TrajLibrary._resize(traj, 3) is traj)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,6 +36,7 @@ class TestLLSolver(unittest.TestCase):
         self.move_grasp = get_plan('../domains/namo_domain/namo_probs/move_grasp.prob')
         self.move_grasp_moveholding = get_plan('../domains/namo_domain/namo_probs/moveholding.prob')
         self.place = get_plan('../domains/namo_domain/namo_probs/place.prob')
+        self.get_plan = get_plan
         self.putaway = get_plan('../domains/namo_domain/namo_probs/putaway.prob')
         self.putaway3 = get_plan('../domains/namo_domain/namo_probs/putaway3.prob')
         self.putaway2 = get_plan('../domains/namo_domain/namo_probs/putaway2.prob', ['0: MOVETO PR2 ROBOT_INIT_POSE PDP_TARGET2',
@@ -188,6 +189,115 @@ class TestLLSolver(unittest.TestCase):
         _test_plan(self, self.putaway2, plot=False, animate=False)
         print "Early Converge"
         _test_plan(self, self.putaway2, plot=False, early_converge=True, animate=False)
+
+    def test_stack_expr(self):
+        A, b = np.random.rand(3, 4), np.random.rand(3, 1)
+        aff = ll_solver.stack_expr(expr.LEqExpr(expr.AffExpr(A, b), np.zeros((3, 1))), 5)
+        self.assertTrue(isinstance(aff, expr.LEqExpr) and isinstance(aff.expr, expr.AffExpr))
+        x = np.random.rand(20, 1)
+        self.assertTrue(np.allclose(aff.expr.eval(x), np.vstack([A.dot(x[4*i:4*i+4]) + b for i in range(5)])))
+        self.assertEqual(aff.val.shape, (15, 1))
+        f = lambda x: np.array([[np.sin(x[0, 0])*x[1, 0]]])
+        grad = lambda x: np.array([[np.cos(x[0, 0])*x[1, 0], np.sin(x[0, 0])]])
+        nonlin = ll_solver.stack_expr(expr.EqExpr(expr.Expr(f, grad), np.zeros((1, 1))), 3)
+        x = np.random.rand(6, 1)
+        self.assertTrue(np.allclose(nonlin.expr.eval(x), np.vstack([f(x[2*i:2*i+2]) for i in range(3)])))
+        self.assertTrue(np.allclose(nonlin.expr.grad(x), ll_solver.block_diag([grad(x[2*i:2*i+2]) for i in range(3)])))
+        ## the stacked expression is memoized at the stacked point
+        calls = []
+        counted = lambda x: calls.append(1) or f(x)
+        nonlin = ll_solver.stack_expr(expr.EqExpr(expr.Expr(counted, grad), np.zeros((1, 1))), 3)
+        nonlin.expr.eval(x)
+        nonlin.expr.grad(x)
+        nonlin.expr.eval(x)
+        self.assertEqual(len(calls), 3)
+        ## expressions with a range evaluation get all the inputs at once
+        e = expr.Expr(counted, grad)
+        e.eval_range = lambda X: calls.append(X.shape) or np.sin(X[:1])*X[1:]
+        e.grad_range = lambda X: np.array([grad(X[:, i:i+1]) for i in range(X.shape[1])])
+        nonlin = ll_solver.stack_expr(expr.EqExpr(e, np.zeros((1, 1))), 3)
+        del calls[:]
+        self.assertTrue(np.allclose(nonlin.expr.eval(x), np.vstack([f(x[2*i:2*i+2]) for i in range(3)])))
+        self.assertTrue(np.allclose(nonlin.expr.grad(x), ll_solver.block_diag([grad(x[2*i:2*i+2]) for i in range(3)])))
+        self.assertEqual(calls, [(2, 3)])
+
+    def test_stack_cnts(self):
+        _test_plan(self, self.putaway, stack_cnts=True)
+
+    def test_compile_affine(self):
+        _test_plan(self, self.putaway, compile_affine=True)
+        ## same solution as with the affine constraints added one by one
+        plan = self.get_plan('../domains/namo_domain/namo_probs/putaway.prob')
+        _test_plan(self, plan)
+        for name, param in plan.params.items():
+            for attr in ['pose', 'value']:
+                if hasattr(param, attr) and type(getattr(param, attr)) == np.ndarray:
+                    self.assertTrue(np.allclose(getattr(self.putaway.params[name], attr), getattr(param, attr), atol=1e-3))
+        self.assertEqual([(pred.name, t) for _, pred, t in self.putaway.get_failed_preds()],
+                         [(pred.name, t) for _, pred, t in plan.get_failed_preds()])
+
+    def test_compiled_aff_rows(self):
+        class Prob(object):
+            def __init__(self):
+                self.cnts = []
+            def add_cnt_expr(self, bexpr, groups):
+                self.cnts.append((bexpr, groups))
+        class Param(object):
+            def __init__(self, name):
+                self.name = name
+        class Pred(object):
+            def __init__(self, name):
+                self.params = [Param(name)]
+        ## the blocks only hold the variables, so any object stands in for
+        ## the gurobi variables
+        names = ['v0', 'v1', 'v2']
+        ## each predicate reads 3 values per timestep, some of them from the
+        ## same variable, within a timestep and across timesteps
+        x = np.array([names[i] for i in [0, 1, 0, 1, 2, 2]], dtype=object)
+        v = np.array([0., 1., 0., 1., 2., 2.])
+        select = np.zeros((6, 3))
+        select[range(6), [0, 1, 0, 1, 2, 2]] = 1
+        namo_solver = ll_solver.NAMOSolver(early_converge=True, compile_affine=True)
+        namo_solver._prob = Prob()
+        namo_solver._gather_pred_range = lambda pred, ts: (x[:3*len(ts)], v[:3*len(ts)])
+        A0, b0, val0 = np.random.rand(2, 3), np.random.rand(2, 1), np.random.rand(2, 1)
+        A1, b1, val1 = np.random.rand(1, 3), np.random.rand(1, 1), np.random.rand(1, 1)
+        namo_solver._aff_cnts = [(expr.LEqExpr(expr.AffExpr(A0, b0), val0), Pred('pr2'), [0, 1]),
+                                 (expr.EqExpr(expr.AffExpr(A1, b1), val1), Pred('can0'), [3])]
+        namo_solver._add_compiled_aff_cnts()
+        self.assertEqual(namo_solver._aff_cnts, [])
+        ## one penalized block per constraint groups and type
+        expected = [(['all', 'pr2'], expr.LEqExpr, np.kron(np.eye(2), A0).dot(select), np.tile(val0 - b0, (2, 1))),
+                    (['all', 'can0'], expr.EqExpr, A1.dot(select[:3]), val1 - b1)]
+        self.assertEqual(len(namo_solver._prob.cnts), 2)
+        for (bexpr, groups), (cnt_groups, cnt_type, A, rhs) in zip(namo_solver._prob.cnts, expected):
+            self.assertEqual(groups, cnt_groups)
+            self.assertTrue(type(bexpr.expr) is cnt_type)
+            block_vars = bexpr.var.get_grb_vars()[:, 0].tolist()
+            coeffs = np.zeros(A.shape)
+            coeffs[:, [names.index(n) for n in block_vars]] = bexpr.expr.expr.A
+            self.assertTrue(np.allclose(coeffs, A))
+            self.assertTrue(np.allclose(bexpr.expr.expr.b, 0))
+            self.assertTrue(np.allclose(bexpr.expr.val, rhs))
+            self.assertTrue(np.allclose(bexpr.var.get_value()[:, 0], [names.index(n) for n in block_vars]))
+
+    def test_lazy_collisions(self):
+        from core.util_classes import namo_predicates
+        plan = self.putaway
+        namo_solver = ll_solver.NAMOSolver(lazy_collisions=True)
+        ## number of constraints kept aside before each check
+        n_lazy = []
+        add_lazy_cnts = namo_solver._add_lazy_cnts
+        def record_lazy_cnts():
+            n_lazy.append(len(namo_solver._lazy_cnts))
+            return add_lazy_cnts()
+        namo_solver._add_lazy_cnts = record_lazy_cnts
+        namo_solver.solve(plan)
+        self.assertTrue(len(n_lazy) > 0 and n_lazy[0] > 0)
+        ## the constraints left aside are still satisfied
+        for negated, pred, t in plan.get_failed_preds():
+            self.assertFalse(isinstance(pred, namo_predicates.CollisionPredicate))
+
     def test_backtrack_move(self):
         _test_plan(self, self.move_no_obs, method='Backtrack')
 
@@ -204,7 +314,7 @@ class TestLLSolver(unittest.TestCase):
         _test_plan(self, self.putaway2, method='Backtrack', plot=False)
 
 def _test_plan(test_obj, plan, method='SQP', plot=False, animate=False, verbose=False,
-               early_converge=False):
+               early_converge=False, lazy_collisions=False, stack_cnts=False, compile_affine=False):
     print "testing plan: {}".format(plan.actions)
     if not plot:
         callback = None
@@ -226,7 +336,8 @@ def _test_plan(test_obj, plan, method='SQP', plot=False, animate=False, verbose=
                 viewer.clear()
                 viewer.draw_plan_range(plan, a.active_timesteps)
                 time.sleep(0.3)
-    namo_solver = ll_solver.NAMOSolver(early_converge=early_converge)
+    namo_solver = ll_solver.NAMOSolver(early_converge=early_converge, lazy_collisions=lazy_collisions,
+                                       stack_cnts=stack_cnts, compile_affine=compile_affine)
     start = time.time()
     if method == 'SQP':
         namo_solver.solve(plan, callback=callback, verbose=verbose)
@@ -0,0 +1,90 @@
+import unittest
+from pma import hl_solver
+from pma import ll_solver
+from pma.plan_evaluator import PlanEvaluator
+from core.parsing import parse_domain_config
+from core.parsing import parse_problem_config
+import numpy as np
+import main
+
+class TestPlanEvaluator(unittest.TestCase):
+    def setUp(self):
+        domain_fname = '../domains/namo_domain/namo.domain'
+        d_c = main.parse_file_to_dict(domain_fname)
+        domain = parse_domain_config.ParseDomainConfig.parse(d_c)
+        hls = hl_solver.FFSolver(d_c)
+
+        def get_plan(p_fname):
+            p_c = main.parse_file_to_dict(p_fname)
+            problem = parse_problem_config.ParseProblemConfig.parse(p_c, domain)
+            abs_problem = hls.translate_problem(problem)
+            return hls.solve(abs_problem, domain, problem)
+
+        self.move_no_obs = get_plan('../domains/namo_domain/namo_probs/move_no_obs.prob')
+        self.move_grasp = get_plan('../domains/namo_domain/namo_probs/move_grasp.prob')
+        self.putaway = get_plan('../domains/namo_domain/namo_probs/putaway.prob')
+
+    def test_traj_cost(self):
+        plan = self.move_no_obs
+        robot = plan.params['pr2']
+        robot.pose = np.zeros((2, plan.horizon))
+        robot.pose[0, :] = np.arange(plan.horizon)
+        evaluator = PlanEvaluator(traj_types=('Robot',))
+        self.assertAlmostEqual(evaluator.traj_cost(plan), 0.5*(plan.horizon-1))
+        self.assertAlmostEqual(evaluator.traj_cost(plan, active_ts=(0, 2)), 1.)
+        self.assertAlmostEqual(PlanEvaluator(traj_coeff=2., traj_types=('Robot',)).traj_cost(plan, active_ts=(0, 2)), 2.)
+
+    def test_violations(self):
+        plan = self.move_no_obs
+        ll_solver.NAMOSolver().solve(plan, n_resamples=0)
+        plan.params['pr2'].pose[:, 5:10] += 1.
+        evaluator = PlanEvaluator()
+        for negated, pred, t, violation in evaluator.violations(plan):
+            self.assertTrue(np.all(violation >= 0))
+            if np.any(violation > pred.tol):
+                self.assertFalse(pred.test(t, negated=negated))
+        self.assertAlmostEqual(evaluator.total_violation(plan),
+                               sum(np.sum(v) for _, _, _, v in evaluator.violations(plan)))
+
+    def test_get_value(self):
+        ## matches the penalized objective of the solver, on the solved
+        ## plans and on perturbed ones
+        evaluator = PlanEvaluator()
+        for plan in [self.move_no_obs, self.move_grasp, self.putaway]:
+            solver = ll_solver.NAMOSolver()
+            solver.solve(plan, n_resamples=0)
+            self.assertAlmostEqual(evaluator.get_value(plan), solver.get_value(plan), places=4)
+            plan.params['pr2'].pose[:, 5:10] += 1.
+            self.assertAlmostEqual(evaluator.get_value(plan), solver.get_value(plan), places=4)
+            self.assertAlmostEqual(evaluator.get_value(plan, 1e2), solver.get_value(plan, 1e2), places=3)
+
+class TestTrajCost(unittest.TestCase):
+    ## no OpenRAVE plans and no Gurobi model, only parameter arrays
+
+    def test_matches_trajopt_obj(self):
+        class Param(object):
+            def __init__(self, name, _type, pose):
+                self.name, self._type, self.pose = name, _type, pose
+        class LLParam(object):
+            def __init__(self, param, start, end):
+                ## stands in for the gurobi variables of the pose
+                self.pose = np.array([['{}-{}-{}'.format(param.name, i, t) for t in range(start, end+1)]
+                                      for i in range(2)], dtype=object)
+        class Plan(object):
+            horizon = 5
+        plan = Plan()
+        plan.params = {'pr2': Param('pr2', 'Robot', np.random.rand(2, 5)),
+                       'can0': Param('can0', 'Can', np.random.rand(2, 5)),
+                       'target0': Param('target0', 'Target', np.random.rand(2, 5))}
+        solver = ll_solver.NAMOSolver()
+        for active_ts in [(0, 4), (1, 3)]:
+            solver._param_to_ll = dict((p, LLParam(p, active_ts[0], active_ts[1]))
+                                       for p in plan.params.values())
+            obj = 0.
+            for bexpr in solver._get_trajopt_obj(plan, active_ts):
+                x = bexpr.var.get_value()
+                obj += 0.5*x.T.dot(bexpr.expr.Q).dot(x)[0, 0]
+            self.assertAlmostEqual(PlanEvaluator().traj_cost(plan, active_ts), obj)
+
+if __name__ == "__main__":
+    unittest.main()